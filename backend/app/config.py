@@ -1,10 +1,65 @@
 import os
+from pathlib import Path
 from dotenv import load_dotenv
 
 load_dotenv()
 
+# backend ディレクトリ。相対パスの設定はここを基準にする（起動したディレクトリによらず同じ場所を指す）
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+
+def resolve_path(path: str) -> str:
+    """相対パスを backend ディレクトリ基準の絶対パスにする（絶対パスはそのまま）"""
+    return str(BACKEND_DIR / path) if not os.path.isabs(path) else path
+
+
 class Settings:
     YOUTUBE_API_KEY: str = os.getenv("YOUTUBE_API_KEY", "")
     DATABASE_URL: str = os.getenv("DATABASE_URL", "sqlite:///./youtuber_predictor.db")
 
+    # チャンネル統計の保存方式
+    # append: 収集のたびに行を追加 / dedup: 値が変わったときだけ行を追加
+    STATS_STORAGE_MODE: str = os.getenv("STATS_STORAGE_MODE", "append")
+
+    # channel_stats の保持期間（日）。これより古いデータは日次→週次→月次に集約する
+    # 特徴量抽出が90日前まで参照するため、生データは90日以上残すこと
+    STATS_RAW_RETENTION_DAYS: int = int(os.getenv("STATS_RAW_RETENTION_DAYS", "120"))
+    STATS_DAILY_RETENTION_DAYS: int = int(os.getenv("STATS_DAILY_RETENTION_DAYS", "365"))
+    STATS_WEEKLY_RETENTION_DAYS: int = int(os.getenv("STATS_WEEKLY_RETENTION_DAYS", "1095"))
+
+    # 分析用 Parquet エクスポート先
+    EXPORT_DIR: str = resolve_path(os.getenv("EXPORT_DIR", "./data/export"))
+
+    # 予測モデルの保存先（バージョンごとのディレクトリと、チャンピオン・チャレンジャーを記録した registry.json）
+    # registry.json が更新されると実行中のプロセスでも次の予測から新しいモデルを使う
+    MODEL_REGISTRY_DIR: str = resolve_path(os.getenv("MODEL_REGISTRY_DIR", "./ml/models"))
+
+    # LightGBM のデータセット（ビン分割済みのバイナリ）のキャッシュ
+    # 同じ学習データでの学習・CVはビン分割をやり直さずに読み込む。古い順に期間・合計サイズで削除する
+    DATASET_CACHE_DIR: str = resolve_path(os.getenv("DATASET_CACHE_DIR", "./data/cache/datasets"))
+    DATASET_CACHE_MAX_AGE_DAYS: int = int(os.getenv("DATASET_CACHE_MAX_AGE_DAYS", "14"))
+    DATASET_CACHE_MAX_MB: int = int(os.getenv("DATASET_CACHE_MAX_MB", "2048"))
+
+    # 特徴量行列のスナップショット（データ収集の後に公開し、メモリマップで読む）と残すバージョン数
+    FEATURE_SNAPSHOT_DIR: str = resolve_path(os.getenv("FEATURE_SNAPSHOT_DIR", "./data/snapshots/features"))
+    FEATURE_SNAPSHOT_KEEP: int = int(os.getenv("FEATURE_SNAPSHOT_KEEP", "7"))
+
+    # 登録者数の推移が似ているチャンネルの索引（データ収集の後に作り直し、API プロセスはメモリに読み込んで検索する）
+    SIMILARITY_INDEX_PATH: str = resolve_path(os.getenv("SIMILARITY_INDEX_PATH", "./data/similarity/index.npz"))
+
+    # 予測期間（日、カンマ区切り）。モデルは期間ごとに学習し、予測は1回の特徴量計算で全期間をまとめて行う
+    PREDICTION_HORIZONS: list = [int(h) for h in os.getenv("PREDICTION_HORIZONS", "30,90,180").split(",")]
+
+    # 入力が変わっていなくても、最後の予測からこの日数がたったチャンネルは予測し直す
+    PREDICTION_MAX_AGE_DAYS: int = int(os.getenv("PREDICTION_MAX_AGE_DAYS", "7"))
+
+    # チャンネル追加・データ収集の直後の予測（API プロセス内でまとめて実行）
+    # 最初の依頼からこのミリ秒だけ待つか、この件数たまったら1回の予測でまとめて保存する
+    PREDICTION_BATCH_WAIT_MS: int = int(os.getenv("PREDICTION_BATCH_WAIT_MS", "20"))
+    PREDICTION_BATCH_MAX_SIZE: int = int(os.getenv("PREDICTION_BATCH_MAX_SIZE", "256"))
+
+    # スケジューラ
+    SCHEDULER_STATE_PATH: str = resolve_path(os.getenv("SCHEDULER_STATE_PATH", "./logs/scheduler_state.json"))
+    SCHEDULER_LOCK_PATH: str = resolve_path(os.getenv("SCHEDULER_LOCK_PATH", "./logs/scheduler.lock"))
+
 settings = Settings()
@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine
+from sqlalchemy import UniqueConstraint, create_engine, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from app.config import settings
@@ -16,3 +16,57 @@ def get_db():
         yield db
     finally:
         db.close()
+
+def _changed_unique_constraints(inspector, table) -> bool:
+    """モデルの名前付き一意制約のうち、既存テーブルで列が異なるものがあるか"""
+    existing = {c["name"]: set(c["column_names"]) for c in inspector.get_unique_constraints(table.name)}
+    for constraint in table.constraints:
+        if isinstance(constraint, UniqueConstraint) and constraint.name in existing:
+            if existing[constraint.name] != {column.name for column in constraint.columns}:
+                return True
+    return False
+
+
+def _rebuild_table(conn, table):
+    """
+    テーブルを今の定義で作り直して行をコピー
+
+    SQLite は既存テーブルの制約を変更できないため、一意制約の列が変わったテーブルに使う。
+    """
+    old_name = f"_old_{table.name}"
+    conn.execute(text(f"ALTER TABLE {table.name} RENAME TO {old_name}"))
+    for index in table.indexes:
+        conn.execute(text(f"DROP INDEX IF EXISTS {index.name}"))
+    table.create(bind=conn)
+    columns = ", ".join(column.name for column in table.columns)
+    conn.execute(text(f"INSERT INTO {table.name} ({columns}) SELECT {columns} FROM {old_name}"))
+    conn.execute(text(f"DROP TABLE {old_name}"))
+    print(f"{table.name} を今の一意制約で作り直しました")
+
+
+def init_db():
+    """
+    テーブルを作成し、既存DBに不足しているカラム・インデックスを追加
+
+    create_all は既存テーブルを変更しないため、後から追加した
+    NULL許容カラムとインデックスはここで補う。名前付きの一意制約の列が変わったテーブルは作り直す。
+    """
+    from app import models  # noqa: F401  モデルをメタデータに登録
+
+    Base.metadata.create_all(bind=engine)
+
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for table in Base.metadata.sorted_tables:
+            existing = {c["name"] for c in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name in existing:
+                    continue
+                column_type = column.type.compile(dialect=engine.dialect)
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+
+            if _changed_unique_constraints(inspector, table):
+                _rebuild_table(conn, table)
+
+            for index in table.indexes:
+                index.create(bind=conn, checkfirst=True)
@@ -1,10 +1,11 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app.database import engine, Base
+from app.database import init_db
 from app.routers import channels, news, ranking, search, admin
+from app.services.prediction_batcher import prediction_batcher
 
 # Create database tables
-Base.metadata.create_all(bind=engine)
+init_db()
 
 app = FastAPI(
     title="YouTuber Growth Predictor API",
@@ -29,6 +30,12 @@ app.include_router(search.router, prefix="/api/search", tags=["search"])
 app.include_router(admin.router, prefix="/api/admin", tags=["admin"])
 
 
+@app.on_event("shutdown")
+def stop_prediction_batcher():
+    """依頼済みの予測を保存してから終了する"""
+    prediction_batcher.stop()
+
+
 @app.get("/")
 async def root():
     return {"message": "YouTuber Growth Predictor API", "version": "1.0.0"}
@@ -1,5 +1,5 @@
-from sqlalchemy import Column, Integer, String, Float, DateTime, ForeignKey, Text
-from sqlalchemy.orm import relationship
+from sqlalchemy import Column, Integer, String, Float, Date, DateTime, ForeignKey, Text, Index, UniqueConstraint, or_
+from sqlalchemy.orm import relationship, declared_attr
 from datetime import datetime
 from app.database import Base
 
@@ -14,6 +14,8 @@ class Channel(Base):
     thumbnail_url = Column(String(500), nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    features_changed_at = Column(DateTime, nullable=True)  # 特徴量の入力（統計・ニュース・トレンド）が最後に変わった時刻
+    last_predicted_at = Column(DateTime, nullable=True)  # 最後に予測した時刻（その時点までの入力で予測済み）
 
     # Relationships
     stats = relationship("ChannelStats", back_populates="channel", order_by="desc(ChannelStats.recorded_at)")
@@ -29,19 +31,70 @@ class ChannelStats(Base):
     subscriber_count = Column(Integer, nullable=False)
     view_count = Column(Integer, nullable=False)
     video_count = Column(Integer, nullable=False)
-    recorded_at = Column(DateTime, default=datetime.utcnow)
+    recorded_at = Column(DateTime, default=datetime.utcnow)  # この値が有効になった時刻
+    last_confirmed_at = Column(DateTime, nullable=True)  # 同じ値を最後に観測した時刻
 
     # Relationships
     channel = relationship("Channel", back_populates="stats")
 
+    __table_args__ = (
+        Index("ix_channel_stats_channel_recorded", "channel_id", "recorded_at"),
+    )
+
+
+class StatsRollupMixin:
+    """
+    channel_stats の集約テーブル共通カラム
+
+    subscriber_count などは期間内で最後に観測された値。
+    last_recorded_at はその値を最後に観測した時刻で、時点検索のキーになる。
+    """
+
+    id = Column(Integer, primary_key=True, index=True)
+    period_start = Column(DateTime, nullable=False)
+    subscriber_count = Column(Integer, nullable=False)
+    view_count = Column(Integer, nullable=False)
+    video_count = Column(Integer, nullable=False)
+    subscriber_min = Column(Integer, nullable=True)
+    subscriber_max = Column(Integer, nullable=True)
+    sample_count = Column(Integer, nullable=False)
+    first_recorded_at = Column(DateTime, nullable=True)
+    last_recorded_at = Column(DateTime, nullable=False)
+
+    @declared_attr
+    def channel_id(cls):
+        return Column(Integer, ForeignKey("channels.id"), nullable=False)
+
+
+class ChannelStatsDaily(StatsRollupMixin, Base):
+    __tablename__ = "channel_stats_daily"
+    __table_args__ = (
+        UniqueConstraint("channel_id", "period_start", name="uq_channel_stats_daily_period"),
+    )
+
+
+class ChannelStatsWeekly(StatsRollupMixin, Base):
+    __tablename__ = "channel_stats_weekly"
+    __table_args__ = (
+        UniqueConstraint("channel_id", "period_start", name="uq_channel_stats_weekly_period"),
+    )
+
+
+class ChannelStatsMonthly(StatsRollupMixin, Base):
+    __tablename__ = "channel_stats_monthly"
+    __table_args__ = (
+        UniqueConstraint("channel_id", "period_start", name="uq_channel_stats_monthly_period"),
+    )
+
 
 class Prediction(Base):
     __tablename__ = "predictions"
 
     id = Column(Integer, primary_key=True, index=True)
     channel_id = Column(Integer, ForeignKey("channels.id"), nullable=False)
-    predicted_growth_rate = Column(Float, nullable=False)  # 半年後の成長率予測 (%)
+    predicted_growth_rate = Column(Float, nullable=False)  # horizon_days 日後の成長率予測 (%)
     confidence_score = Column(Float, nullable=True)  # 予測の信頼度
+    horizon_days = Column(Integer, nullable=True)  # 予測期間（日）。NULL は期間を記録する前の180日の予測
 
     # 予測に使用した特徴量
     feature_subscriber_growth_rate = Column(Float, nullable=True)  # 直近の登録者成長率
@@ -52,11 +105,138 @@ class Prediction(Base):
     feature_news_count = Column(Integer, nullable=True)  # ニュース記事数
     feature_news_sentiment = Column(Float, nullable=True)  # ニュースのセンチメント
 
+    model_version = Column(String(64), nullable=True)  # 予測したモデルのバージョン（ルールベースは NULL）
+    # 予測への寄与の上位（JSON: {"base": 期待値, "top": [[特徴量, 寄与, 値], ...]}、ルールベースは NULL）
+    contributions = Column(Text, nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
     # Relationships
     channel = relationship("Channel", back_populates="predictions")
 
+    __table_args__ = (
+        Index("ix_predictions_channel_horizon_created", "channel_id", "horizon_days", "created_at"),
+    )
+
+
+class ShadowPrediction(Base):
+    """チャレンジャーモデルの予測（画面には出さず、チャンピオンとの比較に使う）"""
+    __tablename__ = "shadow_predictions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    channel_id = Column(Integer, ForeignKey("channels.id"), nullable=False)
+    model_version = Column(String(64), nullable=False)
+    champion_version = Column(String(64), nullable=True)  # 同じバッチで本番に使ったモデル
+    horizon_days = Column(Integer, nullable=True)  # 予測期間（日）。NULL は180日
+    predicted_growth_rate = Column(Float, nullable=False)
+    confidence_score = Column(Float, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)  # 同じバッチの predictions.created_at と同じ
+
+    __table_args__ = (
+        Index("ix_shadow_predictions_version_created", "model_version", "created_at"),
+    )
+
+
+class ChannelFeatures(Base):
+    """
+    チャンネルの特徴量（GrowthPredictor.FEATURE_COLUMNS の全項目）
+
+    1チャンネル1日1行。同じ日に計算し直した場合は上書きする。
+    feature_version が今の計算方法と違う行は使わずに計算し直す。
+    """
+    __tablename__ = "channel_features"
+
+    id = Column(Integer, primary_key=True, index=True)
+    channel_id = Column(Integer, ForeignKey("channels.id"), nullable=False)
+    as_of_date = Column(Date, nullable=False)
+    computed_at = Column(DateTime, nullable=False)  # 特徴量の基準時刻（この時刻までのデータで計算）
+    # 特徴量の計算方法のバージョン（ml.training_data.FEATURE_SCHEMA_VERSION。NULL は導入前の行）
+    feature_version = Column(Integer, nullable=True)
+
+    subscriber_count = Column(Integer, nullable=True)
+    subscriber_growth_rate_30d = Column(Float, nullable=True)
+    subscriber_growth_rate_90d = Column(Float, nullable=True)
+    view_count = Column(Integer, nullable=True)
+    view_growth_rate_30d = Column(Float, nullable=True)
+    video_count = Column(Integer, nullable=True)
+    upload_frequency = Column(Float, nullable=True)
+    avg_views_per_video = Column(Float, nullable=True)
+    engagement_rate = Column(Float, nullable=True)
+    trend_score = Column(Integer, nullable=True)
+    trend_direction = Column(Integer, nullable=True)
+    trend_volatility = Column(Float, nullable=True)
+    news_count = Column(Integer, nullable=True)
+    news_positive_ratio = Column(Float, nullable=True)
+    news_negative_ratio = Column(Float, nullable=True)
+    channel_age_days = Column(Integer, nullable=True)
+
+    __table_args__ = (
+        UniqueConstraint("channel_id", "as_of_date", name="uq_channel_features_date"),
+    )
+
+
+class ChannelRollingAggregate(Base):
+    """
+    チャンネルの直近 window_days 日の集計（rolling_service が取り込みのたびに更新する）
+
+    1チャンネル1指標1行。期間内の行の件数・平均・偏差平方和（Welford 法の M2）と最初・最後の値を持ち、
+    特徴量の計算で履歴を読み直さずに分散・方向を求める。
+    """
+    __tablename__ = "channel_rolling_aggregates"
+
+    id = Column(Integer, primary_key=True, index=True)
+    channel_id = Column(Integer, ForeignKey("channels.id"), nullable=False)
+    metric = Column(String(32), nullable=False)  # rolling_service.ROLLING_METRICS のキー
+    window_days = Column(Integer, nullable=False)
+    window_start = Column(DateTime, nullable=False)  # これより前に終わった行は集計から除いてある
+    updated_at = Column(DateTime, nullable=False)  # 集計に含めた最新の行の時刻
+
+    count = Column(Integer, nullable=False, default=0)
+    mean = Column(Float, nullable=False, default=0.0)
+    m2 = Column(Float, nullable=False, default=0.0)
+    first_value = Column(Float, nullable=True)
+    first_at = Column(DateTime, nullable=True)  # 期間内で最も古い行の開始時刻
+    last_value = Column(Float, nullable=True)
+    last_at = Column(DateTime, nullable=True)  # 期間内で最も新しい行の終了時刻（ランレングス形式は last_confirmed_at）
+
+    __table_args__ = (
+        UniqueConstraint("channel_id", "metric", name="uq_channel_rolling_aggregates_metric"),
+    )
+
+
+class FeatureDriftBin(Base):
+    """
+    予測に使った特徴量のビンごとの件数（drift_service が予測のたびに足し込む）
+
+    1予測期間1モデルバージョン1特徴量1日1ビン1行（期間ごとのレジストリで同じバージョン名になりうるため期間も含める）。
+    ビンの境界はモデルの meta.json の feature_baseline のもの。
+    """
+    __tablename__ = "feature_drift_bins"
+
+    id = Column(Integer, primary_key=True, index=True)
+    model_version = Column(String(64), nullable=False)
+    horizon_days = Column(Integer, nullable=False)
+    feature = Column(String(64), nullable=False)
+    period_date = Column(Date, nullable=False)  # 予測した日（UTC）
+    bin = Column(Integer, nullable=False)  # ml.drift.bin_counts の添字（最後は欠損）
+    count = Column(Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        UniqueConstraint("model_version", "horizon_days", "feature", "period_date", "bin",
+                         name="uq_feature_drift_bins_bin"),
+        Index("ix_feature_drift_bins_period", "period_date"),
+    )
+
+
+# horizon_days を記録する前の予測の期間
+LEGACY_HORIZON_DAYS = 180
+
+
+def horizon_filter(model, horizon_days: int):
+    """predictions / shadow_predictions を予測期間で絞り込む条件（NULL は180日として扱う）"""
+    if horizon_days == LEGACY_HORIZON_DAYS:
+        return or_(model.horizon_days == horizon_days, model.horizon_days.is_(None))
+    return model.horizon_days == horizon_days
+
 
 class News(Base):
     __tablename__ = "news"
@@ -82,3 +262,7 @@ class TrendData(Base):
     channel_id = Column(Integer, ForeignKey("channels.id"), nullable=False)
     trend_score = Column(Integer, nullable=False)  # 0-100
     recorded_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_trend_data_channel_recorded", "channel_id", "recorded_at"),
+    )
@@ -4,16 +4,23 @@
 """
 import asyncio
 from datetime import datetime
-from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks
+from fastapi import APIRouter, Depends, HTTPException, BackgroundTasks, Query
 from sqlalchemy.orm import Session
 
 from app.database import get_db
-from app.models import Channel, ChannelStats, News, TrendData, Prediction
+from app.models import Channel, News, TrendData
 from app.services.youtube_service import YouTubeService
 from app.services.news_service import NewsService
 from app.services.trends_service import TrendsService
-from ml.predictor import GrowthPredictor
-from ml.feature_extractor import FeatureExtractor
+from app.services.stats_service import record_stats
+from app.services.rolling_service import observe
+from app.services.feature_store import mark_features_changed, publish_features, refresh_stale_features
+from app.services.prediction_service import predict_channels
+from app.services.prediction_batcher import prediction_batcher
+from app.services.similarity_service import publish_similarity_index
+from app.services.accuracy_service import accuracy_report
+from app.services.drift_service import drift_report
+from app.schemas import AccuracyResponse, DriftResponse
 
 router = APIRouter()
 
@@ -62,6 +69,7 @@ async def run_data_collection(db: Session = Depends(get_db)):
         trends_service = TrendsService()
 
         collected_count = 0
+        collected_ids = []
 
         for channel in channels:
             try:
@@ -73,13 +81,13 @@ async def run_data_collection(db: Session = Depends(get_db)):
                     channel.thumbnail_url = info.get("thumbnail_url")
                     channel.updated_at = datetime.utcnow()
 
-                    stats = ChannelStats(
-                        channel_id=channel.id,
+                    record_stats(
+                        db,
+                        channel.id,
                         subscriber_count=info["subscriber_count"],
                         view_count=info.get("view_count", 0),
                         video_count=info.get("video_count", 0),
                     )
-                    db.add(stats)
 
                 # ニュースを収集
                 news_items = await news_service.fetch_news(channel.name, max_results=10)
@@ -99,25 +107,38 @@ async def run_data_collection(db: Session = Depends(get_db)):
                             published_at=item.get("published_at"),
                         )
                         db.add(news)
+                        mark_features_changed(db, channel.id)
 
                 # Trendsを収集
                 try:
                     trend_score = await trends_service.get_current_trend_score(channel.name)
                     if trend_score is not None:
+                        recorded_at = datetime.utcnow()
                         trend = TrendData(
                             channel_id=channel.id,
                             trend_score=trend_score,
+                            recorded_at=recorded_at,
                         )
                         db.add(trend)
+                        observe(db, channel.id, "trend_score", trend_score, recorded_at)
+                        mark_features_changed(db, channel.id)
                 except Exception:
                     pass  # Trendsのエラーは無視
 
                 collected_count += 1
+                collected_ids.append(channel.id)
 
             except Exception as e:
                 print(f"Error collecting {channel.name}: {e}")
 
+        # 入力が変わったチャンネルの特徴量を計算して保存
+        refresh_stale_features(db)
         db.commit()
+        publish_features(db)
+        db.commit()
+        publish_similarity_index(db)
+        # 入力が変わったチャンネルはバックグラウンドでまとめて予測し直す
+        prediction_batcher.submit(collected_ids)
         message = f"データ収集完了: {collected_count}/{len(channels)} チャンネル"
         update_status("completed", message)
         return {"message": message}
@@ -130,8 +151,8 @@ async def run_data_collection(db: Session = Depends(get_db)):
 
 
 @router.post("/predict")
-async def run_prediction(db: Session = Depends(get_db)):
-    """予測を実行"""
+async def run_prediction(full: bool = False, db: Session = Depends(get_db)):
+    """予測を実行（full=false の場合は前回から入力が変わったチャンネルだけ）"""
     if job_status["status"] == "running":
         raise HTTPException(status_code=409, detail="別のジョブが実行中です")
 
@@ -144,36 +165,12 @@ async def run_prediction(db: Session = Depends(get_db)):
             update_status("error", "登録されているチャンネルがありません")
             raise HTTPException(status_code=400, detail="チャンネルが登録されていません")
 
-        predictor = GrowthPredictor()
-        extractor = FeatureExtractor(db)
-
-        predicted_count = 0
-
-        for channel in channels:
-            try:
-                features = extractor.extract_features(channel.id)
-                result = predictor.predict(features)
-
-                prediction = Prediction(
-                    channel_id=channel.id,
-                    predicted_growth_rate=result["predicted_growth_rate"],
-                    confidence_score=result["confidence_score"],
-                    feature_subscriber_growth_rate=features.get("subscriber_growth_rate_30d"),
-                    feature_view_growth_rate=features.get("view_growth_rate_30d"),
-                    feature_upload_frequency=features.get("upload_frequency"),
-                    feature_engagement_rate=features.get("engagement_rate"),
-                    feature_trend_score=features.get("trend_score"),
-                    feature_news_count=features.get("news_count"),
-                    feature_news_sentiment=features.get("news_positive_ratio"),
-                )
-                db.add(prediction)
-                predicted_count += 1
-
-            except Exception as e:
-                print(f"Error predicting {channel.name}: {e}")
+        # 特徴量の抽出・予測・保存をまとめて実行
+        predictions = predict_channels(db, only_dirty=not full)
+        predicted_count = max((len(result) for result in predictions.values()), default=0)
 
-        db.commit()
-        message = f"予測完了: {predicted_count}/{len(channels)} チャンネル"
+        horizons = ", ".join(f"{h}日" for h in predictions)
+        message = f"予測完了: {predicted_count}/{len(channels)} チャンネル（予測期間: {horizons}）"
         update_status("completed", message)
         return {"message": message}
 
@@ -184,6 +181,32 @@ async def run_prediction(db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.get("/accuracy", response_model=AccuracyResponse)
+async def get_accuracy(
+    days: int = Query(365, ge=1, le=3650),
+    refresh: bool = False,
+    db: Session = Depends(get_db)
+):
+    """
+    保存済みの予測と実際の成長率の比較（全体・モデルバージョン・登録者数の規模ごと）
+
+    当日0時（UTC）までに予測期間が過ぎた予測のうち、直近 days 日に期間が過ぎたものを集計する。
+    結果は日付ごとにキャッシュする（refresh=true で集計し直す）。
+    """
+    return accuracy_report(db, days, refresh)
+
+
+@router.get("/drift", response_model=DriftResponse)
+async def get_drift(days: int = Query(7, ge=1, le=365), db: Session = Depends(get_db)):
+    """
+    直近 days 日の予測に使った特徴量の分布と学習時の分布の比較（予測期間・モデルバージョン・特徴量ごとの PSI）
+
+    予測のたびに足し込んだビンごとの件数だけを読む（統計・特徴量のテーブルは読み直さない）。
+    PSI 0.1 以上は warn、0.25 以上は alert。
+    """
+    return drift_report(db, days)
+
+
 @router.post("/train")
 async def run_training(db: Session = Depends(get_db)):
     """モデル学習を実行"""
@@ -1,9 +1,17 @@
-from fastapi import APIRouter, Depends, HTTPException
+import json
+from fastapi import APIRouter, Depends, HTTPException, Query
 from sqlalchemy.orm import Session
 from typing import List
 from app.database import get_db
-from app.models import Channel, ChannelStats, Prediction
-from app.schemas import ChannelResponse, ChannelDetailResponse, ChannelCreate, ChannelStatsResponse, PredictionResponse
+from app.models import Channel, Prediction, horizon_filter
+from app.schemas import (ChannelResponse, ChannelDetailResponse, ChannelCreate, ChannelStatsResponse,
+                         PredictionResponse, ChannelFeaturesResponse, ExplanationResponse,
+                         FeatureContribution, SimilarChannel, SimilarChannelsResponse)
+from app.services.stats_service import record_stats, latest_point, get_stats_history
+from app.services.feature_store import latest_channel_features, refresh_features
+from app.services.prediction_batcher import prediction_batcher
+from app.routers.deps import prediction_horizon
+from app.services.similarity_service import current_index
 
 router = APIRouter()
 
@@ -16,18 +24,18 @@ async def get_channels_count(db: Session = Depends(get_db)):
 
 
 @router.get("/", response_model=List[ChannelResponse])
-async def get_channels(skip: int = 0, limit: int = 50, db: Session = Depends(get_db)):
-    """登録済みチャンネル一覧を取得"""
+async def get_channels(skip: int = 0, limit: int = 50, horizon: int = Depends(prediction_horizon),
+                       db: Session = Depends(get_db)):
+    """登録済みチャンネル一覧を取得（latest_prediction は horizon 日の予測）"""
     channels = db.query(Channel).offset(skip).limit(limit).all()
 
     result = []
     for channel in channels:
-        latest_stats = db.query(ChannelStats).filter(
-            ChannelStats.channel_id == channel.id
-        ).order_by(ChannelStats.recorded_at.desc()).first()
+        latest_stats = latest_point(db, channel.id)
 
         latest_prediction = db.query(Prediction).filter(
-            Prediction.channel_id == channel.id
+            Prediction.channel_id == channel.id,
+            horizon_filter(Prediction, horizon),
         ).order_by(Prediction.created_at.desc()).first()
 
         channel_data = ChannelResponse(
@@ -46,22 +54,24 @@ async def get_channels(skip: int = 0, limit: int = 50, db: Session = Depends(get
 
 
 @router.get("/{channel_id}", response_model=ChannelDetailResponse)
-async def get_channel(channel_id: str, db: Session = Depends(get_db)):
-    """チャンネル詳細を取得"""
+async def get_channel(channel_id: str, horizon: int = Depends(prediction_horizon),
+                      db: Session = Depends(get_db)):
+    """チャンネル詳細を取得（予測は horizon 日のもの）"""
     channel = db.query(Channel).filter(Channel.channel_id == channel_id).first()
     if not channel:
         raise HTTPException(status_code=404, detail="Channel not found")
 
-    stats_history = db.query(ChannelStats).filter(
-        ChannelStats.channel_id == channel.id
-    ).order_by(ChannelStats.recorded_at.desc()).limit(180).all()
+    # dedup形式の行も観測点に展開して返す
+    stats_history = get_stats_history(db, channel.id, limit=180)
 
     predictions_history = db.query(Prediction).filter(
-        Prediction.channel_id == channel.id
+        Prediction.channel_id == channel.id,
+        horizon_filter(Prediction, horizon),
     ).order_by(Prediction.created_at.desc()).limit(30).all()
 
     latest_stats = stats_history[0] if stats_history else None
     latest_prediction = predictions_history[0] if predictions_history else None
+    features = latest_channel_features(db, channel.id)
 
     return ChannelDetailResponse(
         id=channel.id,
@@ -73,7 +83,71 @@ async def get_channel(channel_id: str, db: Session = Depends(get_db)):
         latest_stats=ChannelStatsResponse.model_validate(latest_stats) if latest_stats else None,
         latest_prediction=PredictionResponse.model_validate(latest_prediction) if latest_prediction else None,
         stats_history=[ChannelStatsResponse.model_validate(s) for s in stats_history],
-        predictions_history=[PredictionResponse.model_validate(p) for p in predictions_history]
+        predictions_history=[PredictionResponse.model_validate(p) for p in predictions_history],
+        features=ChannelFeaturesResponse.model_validate(features) if features else None,
+    )
+
+
+@router.get("/{channel_id}/explanation", response_model=ExplanationResponse)
+async def get_channel_explanation(channel_id: str, horizon: int = Depends(prediction_horizon),
+                                  db: Session = Depends(get_db)):
+    """horizon 日の最新の予測の特徴量ごとの寄与を取得（予測時に保存した値を返す）"""
+    channel = db.query(Channel).filter(Channel.channel_id == channel_id).first()
+    if not channel:
+        raise HTTPException(status_code=404, detail="Channel not found")
+
+    prediction = db.query(Prediction).filter(
+        Prediction.channel_id == channel.id,
+        horizon_filter(Prediction, horizon),
+    ).order_by(Prediction.created_at.desc()).first()
+    if not prediction:
+        raise HTTPException(status_code=404, detail="Prediction not found")
+
+    explained = json.loads(prediction.contributions) if prediction.contributions else {}
+    return ExplanationResponse(
+        channel_id=channel.channel_id,
+        predicted_growth_rate=prediction.predicted_growth_rate,
+        horizon_days=horizon,
+        model_version=prediction.model_version,
+        base_value=explained.get("base"),
+        contributions=[
+            FeatureContribution(feature=feature, contribution=contribution, value=value)
+            for feature, contribution, value in explained.get("top", [])
+        ],
+        created_at=prediction.created_at,
+    )
+
+
+@router.get("/{channel_id}/similar", response_model=SimilarChannelsResponse)
+async def get_similar_channels(channel_id: str, limit: int = Query(10, ge=1, le=100),
+                               db: Session = Depends(get_db)):
+    """登録者数の推移が似ているチャンネルを取得（データ収集の後に作り直す索引から検索）"""
+    channel = db.query(Channel).filter(Channel.channel_id == channel_id).first()
+    if not channel:
+        raise HTTPException(status_code=404, detail="Channel not found")
+
+    index = current_index()
+    if index is None or index.row(channel.id) < 0:
+        # 索引がまだない、または履歴が足りないチャンネル
+        raise HTTPException(status_code=404, detail="Similar channels not available")
+
+    neighbours = index.similar(channel.id, limit)
+    channels = {c.id: c for c in db.query(Channel).filter(Channel.id.in_([i for i, _ in neighbours])).all()}
+    return SimilarChannelsResponse(
+        channel_id=channel.channel_id,
+        as_of=index.as_of,
+        days=index.meta["days"],
+        growth_rate=index.growth_rate(channel.id),
+        similar=[
+            SimilarChannel(
+                channel_id=channels[i].channel_id,
+                name=channels[i].name,
+                thumbnail_url=channels[i].thumbnail_url,
+                distance=distance,
+                growth_rate=index.growth_rate(i),
+            )
+            for i, distance in neighbours if i in channels  # 索引を作った後に削除されたチャンネルは除く
+        ],
     )
 
 
@@ -107,15 +181,19 @@ async def add_channel(channel_data: ChannelCreate, db: Session = Depends(get_db)
 
     # Add initial stats
     if channel_info.get("subscriber_count") is not None:
-        stats = ChannelStats(
-            channel_id=channel.id,
+        record_stats(
+            db,
+            channel.id,
             subscriber_count=channel_info["subscriber_count"],
             view_count=channel_info.get("view_count", 0),
             video_count=channel_info.get("video_count", 0)
         )
-        db.add(stats)
+        refresh_features(db, [channel.id])
         db.commit()
 
+    # 予測は他の追加とまとめてバックグラウンドで実行（数秒でランキング・latest_prediction に反映される）
+    prediction_batcher.submit([channel.id])
+
     return ChannelResponse(
         id=channel.id,
         channel_id=channel.channel_id,
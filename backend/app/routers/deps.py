@@ -0,0 +1,16 @@
+"""
+ルーター共通の依存関係（FastAPI の Depends で使う）
+
+services はフレームワークに依存しないため、クエリパラメータの検証や HTTP エラーはここで扱う。
+"""
+from fastapi import HTTPException, Query
+
+from app.config import settings
+from ml.training_data import HORIZON_DAYS
+
+
+def prediction_horizon(horizon: int = Query(HORIZON_DAYS, description="予測期間（日）")) -> int:
+    """API の horizon クエリパラメータ（settings.PREDICTION_HORIZONS のいずれか）"""
+    if horizon not in settings.PREDICTION_HORIZONS:
+        raise HTTPException(status_code=400, detail=f"horizon must be one of {settings.PREDICTION_HORIZONS}")
+    return horizon
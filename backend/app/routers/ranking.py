@@ -2,8 +2,10 @@ from fastapi import APIRouter, Depends, Query
 from sqlalchemy.orm import Session
 from datetime import datetime
 from app.database import get_db
-from app.models import Channel, ChannelStats, Prediction
+from app.models import Channel, Prediction, horizon_filter
 from app.schemas import RankingResponse, RankingEntry, ChannelResponse, ChannelStatsResponse, PredictionResponse
+from app.services.stats_service import latest_point
+from app.routers.deps import prediction_horizon
 
 router = APIRouter()
 
@@ -11,22 +13,24 @@ router = APIRouter()
 @router.get("/", response_model=RankingResponse)
 async def get_ranking(
     limit: int = Query(50, ge=1, le=100),
+    horizon: int = Depends(prediction_horizon),
     db: Session = Depends(get_db)
 ):
-    """成長予測ランキングを取得"""
+    """成長予測ランキングを取得（horizon: 予測期間の日数）"""
     # Get latest predictions for each channel
     from sqlalchemy import func
 
     subquery = db.query(
         Prediction.channel_id,
         func.max(Prediction.created_at).label("max_created_at")
-    ).group_by(Prediction.channel_id).subquery()
+    ).filter(horizon_filter(Prediction, horizon)).group_by(Prediction.channel_id).subquery()
 
+    # 同じバッチの予測は全期間で created_at が同じなので、期間でも絞り込む
     predictions = db.query(Prediction).join(
         subquery,
         (Prediction.channel_id == subquery.c.channel_id) &
         (Prediction.created_at == subquery.c.max_created_at)
-    ).order_by(Prediction.predicted_growth_rate.desc()).limit(limit).all()
+    ).filter(horizon_filter(Prediction, horizon)).order_by(Prediction.predicted_growth_rate.desc()).limit(limit).all()
 
     rankings = []
     for idx, prediction in enumerate(predictions, 1):
@@ -34,9 +38,7 @@ async def get_ranking(
         if not channel:
             continue
 
-        latest_stats = db.query(ChannelStats).filter(
-            ChannelStats.channel_id == channel.id
-        ).order_by(ChannelStats.recorded_at.desc()).first()
+        latest_stats = latest_point(db, channel.id)
 
         channel_response = ChannelResponse(
             id=channel.id,
@@ -58,5 +60,6 @@ async def get_ranking(
 
     return RankingResponse(
         rankings=rankings,
+        horizon_days=horizon,
         updated_at=datetime.utcnow()
     )
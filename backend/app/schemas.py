@@ -1,5 +1,5 @@
 from pydantic import BaseModel
-from datetime import datetime
+from datetime import date, datetime
 from typing import Optional, List
 
 
@@ -35,10 +35,56 @@ class PredictionResponse(BaseModel):
     feature_trend_score: Optional[float]
     feature_news_count: Optional[int]
     feature_news_sentiment: Optional[float]
+    horizon_days: Optional[int] = None  # 予測期間（日）。NULL は180日
+    model_version: Optional[str] = None
     created_at: datetime
 
     class Config:
         from_attributes = True
+        protected_namespaces = ()
+
+
+class ChannelFeaturesResponse(BaseModel):
+    as_of_date: date
+    computed_at: datetime
+    subscriber_count: Optional[int]
+    subscriber_growth_rate_30d: Optional[float]
+    subscriber_growth_rate_90d: Optional[float]
+    view_count: Optional[int]
+    view_growth_rate_30d: Optional[float]
+    video_count: Optional[int]
+    upload_frequency: Optional[float]
+    avg_views_per_video: Optional[float]
+    engagement_rate: Optional[float]
+    trend_score: Optional[int]
+    trend_direction: Optional[int]
+    trend_volatility: Optional[float]
+    news_count: Optional[int]
+    news_positive_ratio: Optional[float]
+    news_negative_ratio: Optional[float]
+    channel_age_days: Optional[int]
+
+    class Config:
+        from_attributes = True
+
+
+class FeatureContribution(BaseModel):
+    feature: str
+    contribution: float  # 予測値（成長率 %）への寄与
+    value: float  # 予測に使った特徴量の値（欠損は0）
+
+
+class ExplanationResponse(BaseModel):
+    channel_id: str
+    predicted_growth_rate: float
+    horizon_days: int
+    model_version: Optional[str] = None
+    base_value: Optional[float] = None  # 予測の期待値（base_value + 全特徴量の寄与 = 予測値、保存するのは上位のみ）
+    contributions: List[FeatureContribution] = []  # 寄与の絶対値の大きい順（ルールベースの予測は空）
+    created_at: datetime
+
+    class Config:
+        protected_namespaces = ()
 
 
 class ChannelResponse(BaseModel):
@@ -58,6 +104,7 @@ class ChannelResponse(BaseModel):
 class ChannelDetailResponse(ChannelResponse):
     stats_history: List[ChannelStatsResponse] = []
     predictions_history: List[PredictionResponse] = []
+    features: Optional[ChannelFeaturesResponse] = None  # 最新の特徴量（channel_features の全項目）
 
     class Config:
         from_attributes = True
@@ -90,6 +137,22 @@ class NewsListResponse(BaseModel):
     per_page: int
 
 
+class SimilarChannel(BaseModel):
+    channel_id: str
+    name: str
+    thumbnail_url: Optional[str]
+    distance: float  # 推移のベクトルの距離（小さいほど似ている）
+    growth_rate: Optional[float] = None  # 索引の期間の登録者数の成長率
+
+
+class SimilarChannelsResponse(BaseModel):
+    channel_id: str
+    as_of: datetime  # 索引を作った時刻
+    days: int  # 比べた期間（日）
+    growth_rate: Optional[float] = None
+    similar: List[SimilarChannel]
+
+
 # Ranking Schemas
 class RankingEntry(BaseModel):
     rank: int
@@ -100,9 +163,57 @@ class RankingEntry(BaseModel):
 
 class RankingResponse(BaseModel):
     rankings: List[RankingEntry]
+    horizon_days: int
     updated_at: datetime
 
 
+# Accuracy Schemas
+class AccuracyCohort(BaseModel):
+    dimension: str  # overall / model_version / subscriber_bucket
+    cohort: str
+    horizon_days: int
+    predictions: int
+    batches: int  # 予測バッチ（同じ時刻にまとめて予測した回）の数
+    mae: float
+    bias: float  # 予測 - 実際の平均（正なら過大予測）
+    rank_corr: Optional[float] = None  # 予測バッチ内の順位相関の平均
+
+
+class AccuracyResponse(BaseModel):
+    as_of: datetime
+    days: int
+    computed_at: datetime
+    cohorts: List[AccuracyCohort]
+
+
+# Drift Schemas
+class DriftFeature(BaseModel):
+    feature: str
+    psi: Optional[float] = None  # 学習時の分布との PSI（学習時の分布がなければ None）
+    level: str  # stable / warn / alert / unknown
+    observations: int
+    missing_ratio: Optional[float] = None
+    baseline_missing_ratio: Optional[float] = None
+
+
+class DriftModel(BaseModel):
+    horizon_days: int
+    model_version: str
+    observations: int  # 期間内に予測に使った特徴量の件数（同じチャンネルの複数回の予測も数える）
+    max_psi: Optional[float] = None
+    level: str
+    features: List[DriftFeature]
+
+    class Config:
+        protected_namespaces = ()
+
+
+class DriftResponse(BaseModel):
+    as_of: datetime
+    days: int
+    models: List[DriftModel]
+
+
 # Search Schemas
 class YouTubeSearchResult(BaseModel):
     channel_id: str
@@ -0,0 +1,286 @@
+"""
+保存済みの予測の精度（実際の成長率との比較）
+
+予測期間が過ぎた predictions の各行について、予測時点の登録者数（その時点で観測済みの最新の統計）と
+予測期間後の登録者数（予測期間後の時刻に最も近い統計）を求め、実際の成長率と比べる。
+統計は channel_stats と集約テーブル（日次・週次・月次）の観測点を合わせたものを使う
+（180日予測の予測時点の生データは、正解が確定する頃には集約済みになっているため）。
+
+予測と統計の対応付けは1つのSQLで行う。予測時点・予測期間後の時刻を統計の観測点と同じ時系列に並べ、
+ウィンドウ関数でそれ以前の観測点の数（= 直前の観測点の通し番号）を数えて観測点と結合する
+（予測ごとのサブクエリ・Pythonのループは使わない）。
+誤差と順位相関は pandas でまとめて集計する。順位相関は予測期間・予測バッチ（created_at）ごとに計算し、
+コホート（全体・モデルバージョン・登録者数の規模）ごとに件数で重み付けして平均する。
+
+レポートは日付（UTC）とさかのぼる日数ごとにプロセス内でキャッシュし、同じ日のうちは集計し直さない。
+日付の計算に SQLite の日付関数を使うため SQLite 専用。
+"""
+import threading
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import DateTime, bindparam, text
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models import LEGACY_HORIZON_DAYS
+
+# 予測時点・予測期間後の時刻と、対応付ける統計の観測時刻の差の上限（日）。これより離れている予測は集計しない
+MAX_SAMPLE_GAP_DAYS = 7
+# 順位相関を計算する予測バッチの最小件数
+MIN_RANK_BATCH_SIZE = 3
+
+# 登録者数の規模（下限, 表示名）。予測時点の登録者数で分ける
+SUBSCRIBER_BUCKETS = [
+    (10_000_000, "10M+"),
+    (1_000_000, "1M-10M"),
+    (100_000, "100K-1M"),
+    (10_000, "10K-100K"),
+    (0, "<10K"),
+]
+
+# 予測ごとの予測値と実際の成長率
+ACCURACY_PAIRS_SQL = f"""
+WITH
+matured AS (
+    SELECT id, channel_id, COALESCE(model_version, 'rule') AS model_version,
+           COALESCE(horizon_days, {LEGACY_HORIZON_DAYS}) AS horizon_days,
+           predicted_growth_rate, created_at,
+           julianday(created_at) AS created_jd,
+           julianday(created_at) + COALESCE(horizon_days, {LEGACY_HORIZON_DAYS}) AS target_jd
+    FROM predictions
+    WHERE created_at >= :created_since
+      AND julianday(created_at) + COALESCE(horizon_days, {LEGACY_HORIZON_DAYS}) > julianday(:target_since)
+      AND julianday(created_at) + COALESCE(horizon_days, {LEGACY_HORIZON_DAYS}) <= julianday(:as_of)
+),
+-- 統計の観測点（チャンネルごとの通し番号と次の観測点）
+samples AS MATERIALIZED (
+    SELECT channel_id, at, subscriber_count,
+           ROW_NUMBER() OVER w AS sample_no,
+           LEAD(at) OVER w AS next_at,
+           LEAD(subscriber_count) OVER w AS next_subscriber
+    FROM (
+        SELECT channel_id, julianday(observed_at) AS at, MAX(subscriber_count) AS subscriber_count
+        FROM (
+            SELECT channel_id, recorded_at AS observed_at, subscriber_count FROM channel_stats
+            UNION ALL
+            SELECT channel_id, last_confirmed_at, subscriber_count FROM channel_stats
+            WHERE last_confirmed_at > recorded_at
+            UNION ALL
+            SELECT channel_id, last_recorded_at, subscriber_count FROM channel_stats_daily
+            UNION ALL
+            SELECT channel_id, last_recorded_at, subscriber_count FROM channel_stats_weekly
+            UNION ALL
+            SELECT channel_id, last_recorded_at, subscriber_count FROM channel_stats_monthly
+        )
+        WHERE observed_at >= :sample_since
+          AND channel_id IN (SELECT channel_id FROM matured)
+        GROUP BY channel_id, julianday(observed_at)
+    )
+    WINDOW w AS (PARTITION BY channel_id ORDER BY at)
+),
+-- kind 0: 統計の観測点 / 1: 予測時点 / 2: 予測期間後の時刻
+-- 予測の時刻の prev_no はそれ以前（同時刻を含む）の観測点の数 = 直前の観測点の sample_no
+events AS (
+    SELECT prediction_id, kind, channel_id, at,
+           SUM(CASE WHEN kind = 0 THEN 1 ELSE 0 END) OVER (
+               PARTITION BY channel_id ORDER BY at, kind ROWS UNBOUNDED PRECEDING) AS prev_no
+    FROM (
+        SELECT channel_id, at, 0 AS kind, NULL AS prediction_id FROM samples
+        UNION ALL
+        SELECT channel_id, created_jd, 1, id FROM matured
+        UNION ALL
+        SELECT channel_id, target_jd, 2, id FROM matured
+    )
+),
+located AS (
+    SELECT e.prediction_id, e.kind, e.at,
+           prev.at AS prev_at, prev.subscriber_count AS prev_subscriber,
+           COALESCE(prev.next_at, first.at) AS next_at,
+           COALESCE(prev.next_subscriber, first.subscriber_count) AS next_subscriber
+    FROM events e
+    LEFT JOIN samples prev ON prev.channel_id = e.channel_id AND prev.sample_no = e.prev_no
+    LEFT JOIN samples first ON first.channel_id = e.channel_id AND first.sample_no = 1 AND e.prev_no = 0
+    WHERE e.kind > 0
+),
+observed AS (
+    SELECT prediction_id,
+           -- 予測時点: その時点で観測済みの最新の統計
+           MAX(CASE WHEN kind = 1 AND at - prev_at <= :max_gap THEN prev_subscriber END) AS base_subscriber,
+           -- 予測期間後: 前後で近い方の統計
+           MAX(CASE WHEN kind = 2 THEN
+               CASE WHEN prev_at IS NOT NULL AND (next_at IS NULL OR at - prev_at <= next_at - at)
+                    THEN CASE WHEN at - prev_at <= :max_gap THEN prev_subscriber END
+                    ELSE CASE WHEN next_at - at <= :max_gap THEN next_subscriber END
+               END
+           END) AS actual_subscriber
+    FROM located
+    GROUP BY prediction_id
+)
+SELECT m.horizon_days, m.created_at, m.model_version, o.base_subscriber,
+       m.predicted_growth_rate AS predicted,
+       (o.actual_subscriber - o.base_subscriber) * 100.0 / o.base_subscriber AS actual
+FROM matured m
+JOIN observed o ON o.prediction_id = m.id
+WHERE o.base_subscriber > 0 AND o.actual_subscriber IS NOT NULL
+"""
+
+# 集計するコホートの軸（overall は全体）
+COHORT_DIMENSIONS = ["overall", "model_version", "subscriber_bucket"]
+
+_cache: Dict[Tuple[str, int], Dict[str, Any]] = {}
+_cache_lock = threading.Lock()
+
+
+def accuracy_pairs(db: Session, as_of: datetime, days: int) -> pd.DataFrame:
+    """
+    予測ごとの予測値（predicted）と実際の成長率（actual）
+
+    Args:
+        as_of: この時刻までに予測期間が過ぎた予測を集計する
+        days: 予測期間が過ぎた時刻が as_of の days 日前より後の予測だけを集計する
+
+    Returns:
+        horizon_days, created_at, model_version, base_subscriber, predicted, actual の DataFrame
+    """
+    target_since = as_of - timedelta(days=days)
+    created_since = target_since - timedelta(days=max(settings.PREDICTION_HORIZONS + [LEGACY_HORIZON_DAYS]))
+    stmt = text(ACCURACY_PAIRS_SQL).bindparams(
+        bindparam("created_since", type_=DateTime()),
+        bindparam("target_since", type_=DateTime()),
+        bindparam("as_of", type_=DateTime()),
+        bindparam("sample_since", type_=DateTime()),
+    )
+    result = db.execute(stmt, {
+        "created_since": created_since,
+        "target_since": target_since,
+        "as_of": as_of,
+        "sample_since": created_since - timedelta(days=MAX_SAMPLE_GAP_DAYS),
+        "max_gap": MAX_SAMPLE_GAP_DAYS,
+    })
+    return pd.DataFrame(result.fetchall(), columns=list(result.keys()))
+
+
+def subscriber_bucket(base_subscriber: pd.Series) -> np.ndarray:
+    """予測時点の登録者数の規模（SUBSCRIBER_BUCKETS の表示名）"""
+    return np.select(
+        [base_subscriber >= lower for lower, _ in SUBSCRIBER_BUCKETS[:-1]],
+        [label for _, label in SUBSCRIBER_BUCKETS[:-1]],
+        default=SUBSCRIBER_BUCKETS[-1][1],
+    )
+
+
+def batch_accuracy(pairs: pd.DataFrame) -> pd.DataFrame:
+    """
+    コホート・予測期間・予測バッチ（created_at）ごとの件数・誤差の合計・順位相関
+
+    順位相関は予測バッチ内の予測値と実際の成長率の順位（同じ値は平均の順位）のピアソン相関。
+    """
+    columns = ["dimension", "cohort", "horizon_days", "created_at", "n", "abs_error", "error", "rank_corr"]
+    if pairs.empty:
+        return pd.DataFrame(columns=columns)
+
+    cohorts = {
+        "overall": np.full(len(pairs), "all", dtype=object),
+        "model_version": pairs["model_version"].to_numpy(),
+        "subscriber_bucket": subscriber_bucket(pairs["base_subscriber"]),
+    }
+    error = (pairs["predicted"] - pairs["actual"]).to_numpy(dtype=float)
+
+    frames = []
+    for dimension in COHORT_DIMENSIONS:
+        df = pd.DataFrame({
+            "cohort": cohorts[dimension],
+            "horizon_days": pairs["horizon_days"].to_numpy(),
+            "created_at": pairs["created_at"].to_numpy(),
+            "predicted": pairs["predicted"].to_numpy(dtype=float),
+            "actual": pairs["actual"].to_numpy(dtype=float),
+            "abs_error": np.abs(error),
+            "error": error,
+        })
+        keys = ["cohort", "horizon_days", "created_at"]
+        groups = df.groupby(keys, sort=False)
+        x = groups["predicted"].rank().to_numpy()
+        y = groups["actual"].rank().to_numpy()
+        df = df.assign(x=x, y=y, xx=x * x, yy=y * y, xy=x * y)
+
+        batch = df.groupby(keys, sort=True).agg(
+            n=("error", "size"), abs_error=("abs_error", "sum"), error=("error", "sum"),
+            x=("x", "sum"), y=("y", "sum"), xx=("xx", "sum"), yy=("yy", "sum"), xy=("xy", "sum"),
+        ).reset_index()
+        n = batch["n"].to_numpy(dtype=float)
+        spread = (n * batch["xx"] - batch["x"] ** 2) * (n * batch["yy"] - batch["y"] ** 2)
+        corr = (n * batch["xy"] - batch["x"] * batch["y"]) / np.sqrt(spread.where(spread > 0))
+        batch["rank_corr"] = corr.where(n >= MIN_RANK_BATCH_SIZE)
+        batch["dimension"] = dimension
+        frames.append(batch[columns])
+    return pd.concat(frames, ignore_index=True)
+
+
+def summarize_batches(batches: pd.DataFrame) -> List[Dict[str, Any]]:
+    """予測バッチごとの集計をコホート・予測期間ごとにまとめる（順位相関は件数で重み付けした平均）"""
+    if batches.empty:
+        return []
+    batches = batches.assign(
+        corr_weight=batches["n"].where(batches["rank_corr"].notna(), 0),
+        weighted_corr=(batches["rank_corr"].astype(float) * batches["n"]).fillna(0),
+    )
+    grouped = batches.groupby(["dimension", "cohort", "horizon_days"], sort=True).agg(
+        predictions=("n", "sum"),
+        batches=("n", "size"),
+        abs_error=("abs_error", "sum"),
+        error=("error", "sum"),
+        corr_weight=("corr_weight", "sum"),
+        weighted_corr=("weighted_corr", "sum"),
+    ).reset_index()
+
+    cohorts = []
+    for row in grouped.itertuples(index=False):
+        cohorts.append({
+            "dimension": row.dimension,
+            "cohort": row.cohort,
+            "horizon_days": int(row.horizon_days),
+            "predictions": int(row.predictions),
+            "batches": int(row.batches),
+            "mae": float(row.abs_error / row.predictions),
+            "bias": float(row.error / row.predictions),
+            "rank_corr": float(row.weighted_corr / row.corr_weight) if row.corr_weight > 0 else None,
+        })
+    return cohorts
+
+
+def accuracy_report(db: Session, days: int = 365, refresh: bool = False,
+                    now: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    予測精度のレポート（その日の0時（UTC）までに予測期間が過ぎた予測を集計、日付ごとにキャッシュ）
+
+    Args:
+        days: 予測期間が過ぎた時刻をさかのぼる日数
+        refresh: キャッシュを使わずに集計し直す
+
+    Returns:
+        as_of, days, computed_at, cohorts（dimension, cohort, horizon_days, predictions, batches,
+        mae, bias（予測 - 実際の平均）, rank_corr）
+    """
+    now = now or datetime.utcnow()
+    as_of = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    key = (as_of.date().isoformat(), days)
+
+    with _cache_lock:
+        if not refresh and key in _cache:
+            return _cache[key]
+        # 古い日付のレポートは使わないので捨てる
+        for stale in [k for k in _cache if k[0] != key[0]]:
+            del _cache[stale]
+
+    report = {
+        "as_of": as_of,
+        "days": days,
+        "computed_at": datetime.utcnow(),
+        "cohorts": summarize_batches(batch_accuracy(accuracy_pairs(db, as_of, days))),
+    }
+    with _cache_lock:
+        _cache[key] = report
+    return report
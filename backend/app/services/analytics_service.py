@@ -0,0 +1,180 @@
+"""
+DuckDB による分析クエリ
+
+学習データ作成や全チャンネルの特徴量計算など、全件を走査する重い処理を
+組み込み DuckDB のベクトル化SQLで実行する。データ源は次のどちらか。
+
+- "sqlite": サービング用の SQLite ファイルを読み取り専用で ATTACH（DuckDB の sqlite 拡張を使用）
+- "parquet": scripts/export_parquet.py の出力（サービング用DBに一切触れない）。
+  集約済みの古い期間は集約テーブルのスナップショットから読む
+
+sqlite 拡張は未インストールなら初回にダウンロードする。ネットワークがなく読み込めない場合は
+Parquet エクスポートがあればそれを使い（前日までのデータ）、なければ原因と対処を示すエラーにする。
+
+duckdb は任意の依存関係で、未インストールの場合は AnalyticsEngine の作成時にエラーになる。
+"""
+import os
+import re
+from datetime import datetime
+from typing import List, Optional
+
+import pandas as pd
+from sqlalchemy.engine import make_url
+
+from app.config import settings
+from app.services.export_service import EXPORT_TABLES, SNAPSHOT_TABLES, arrow_schema, exported_dates, snapshot_path
+from ml.feature_extractor import (
+    FEATURE_SOURCE_SQL, STATS_AT_SQL, compute_features_frame, concat_snapshots, feature_source_params,
+)
+from ml.resampling import model_features, model_grid, model_grid_start, segments_frame, segments_sql
+
+try:
+    import duckdb
+except ImportError:  # pragma: no cover
+    duckdb = None
+
+SOURCE_TABLES = ["channels", "channel_stats", "channel_stats_daily", "channel_stats_weekly",
+                 "channel_stats_monthly", "predictions", "news", "trend_data"]
+
+
+def _to_duckdb_params(sql: str) -> str:
+    """SQLAlchemy 形式の :name パラメータを DuckDB の $name に置き換え"""
+    return re.sub(r"(?<![:\w]):(\w+)", r"$\1", sql)
+
+
+class AnalyticsEngine:
+    """組み込み DuckDB 上の分析ビュー"""
+
+    def __init__(self, source: str = "sqlite", database_url: Optional[str] = None,
+                 export_dir: Optional[str] = None):
+        """
+        Args:
+            source: "sqlite"（サービング用DBを読み取り専用で参照）または "parquet"
+            database_url: source="sqlite" のときの接続先（既定は settings.DATABASE_URL）
+            export_dir: source="parquet" のとき、または sqlite 拡張を読み込めないときの読み込み元（既定は settings.EXPORT_DIR）
+        """
+        if duckdb is None:
+            raise RuntimeError("duckdb がインストールされていません: pip install duckdb")
+
+        self.source = source
+        self.conn = duckdb.connect()
+
+        if source == "sqlite":
+            self._attach_sqlite(database_url or settings.DATABASE_URL, export_dir or settings.EXPORT_DIR)
+        elif source == "parquet":
+            self._attach_parquet(export_dir or settings.EXPORT_DIR)
+        else:
+            raise ValueError(f"不明なデータ源: {source}")
+
+    def _attach_sqlite(self, database_url: str, export_dir: str):
+        path = make_url(database_url).database
+        try:
+            self._load_sqlite_extension()
+        except duckdb.Error as e:
+            if not exported_dates("channel_stats", export_dir):
+                raise RuntimeError(
+                    f"DuckDB の sqlite 拡張を読み込めません（{str(e).splitlines()[0]}）。ネットワークに接続できる環境で一度実行して拡張を"
+                    "インストールするか、scripts/export_parquet.py で書き出した Parquet を使ってください（source=\"parquet\"）"
+                ) from e
+            print(f"DuckDB の sqlite 拡張を読み込めないため、Parquet エクスポート（{export_dir}、前日まで）を使います")
+            self.source = "parquet"
+            self._attach_parquet(export_dir)
+            return
+
+        self.conn.execute(f"ATTACH '{os.path.abspath(path)}' AS src (TYPE sqlite, READ_ONLY)")
+        for table in SOURCE_TABLES:
+            self.conn.execute(f"CREATE VIEW {table} AS SELECT * FROM src.{table}")
+
+    def _load_sqlite_extension(self):
+        """sqlite 拡張を読み込む（インストール済みならダウンロードしない）"""
+        try:
+            self.conn.execute("LOAD sqlite")
+        except duckdb.Error:
+            self.conn.execute("INSTALL sqlite")
+            self.conn.execute("LOAD sqlite")
+
+    def _attach_parquet(self, export_dir: str):
+        for table in EXPORT_TABLES:
+            if not exported_dates(table, export_dir):
+                self._register_empty(table)
+                continue
+            pattern = os.path.join(export_dir, table, "date=*", "*.parquet")
+            self.conn.execute(
+                f"CREATE VIEW {table} AS SELECT * EXCLUDE (date) "
+                f"FROM read_parquet('{pattern}', hive_partitioning = true)"
+            )
+
+        channels_path = snapshot_path("channels", export_dir)
+        self.conn.execute(f"CREATE VIEW channels AS SELECT * FROM read_parquet('{channels_path}')")
+
+        # 集約テーブルのスナップショットは、チャンネルの生データのパーティションより前から始まる期間の行だけを使う
+        # （集約された生データも書き出し済みならパーティションに残っているため、同じ観測を二重に読まない）
+        for table in SNAPSHOT_TABLES:
+            path = snapshot_path(table, export_dir)
+            if not os.path.exists(path):
+                self._register_empty(table)
+                continue
+            self.conn.execute(f"""
+                CREATE VIEW {table} AS
+                SELECT r.* FROM read_parquet('{path}') r
+                LEFT JOIN (SELECT channel_id, MIN(recorded_at) AS raw_start FROM channel_stats GROUP BY channel_id) raw
+                    ON raw.channel_id = r.channel_id
+                WHERE raw.raw_start IS NULL OR COALESCE(r.first_recorded_at, r.last_recorded_at) < raw.raw_start
+            """)
+
+    def _register_empty(self, table: str):
+        self.conn.register(table, arrow_schema(table).empty_table())
+
+    def query(self, sql: str, params: Optional[dict] = None) -> pd.DataFrame:
+        """任意のSQLを実行して DataFrame を返す"""
+        return self.conn.execute(sql, params or {}).df()
+
+    def extract_features(self, now: Optional[datetime] = None) -> pd.DataFrame:
+        """
+        全チャンネルの now 時点の特徴量（FeatureExtractor.extract_features と同じ値）
+
+        Returns:
+            channel_id をインデックスとする DataFrame
+        """
+        now = now or datetime.utcnow()
+        sql = _to_duckdb_params(FEATURE_SOURCE_SQL.format(channel_filter="", channel_filter_c=""))
+        source = self.query(sql, feature_source_params(now))
+        segments = segments_frame(self.query(_to_duckdb_params(segments_sql(start=True)),
+                                             {"end": now, "start": model_grid_start(now)}))
+        growth = model_features(model_grid(segments, now, source["channel_id"].to_numpy()))
+        return compute_features_frame(source, now, growth)
+
+    def extract_features_snapshots(self, anchors: List[datetime]) -> pd.DataFrame:
+        """
+        複数の基準時刻の特徴量（FeatureExtractor.extract_features_snapshots と同じ値）
+
+        基準時刻ごとにSQLを実行せず、ソーステーブルを1回読んで全基準時刻をまとめて計算する
+        （ml.backtest.PointInTimeSource）。
+
+        Returns:
+            (as_of, channel_id) をインデックスとする DataFrame
+        """
+        from ml.backtest import PointInTimeSource
+
+        if not anchors:
+            return concat_snapshots({})
+        return PointInTimeSource(query=self.query).features(anchors)
+
+    def stats_at_frame(self, at: datetime) -> pd.DataFrame:
+        """
+        全チャンネルの at 時点で観測済みの最新の統計（FeatureExtractor.stats_at_frame と同じ値）
+
+        Returns:
+            channel_id をインデックスとし、subscriber_count / view_count / video_count を持つ DataFrame
+        """
+        sql = _to_duckdb_params(STATS_AT_SQL.format(channel_filter=""))
+        return self.query(sql, {"at": at}).set_index("channel_id").astype(float)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,164 @@
+"""
+channel_stats の集約・保持期間管理
+
+生データ → 日次 → 週次 → 月次 の順に、保持期間を過ぎたデータを1段粗いテーブルへ集約し、
+集約済みの行を削除する。各段は期間の境界（日・月曜・月初）で切るため、
+1つの期間が2回に分けて集約されることは基本的にない（遅れて届いたデータは UPSERT でマージする）。
+
+各チャンネルの最新の生データ（recorded_at が最大の行、同じなら id が最大の行。後から過去の日時で
+取り込んだ行は最新にしない）は保持期間を過ぎても集約・削除しない。
+最新の統計の取得や dedup 形式での延長は生データの最新行を見るため、収集が止まったチャンネルでも残しておく
+（新しい行が届いた後の集約で他の行と同じように集約・削除される）。
+
+期間の計算に SQLite の日付関数を使うため SQLite 専用。
+"""
+from datetime import datetime, timedelta
+from typing import Dict, Optional
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.config import settings
+
+# SQLAlchemy が SQLite に保存する DateTime と同じ文字列形式で期間の開始時刻を作る
+PERIOD_EXPRESSIONS = {
+    "daily": "strftime('%Y-%m-%d 00:00:00.000000', {col})",
+    "weekly": "strftime('%Y-%m-%d 00:00:00.000000', {col}, '-6 days', 'weekday 1')",
+    "monthly": "strftime('%Y-%m-01 00:00:00.000000', {col})",
+}
+
+# 生データ（dedup形式の行は recorded_at の期間に入れ、last_confirmed_at まで観測済みとして扱う）
+RAW_SOURCE = {
+    "table": "channel_stats",
+    "time": "recorded_at",
+    "closed_at": "COALESCE(last_confirmed_at, recorded_at)",
+    "min": "subscriber_count",
+    "max": "subscriber_count",
+    "count": "1",
+    "first": "recorded_at",
+    "last": "COALESCE(last_confirmed_at, recorded_at)",
+    # 各チャンネルの最新の行（recorded_at が最大、同じなら id が最大）より新しい行があるものだけ
+    "keep": """AND EXISTS (
+        SELECT 1 FROM channel_stats newer
+        WHERE newer.channel_id = channel_stats.channel_id
+          AND (newer.recorded_at > channel_stats.recorded_at
+               OR (newer.recorded_at = channel_stats.recorded_at AND newer.id > channel_stats.id))
+    )""",
+}
+
+
+def _rollup_source(table: str) -> Dict[str, str]:
+    return {
+        "table": table,
+        "time": "period_start",
+        "closed_at": "period_start",
+        "min": "subscriber_min",
+        "max": "subscriber_max",
+        "count": "sample_count",
+        "first": "first_recorded_at",
+        "last": "last_recorded_at",
+        "keep": "",
+    }
+
+
+ROLLUP_SQL = """
+INSERT INTO {target} (
+    channel_id, period_start, subscriber_count, view_count, video_count,
+    subscriber_min, subscriber_max, sample_count, first_recorded_at, last_recorded_at
+)
+SELECT
+    channel_id,
+    period_start,
+    MAX(CASE WHEN rn = 1 THEN subscriber_count END),
+    MAX(CASE WHEN rn = 1 THEN view_count END),
+    MAX(CASE WHEN rn = 1 THEN video_count END),
+    MIN(sub_min),
+    MAX(sub_max),
+    SUM(cnt),
+    MIN(first_at),
+    MAX(last_at)
+FROM (
+    SELECT
+        channel_id,
+        {period} AS period_start,
+        subscriber_count,
+        view_count,
+        video_count,
+        {min} AS sub_min,
+        {max} AS sub_max,
+        {count} AS cnt,
+        {first} AS first_at,
+        {last} AS last_at,
+        ROW_NUMBER() OVER (
+            PARTITION BY channel_id, {period}
+            ORDER BY {time} DESC
+        ) AS rn
+    FROM {table}
+    WHERE {closed_at} < :cutoff {keep}
+)
+WHERE true
+GROUP BY channel_id, period_start
+ON CONFLICT (channel_id, period_start) DO UPDATE SET
+    subscriber_count = CASE WHEN excluded.last_recorded_at >= {target}.last_recorded_at
+        THEN excluded.subscriber_count ELSE {target}.subscriber_count END,
+    view_count = CASE WHEN excluded.last_recorded_at >= {target}.last_recorded_at
+        THEN excluded.view_count ELSE {target}.view_count END,
+    video_count = CASE WHEN excluded.last_recorded_at >= {target}.last_recorded_at
+        THEN excluded.video_count ELSE {target}.video_count END,
+    subscriber_min = MIN(excluded.subscriber_min, {target}.subscriber_min),
+    subscriber_max = MAX(excluded.subscriber_max, {target}.subscriber_max),
+    sample_count = excluded.sample_count + {target}.sample_count,
+    first_recorded_at = MIN(excluded.first_recorded_at, {target}.first_recorded_at),
+    last_recorded_at = MAX(excluded.last_recorded_at, {target}.last_recorded_at)
+"""
+
+
+def _floor_day(dt: datetime) -> datetime:
+    return dt.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _floor_week(dt: datetime) -> datetime:
+    return _floor_day(dt) - timedelta(days=dt.weekday())
+
+
+def _floor_month(dt: datetime) -> datetime:
+    return _floor_day(dt).replace(day=1)
+
+
+def _rollup(db: Session, source: Dict[str, str], target: str, period: str, cutoff: datetime) -> int:
+    """source の cutoff より前の行を target に集約して削除し、削除件数を返す"""
+    period_expr = PERIOD_EXPRESSIONS[period].format(col=source["time"])
+    sql = ROLLUP_SQL.format(target=target, period=period_expr, **source)
+    db.execute(text(sql), {"cutoff": cutoff})
+
+    result = db.execute(
+        text(f"DELETE FROM {source['table']} WHERE {source['closed_at']} < :cutoff {source['keep']}"),
+        {"cutoff": cutoff},
+    )
+    return result.rowcount
+
+
+def compact_stats(db: Session, now: Optional[datetime] = None) -> Dict[str, int]:
+    """
+    保持期間を過ぎた統計を集約
+
+    Returns:
+        各段で集約・削除した行数
+    """
+    now = now or datetime.utcnow()
+
+    raw_cutoff = _floor_day(now - timedelta(days=settings.STATS_RAW_RETENTION_DAYS))
+    daily_cutoff = _floor_week(now - timedelta(days=settings.STATS_DAILY_RETENTION_DAYS))
+    weekly_cutoff = _floor_month(now - timedelta(days=settings.STATS_WEEKLY_RETENTION_DAYS))
+
+    try:
+        result = {
+            "raw": _rollup(db, RAW_SOURCE, "channel_stats_daily", "daily", raw_cutoff),
+            "daily": _rollup(db, _rollup_source("channel_stats_daily"), "channel_stats_weekly", "weekly", daily_cutoff),
+            "weekly": _rollup(db, _rollup_source("channel_stats_weekly"), "channel_stats_monthly", "monthly", weekly_cutoff),
+        }
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    return result
@@ -0,0 +1,125 @@
+"""
+予測に使った特徴量の分布と学習時の分布の比較（ドリフトの監視）
+
+予測のたびに、チャンピオンモデルの meta.json の feature_baseline と同じビンの境界で
+入力の特徴量を数え、feature_drift_bins に日ごとに足し込む（INSERT ... ON CONFLICT で件数を加算するため、
+API のバックグラウンド予測とスクリプトの予測が同時に書いても件数は失われない）。
+特徴量ごとの行数はビンの数だけで、予測したチャンネル数によらない。
+
+レポートは直近 days 日の件数をモデルバージョン・特徴量・ビンごとに合計し、学習時の件数と PSI で比べる（ml/drift.py）。
+入力が変わったチャンネルだけを予測した回（only_dirty）もそのまま数えるため、よく更新されるチャンネルの比重が大きくなる。
+学習時の分布を記録する前に登録されたモデルは比べられない（学習し直すと記録される）。
+"""
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import Date, bindparam, text
+from sqlalchemy.orm import Session
+
+from ml.drift import bin_counts, drift_level, psi
+from ml.model_registry import ModelVersion, get_registry, horizon_registry_dir
+
+UPSERT_DRIFT_BINS_SQL = """
+INSERT INTO feature_drift_bins (model_version, horizon_days, feature, period_date, bin, count)
+VALUES (:model_version, :horizon_days, :feature, :period_date, :bin, :count)
+ON CONFLICT (model_version, horizon_days, feature, period_date, bin) DO UPDATE SET
+    count = feature_drift_bins.count + excluded.count
+"""
+
+DRIFT_BINS_SQL = """
+SELECT horizon_days, model_version, feature, bin, SUM(count) AS count
+FROM feature_drift_bins
+WHERE period_date >= :since
+GROUP BY horizon_days, model_version, feature, bin
+"""
+
+
+def record_feature_histograms(db: Session, features: pd.DataFrame, champion: Optional[ModelVersion],
+                              horizon_days: int, at: datetime) -> int:
+    """
+    予測に使った特徴量をビンごとに数えて足し込む（コミットは呼び出し側）
+
+    Args:
+        features: channel_id インデックスの特徴量（予測に渡したもの）
+        champion: 予測したモデル（None・学習時の分布がないモデルは何もしない）
+        at: 予測の時刻
+
+    Returns:
+        更新した行数
+    """
+    baseline = (champion.meta.get("feature_baseline") if champion else None) or {}
+    if features.empty or not baseline:
+        return 0
+
+    rows = []
+    for feature, reference in baseline.items():
+        if feature not in features:
+            continue
+        counts = bin_counts(features[feature].to_numpy(dtype=np.float64, na_value=np.nan), reference["edges"])
+        rows.extend(
+            {"model_version": champion.version, "horizon_days": horizon_days, "feature": feature,
+             "period_date": at.date(), "bin": int(i), "count": int(counts[i])}
+            for i in np.flatnonzero(counts)
+        )
+    if rows:
+        db.execute(text(UPSERT_DRIFT_BINS_SQL).bindparams(bindparam("period_date", type_=Date())), rows)
+    return len(rows)
+
+
+def _read_baseline(horizon_days: int, version: str) -> Optional[Dict[str, Any]]:
+    """モデルバージョンの学習時の分布（バージョンが削除された・記録がない場合は None）"""
+    try:
+        meta = get_registry(horizon_registry_dir(horizon_days)).read_meta(version)
+    except FileNotFoundError:
+        return None
+    return meta.get("feature_baseline")
+
+
+def drift_report(db: Session, days: int = 7, now: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    直近 days 日の予測の入力と学習時の分布の比較（予測期間・モデルバージョンごと）
+
+    Returns:
+        as_of, days, models（予測期間・バージョンごとの件数・最大の PSI と特徴量ごとの PSI・欠損率）
+    """
+    now = now or datetime.utcnow()
+    since = (now - timedelta(days=days - 1)).date()
+    stmt = text(DRIFT_BINS_SQL).bindparams(bindparam("since", type_=Date()))
+    counts: Dict[Tuple[int, str], Dict[str, Dict[int, int]]] = {}
+    for horizon_days, version, feature, index, count in db.execute(stmt, {"since": since}).fetchall():
+        counts.setdefault((horizon_days, version), {}).setdefault(feature, {})[index] = count
+
+    models = []
+    for (horizon_days, version), features in sorted(counts.items()):
+        baseline = _read_baseline(horizon_days, version) or {}
+        entries = []
+        for feature, observed in features.items():
+            reference = baseline.get(feature)
+            expected = np.asarray(reference["counts"] if reference else [], dtype=np.int64)
+            actual = np.zeros(len(expected), dtype=np.int64)
+            for index, count in observed.items():
+                if index < len(actual):
+                    actual[index] = count
+            value = psi(expected, actual) if reference else None
+            entries.append({
+                "feature": feature,
+                "psi": value,
+                "level": drift_level(value),
+                "observations": int(sum(observed.values())),
+                "missing_ratio": float(actual[-1] / actual.sum()) if actual.sum() else None,
+                "baseline_missing_ratio": float(expected[-1] / expected.sum()) if expected.sum() else None,
+            })
+        entries.sort(key=lambda entry: -1 if entry["psi"] is None else entry["psi"], reverse=True)
+        max_psi = max((entry["psi"] for entry in entries if entry["psi"] is not None), default=None)
+        models.append({
+            "horizon_days": horizon_days,
+            "model_version": version,
+            "observations": max((entry["observations"] for entry in entries), default=0),
+            "max_psi": max_psi,
+            "level": drift_level(max_psi),
+            "features": entries,
+        })
+
+    return {"as_of": now, "days": days, "models": models}
@@ -0,0 +1,325 @@
+"""
+分析用の Parquet エクスポート
+
+channel_stats / predictions / news / trend_data を日付パーティション
+（{EXPORT_DIR}/{テーブル}/date=YYYY-MM-DD/part-0.parquet）に書き出す。
+書き出すのは前日までの確定した日だけで、既にあるパーティションの翌日からの分を追記する。
+前回の書き出しの後に変わった行（dedup 形式で last_confirmed_at を延ばした行）と遅れて追加された行
+（過去の日付の行）は、前回の書き出し時点の最大 id と変更時刻（{テーブル}/_export_state.json）で見つけ、
+その行の日のパーティションに id で置き換えて書き直す。集約で削除された生データはパーティションに残す。
+channels と集約テーブル（日次・週次・月次）は小さいので、変わっていればスナップショットを上書きする。
+
+学習やバックテストは read_export() で必要な列・期間だけを読み、サービング用DBには触れない。
+"""
+import json
+import os
+import shutil
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+from sqlalchemy import bindparam, text, Integer, Float, DateTime
+from sqlalchemy.engine import Engine
+
+from app.config import settings
+from app.database import Base
+from app import models  # noqa: F401  テーブル定義をメタデータに登録
+
+# テーブル名: パーティションに使う時刻カラム
+EXPORT_TABLES: Dict[str, str] = {
+    "channel_stats": "recorded_at",
+    "predictions": "created_at",
+    "news": "created_at",
+    "trend_data": "recorded_at",
+}
+
+# テーブル名: 行を書き換えたときに進む時刻の式（書き換えないテーブルはパーティションの時刻カラム）
+MODIFIED_COLUMNS: Dict[str, str] = {
+    "channel_stats": "COALESCE(last_confirmed_at, recorded_at)",
+    "predictions": "created_at",
+    "news": "created_at",
+    "trend_data": "recorded_at",
+}
+
+# スナップショットとして丸ごと書き出すテーブル（channels 以外）
+SNAPSHOT_TABLES = ["channel_stats_daily", "channel_stats_weekly", "channel_stats_monthly"]
+
+DATETIME_COLUMNS: Dict[str, List[str]] = {
+    "channel_stats": ["recorded_at", "last_confirmed_at"],
+    "predictions": ["created_at"],
+    "news": ["published_at", "created_at"],
+    "trend_data": ["recorded_at"],
+    "channels": ["created_at", "updated_at"],
+    **{table: ["period_start", "first_recorded_at", "last_recorded_at"] for table in SNAPSHOT_TABLES},
+}
+
+STATE_FILE = "_export_state.json"
+
+PARTITIONING = ds.partitioning(pa.schema([("date", pa.string())]), flavor="hive")
+
+CHUNK_SIZE = 100_000
+
+
+def arrow_schema(table: str) -> pa.Schema:
+    """
+    テーブル定義から Arrow スキーマを作る
+
+    日によって全行 NULL の列があっても、パーティション間で型が揃うようにする。
+    """
+    fields = []
+    for column in Base.metadata.tables[table].columns:
+        if isinstance(column.type, Integer):
+            arrow_type = pa.int64()
+        elif isinstance(column.type, Float):
+            arrow_type = pa.float64()
+        elif isinstance(column.type, DateTime):
+            arrow_type = pa.timestamp("us")
+        else:
+            arrow_type = pa.string()
+        fields.append(pa.field(column.name, arrow_type))
+    return pa.schema(fields)
+
+
+def _table_dir(table: str, export_dir: Optional[str] = None) -> str:
+    return os.path.join(export_dir or settings.EXPORT_DIR, table)
+
+
+def exported_dates(table: str, export_dir: Optional[str] = None) -> List[str]:
+    """書き出し済みのパーティション日付（昇順）"""
+    table_dir = _table_dir(table, export_dir)
+    if not os.path.isdir(table_dir):
+        return []
+    return sorted(
+        name[len("date="):] for name in os.listdir(table_dir)
+        if name.startswith("date=")
+    )
+
+
+def snapshot_path(table: str, export_dir: Optional[str] = None) -> str:
+    """スナップショットとして書き出すテーブル（channels・集約テーブル）のファイル"""
+    return os.path.join(_table_dir(table, export_dir), f"{table}.parquet")
+
+
+def _read_state(table_dir: str) -> Optional[dict]:
+    path = os.path.join(table_dir, STATE_FILE)
+    if not os.path.exists(path):
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+
+def _write_state(table_dir: str, state: dict):
+    tmp_path = os.path.join(table_dir, f"{STATE_FILE}.tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(state, f)
+    os.replace(tmp_path, os.path.join(table_dir, STATE_FILE))
+
+
+def _write_partition(table_dir: str, date: str, frame: pd.DataFrame, schema: pa.Schema, time_column: str):
+    """
+    1日分を書き出し（途中で落ちても不完全なパーティションが残らないよう一時ディレクトリ経由）
+
+    既にパーティションがある場合は、同じ id の行を frame の行に置き換えて書き直す。
+    """
+    final_dir = os.path.join(table_dir, f"date={date}")
+    if os.path.isdir(final_dir):
+        existing = pq.read_table(os.path.join(final_dir, "part-0.parquet"), schema=schema).to_pandas()
+        frame = pd.concat([existing[~existing["id"].isin(frame["id"])], frame[schema.names]], ignore_index=True)
+        frame = frame.sort_values([time_column, "id"], ignore_index=True)
+    # "_" で始まるディレクトリは pyarrow の読み込み対象外
+    tmp_dir = os.path.join(table_dir, f"_tmp-{date}")
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    table = pa.Table.from_pandas(frame[schema.names], schema=schema, preserve_index=False)
+    pq.write_table(table, os.path.join(tmp_dir, "part-0.parquet"))
+    if os.path.isdir(final_dir):
+        shutil.rmtree(final_dir)
+    os.replace(tmp_dir, final_dir)
+
+
+def _exported_state(table: str, export_dir: Optional[str]) -> dict:
+    """
+    状態ファイルがない既存のエクスポートの最大 id と変更時刻（書き出し済みのパーティションから求める）
+    """
+    modified = MODIFIED_COLUMNS[table]
+    columns = ["id"] + [c for c in DATETIME_COLUMNS[table] if c in modified]
+    frame = read_export(table, columns=columns, export_dir=export_dir)
+    if frame.empty:
+        return {"max_id": 0, "modified_at": None}
+    if table == "channel_stats":
+        modified_at = frame["last_confirmed_at"].fillna(frame["recorded_at"]).max()
+    else:
+        modified_at = frame[columns[1]].max()
+    return {"max_id": int(frame["id"].max()), "modified_at": modified_at.isoformat(sep=" ")}
+
+
+def export_table(engine: Engine, table: str, export_dir: Optional[str] = None,
+                 now: Optional[datetime] = None) -> int:
+    """
+    1テーブルの前回の書き出しの後に追加・変更された分を日付パーティションに書き出し
+
+    前回の続きの日から前日までの行と、前日までの日の行のうち前回の書き出し時点の最大 id より後に追加された行・
+    変更時刻（MODIFIED_COLUMNS）が前回の書き出し時点の最大より後の行を読み、その日のパーティションに書き出す。
+
+    Returns:
+        書き出したパーティション数
+    """
+    time_column = EXPORT_TABLES[table]
+    modified = MODIFIED_COLUMNS[table]
+    schema = arrow_schema(table)
+    table_dir = _table_dir(table, export_dir)
+    os.makedirs(table_dir, exist_ok=True)
+
+    now = now or datetime.utcnow()
+    today = now.replace(hour=0, minute=0, second=0, microsecond=0)
+    dates = exported_dates(table, export_dir)
+    since = datetime.fromisoformat(dates[-1]) + timedelta(days=1) if dates else None
+    state = (_read_state(table_dir) or _exported_state(table, export_dir)) if dates else None
+
+    sql = f"SELECT * FROM {table} WHERE {time_column} < :until"
+    params = {"until": today}
+    if since is not None:
+        sql += f" AND ({time_column} >= :since OR id > :max_id"
+        params.update(since=since, max_id=state["max_id"])
+        if state["modified_at"] is not None:
+            sql += f" OR {modified} > :modified_at"
+            params["modified_at"] = datetime.fromisoformat(state["modified_at"])
+        sql += ")"
+    sql += f" ORDER BY {time_column}, id"
+
+    written = 0
+    pending: Optional[pd.DataFrame] = None
+
+    with engine.connect() as conn:
+        # 読み出しの前に今の最大 id と変更時刻を取っておく（読み出し中に追加・変更された行は次回に書き直す）
+        max_id, modified_at = conn.execute(text(f"SELECT MAX(id), MAX({modified}) FROM {table}")).fetchone()
+        chunks = pd.read_sql_query(
+            text(sql).bindparams(*[bindparam(name, type_=DateTime()) for name in params if name != "max_id"]),
+            conn, params=params, parse_dates=DATETIME_COLUMNS[table], chunksize=CHUNK_SIZE,
+        )
+        for chunk in chunks:
+            if chunk.empty:
+                continue
+            if pending is not None:
+                chunk = pd.concat([pending, chunk], ignore_index=True)
+
+            dates_in_chunk = chunk[time_column].dt.strftime("%Y-%m-%d")
+            last_date = dates_in_chunk.iloc[-1]
+            # チャンク末尾の日は次のチャンクに続く可能性があるので持ち越す
+            pending = chunk[dates_in_chunk == last_date]
+            complete = chunk[dates_in_chunk != last_date]
+
+            for date, frame in complete.groupby(dates_in_chunk[dates_in_chunk != last_date], sort=True):
+                _write_partition(table_dir, date, frame, schema, time_column)
+                written += 1
+
+    if pending is not None and len(pending) > 0:
+        _write_partition(table_dir, pending[time_column].iloc[0].strftime("%Y-%m-%d"), pending, schema,
+                         time_column)
+        written += 1
+
+    if max_id is not None:
+        # 書き出し時刻より後の変更時刻は次回も読み直す
+        modified_at = min(pd.Timestamp(modified_at), pd.Timestamp(now)) if modified_at is not None else None
+        _write_state(table_dir, {
+            "max_id": int(max_id),
+            "modified_at": modified_at.isoformat(sep=" ") if modified_at is not None else None,
+        })
+    return written
+
+
+def export_snapshot(engine: Engine, table: str, export_dir: Optional[str] = None) -> int:
+    """
+    集約テーブルのスナップショットを上書き（前回から行数・最大 id・件数の合計・最新時刻が変わっていなければ何もしない）
+
+    集約・削除で過去の期間の行が変わるため、パーティションに分けず丸ごと書き出す。
+
+    Returns:
+        書き出したファイル数（0 または 1）
+    """
+    table_dir = _table_dir(table, export_dir)
+    os.makedirs(table_dir, exist_ok=True)
+
+    with engine.connect() as conn:
+        signature = [None if value is None else str(value) for value in conn.execute(text(
+            f"SELECT COUNT(*), MAX(id), SUM(sample_count), MAX(last_recorded_at) FROM {table}"
+        )).fetchone()]
+        state = _read_state(table_dir)
+        if state is not None and state.get("signature") == signature and os.path.exists(snapshot_path(table, export_dir)):
+            return 0
+        frame = pd.read_sql_query(text(f"SELECT * FROM {table} ORDER BY id"), conn,
+                                  parse_dates=DATETIME_COLUMNS[table])
+
+    schema = arrow_schema(table)
+    tmp_path = os.path.join(table_dir, f"_{table}.parquet.tmp")
+    pq.write_table(pa.Table.from_pandas(frame[schema.names], schema=schema, preserve_index=False), tmp_path)
+    os.replace(tmp_path, snapshot_path(table, export_dir))
+    _write_state(table_dir, {"signature": signature})
+    return 1
+
+
+def export_channels(engine: Engine, export_dir: Optional[str] = None):
+    """channels のスナップショットを上書き"""
+    table_dir = _table_dir("channels", export_dir)
+    os.makedirs(table_dir, exist_ok=True)
+
+    with engine.connect() as conn:
+        frame = pd.read_sql_query(
+            text("SELECT id, channel_id, name, created_at, updated_at FROM channels"),
+            conn, parse_dates=DATETIME_COLUMNS["channels"],
+        )
+
+    tmp_path = os.path.join(table_dir, "_channels.parquet.tmp")
+    pq.write_table(pa.Table.from_pandas(frame, preserve_index=False), tmp_path)
+    os.replace(tmp_path, snapshot_path("channels", export_dir))
+
+
+def export_all(engine: Engine, export_dir: Optional[str] = None,
+               now: Optional[datetime] = None) -> Dict[str, int]:
+    """全テーブルを書き出し、テーブルごとの書き出しパーティション（スナップショット）数を返す"""
+    result = {table: export_table(engine, table, export_dir, now) for table in EXPORT_TABLES}
+    result.update({table: export_snapshot(engine, table, export_dir) for table in SNAPSHOT_TABLES})
+    export_channels(engine, export_dir)
+    return result
+
+
+def read_export(
+    table: str,
+    columns: Optional[List[str]] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    export_dir: Optional[str] = None,
+) -> pd.DataFrame:
+    """
+    書き出したテーブルを読み込み
+
+    Args:
+        table: テーブル名（"channels" と集約テーブルはスナップショット全体）
+        columns: 読み込む列（指定した列だけをファイルから読む）
+        start: この日以降のパーティションだけを読む
+        end: この日より前のパーティションだけを読む
+    """
+    if table == "channels" or table in SNAPSHOT_TABLES:
+        path = snapshot_path(table, export_dir)
+        if table != "channels" and not os.path.exists(path):
+            return arrow_schema(table).empty_table().select(columns or arrow_schema(table).names).to_pandas()
+        return pq.read_table(path, columns=columns).to_pandas()
+
+    schema = arrow_schema(table).append(pa.field("date", pa.string()))
+    if not exported_dates(table, export_dir):
+        return schema.empty_table().select(columns or schema.names).to_pandas()
+
+    dataset = ds.dataset(_table_dir(table, export_dir), format="parquet", schema=schema,
+                         partitioning=PARTITIONING, exclude_invalid_files=True)
+
+    condition = None
+    if start is not None:
+        condition = ds.field("date") >= start.strftime("%Y-%m-%d")
+    if end is not None:
+        upper = ds.field("date") < end.strftime("%Y-%m-%d")
+        condition = upper if condition is None else condition & upper
+
+    return dataset.to_table(columns=columns, filter=condition).to_pandas()
@@ -0,0 +1,297 @@
+"""
+特徴量の更新管理
+
+統計・ニュース・トレンドを取り込むたびに channels.features_changed_at を更新し
+（dedup モードで統計の値が前回と同じ場合は last_confirmed_at を延ばすだけで更新しない）、
+予測時は前回の予測（channels.last_predicted_at）以降に入力が変わったチャンネルだけを予測し直す。
+
+特徴量は時間の経過（集計期間のずれ・チャンネル年齢）でも少しずつ変わるため、
+最後の予測から settings.PREDICTION_MAX_AGE_DAYS 日たったチャンネルも予測し直す。
+いずれかの予測期間のチャンピオンモデルが前回の予測から変わっていれば全チャンネルを予測し直す。
+
+計算した特徴量は channel_features に1チャンネル1日1行で保存し、予測・学習・チャンネル詳細APIで使い回す。
+その日の行がないチャンネルと、行を計算した後に入力が変わったチャンネルだけを計算し直す。
+データ収集の後には全チャンネル分を float32 の行列のスナップショットとしても公開する（publish_features）。
+"""
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+from sqlalchemy import Date, DateTime, and_, bindparam, or_, text, update
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models import Channel, ChannelFeatures, Prediction, LEGACY_HORIZON_DAYS, horizon_filter
+from ml.training_data import FEATURE_SCHEMA_VERSION
+
+# last_predicted_at の一括更新・特徴量の一括読み込みで1回あたりに扱う件数
+UPDATE_CHUNK_SIZE = 500
+
+# channel_features の特徴量カラム（GrowthPredictor.FEATURE_COLUMNS と同じ順）
+FEATURE_TABLE_COLUMNS = [
+    "subscriber_count",
+    "subscriber_growth_rate_30d",
+    "subscriber_growth_rate_90d",
+    "view_count",
+    "view_growth_rate_30d",
+    "video_count",
+    "upload_frequency",
+    "avg_views_per_video",
+    "engagement_rate",
+    "trend_score",
+    "trend_direction",
+    "trend_volatility",
+    "news_count",
+    "news_positive_ratio",
+    "news_negative_ratio",
+    "channel_age_days",
+]
+
+UPSERT_FEATURES_SQL = f"""
+INSERT INTO channel_features (channel_id, as_of_date, computed_at, feature_version, {", ".join(FEATURE_TABLE_COLUMNS)})
+VALUES (:channel_id, :as_of_date, :computed_at, :feature_version, {", ".join(":" + c for c in FEATURE_TABLE_COLUMNS)})
+ON CONFLICT (channel_id, as_of_date) DO UPDATE SET
+    computed_at = excluded.computed_at,
+    feature_version = excluded.feature_version,
+    {", ".join(f"{c} = excluded.{c}" for c in FEATURE_TABLE_COLUMNS)}
+"""
+
+
+def mark_features_changed(db: Session, channel_id: int, at: Optional[datetime] = None):
+    """チャンネルの特徴量の入力が変わったことを記録（コミットは呼び出し側）"""
+    db.query(Channel).filter(Channel.id == channel_id).update(
+        {Channel.features_changed_at: at or datetime.utcnow()},
+        synchronize_session=False,
+    )
+
+
+def last_prediction_version(db: Session, horizon_days: int = LEGACY_HORIZON_DAYS) -> Optional[str]:
+    """予測期間の直近の予測バッチのモデルバージョン（予測がなければ空文字）"""
+    latest = db.query(Prediction.model_version).filter(
+        horizon_filter(Prediction, horizon_days)
+    ).order_by(Prediction.created_at.desc()).first()
+    return latest[0] if latest else ""
+
+
+def dirty_channel_ids(
+    db: Session,
+    model_versions: Dict[int, Optional[str]],
+    now: Optional[datetime] = None,
+) -> Optional[List[int]]:
+    """
+    予測し直す必要があるチャンネル
+
+    Args:
+        model_versions: {予測期間: これから予測に使うモデルのバージョン（ルールベースは None）}
+
+    Returns:
+        チャンネルのDB IDのリスト。いずれかの期間のモデルが変わった場合は全チャンネルを意味する None
+    """
+    if any(last_prediction_version(db, h) != version for h, version in model_versions.items()):
+        return None
+
+    now = now or datetime.utcnow()
+    stale_before = now - timedelta(days=settings.PREDICTION_MAX_AGE_DAYS)
+
+    rows = db.query(Channel.id).filter(or_(
+        Channel.last_predicted_at.is_(None),
+        Channel.last_predicted_at < stale_before,
+        Channel.features_changed_at > Channel.last_predicted_at,
+    )).order_by(Channel.id).all()
+    return [row[0] for row in rows]
+
+
+def mark_predicted(db: Session, channel_ids: List[int], at: datetime):
+    """
+    予測済みとして記録（コミットは呼び出し側）
+
+    at には特徴量を抽出する前の時刻を渡す（抽出中に取り込まれたデータは次回の予測対象になる）。
+    """
+    for i in range(0, len(channel_ids), UPDATE_CHUNK_SIZE):
+        chunk = [int(channel_id) for channel_id in channel_ids[i:i + UPDATE_CHUNK_SIZE]]
+        db.execute(
+            update(Channel).where(Channel.id.in_(chunk)).values(last_predicted_at=at)
+            .execution_options(synchronize_session=False)
+        )
+
+
+# ---- 特徴量の保存と読み込み ----
+
+def feature_rows(features: pd.DataFrame, computed_at: datetime) -> List[Dict[str, Any]]:
+    """channel_id インデックスの特徴量から channel_features の行を作る"""
+    from ml.feature_extractor import features_to_records
+
+    as_of_date = computed_at.date()
+    frame = features.reindex(columns=FEATURE_TABLE_COLUMNS)
+    return [
+        {"channel_id": channel_id, "as_of_date": as_of_date, "computed_at": computed_at,
+         "feature_version": FEATURE_SCHEMA_VERSION, **values}
+        for channel_id, values in features_to_records(frame).items()
+    ]
+
+
+def save_features(db: Session, features: pd.DataFrame, computed_at: datetime) -> int:
+    """
+    特徴量を channel_features に保存（同じ日の行は置き換え、コミットは呼び出し側）
+
+    Args:
+        features: computed_at 時点の特徴量（channel_id インデックス）
+        computed_at: 特徴量の基準時刻
+    """
+    rows = feature_rows(features, computed_at)
+    if rows:
+        stmt = text(UPSERT_FEATURES_SQL).bindparams(
+            bindparam("as_of_date", type_=Date()), bindparam("computed_at", type_=DateTime()))
+        db.execute(stmt, rows)
+    return len(rows)
+
+
+def refresh_features(db: Session, channel_ids: Optional[List[int]] = None,
+                     now: Optional[datetime] = None) -> pd.DataFrame:
+    """
+    特徴量を一括で計算して保存（コミットは呼び出し側）
+
+    トレンド・活動量は直近の集計（rolling_service）から読む。
+    """
+    from ml.feature_extractor import FeatureExtractor
+
+    now = now or datetime.utcnow()
+    features = FeatureExtractor(db).extract_features_frame(channel_ids, now, rolling=True)
+    save_features(db, features, now)
+    return features
+
+
+def stale_feature_ids(db: Session, now: Optional[datetime] = None) -> List[int]:
+    """その日の特徴量がない、計算方法のバージョンが古い、または計算した後に入力が変わったチャンネル"""
+    today = (now or datetime.utcnow()).date()
+    rows = db.query(Channel.id).outerjoin(
+        ChannelFeatures,
+        and_(ChannelFeatures.channel_id == Channel.id, ChannelFeatures.as_of_date == today),
+    ).filter(or_(
+        ChannelFeatures.id.is_(None),
+        ChannelFeatures.feature_version.is_(None),
+        ChannelFeatures.feature_version != FEATURE_SCHEMA_VERSION,
+        Channel.features_changed_at > ChannelFeatures.computed_at,
+    )).order_by(Channel.id).all()
+    return [row[0] for row in rows]
+
+
+def refresh_stale_features(db: Session, now: Optional[datetime] = None) -> int:
+    """
+    計算し直す必要があるチャンネルだけ特徴量を計算して保存し、件数を返す（コミットは呼び出し側）
+
+    データ収集の最後に呼ぶ。
+    """
+    now = now or datetime.utcnow()
+    stale = stale_feature_ids(db, now)
+    if not stale:
+        return 0
+    return len(refresh_features(db, stale, now))
+
+
+def load_features(db: Session, as_of_date: date,
+                  channel_ids: Optional[List[int]] = None) -> pd.DataFrame:
+    """
+    保存済みの特徴量を読み込み
+
+    Returns:
+        channel_id インデックスで FEATURE_TABLE_COLUMNS と computed_at の列を持つ DataFrame
+        （削除されたチャンネルの行・計算方法のバージョンが今と違う行は含まない）
+    """
+    columns = ["channel_id", "computed_at"] + FEATURE_TABLE_COLUMNS
+    # 削除されたチャンネルの行は読まない
+    sql = (f"SELECT {', '.join('f.' + c for c in columns)} FROM channel_features f "
+           "JOIN channels c ON c.id = f.channel_id "
+           "WHERE f.as_of_date = :as_of_date AND f.feature_version = :feature_version")
+    date_param = bindparam("as_of_date", type_=Date())
+    params = {"as_of_date": as_of_date, "feature_version": FEATURE_SCHEMA_VERSION}
+    if channel_ids is None:
+        statements = [(text(sql).bindparams(date_param), params)]
+    else:
+        stmt = text(sql + " AND f.channel_id IN :channel_ids").bindparams(
+            date_param, bindparam("channel_ids", expanding=True))
+        ids = [int(channel_id) for channel_id in dict.fromkeys(channel_ids)]
+        statements = [
+            (stmt, {**params, "channel_ids": ids[i:i + UPDATE_CHUNK_SIZE]})
+            for i in range(0, len(ids), UPDATE_CHUNK_SIZE)
+        ]
+
+    frames = [pd.DataFrame(db.execute(stmt, params).fetchall(), columns=columns) for stmt, params in statements]
+    frame = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=columns)
+    frame = frame.set_index("channel_id").sort_index()
+    frame.index = frame.index.astype(int)
+    frame[FEATURE_TABLE_COLUMNS] = frame[FEATURE_TABLE_COLUMNS].astype(float)
+    return frame
+
+
+def current_features(db: Session, channel_ids: Optional[List[int]] = None,
+                     now: Optional[datetime] = None) -> pd.DataFrame:
+    """
+    予測に使う特徴量（channel_id インデックス）
+
+    保存済みの行を読み込み、古い行・ない行だけ計算して保存する（コミットは呼び出し側）。
+    """
+    now = now or datetime.utcnow()
+    stale = stale_feature_ids(db, now)
+    if channel_ids is not None:
+        stale = sorted(set(stale) & set(int(channel_id) for channel_id in channel_ids))
+    if stale:
+        refresh_features(db, stale, now)
+    return load_features(db, now.date(), channel_ids).drop(columns=["computed_at"])
+
+
+def publish_features(db: Session, now: Optional[datetime] = None, directory: Optional[str] = None) -> str:
+    """
+    全チャンネルの現在の特徴量を行列のスナップショット（ml/feature_snapshot.py）として公開し、バージョンを返す
+
+    その日の行がない・古いチャンネルは先に計算して保存する（コミットは呼び出し側）。
+    """
+    from ml.feature_snapshot import write_snapshot
+
+    now = now or datetime.utcnow()
+    return write_snapshot(current_features(db, None, now), now, FEATURE_TABLE_COLUMNS, directory)
+
+
+def feature_snapshots(db: Session, anchors: List[datetime]) -> pd.DataFrame:
+    """
+    複数の基準時刻の特徴量（学習データ用、FeatureExtractor.extract_features_snapshots と同じ形式）
+
+    基準時刻ちょうどに計算された保存済みの行（computed_at が基準時刻と同じ）だけを使い、
+    ないチャンネルだけ基準時刻で計算して保存する（コミットは呼び出し側）。同じ日でも別の時刻に計算された行
+    （サービング用に基準時刻より後のデータで計算した行など）は使わずに計算し直して置き換える。
+    計算が必要な基準時刻はまとめて1回で計算する（FeatureExtractor.extract_features_snapshots）。
+    基準時刻より後に追加されたチャンネルは含めない。
+    """
+    from ml.feature_extractor import FeatureExtractor, concat_snapshots
+
+    channels = db.query(Channel.id, Channel.created_at).order_by(Channel.id).all()
+    stored = {}
+    missing = {}
+    for anchor in anchors:
+        ids = [channel_id for channel_id, created_at in channels if created_at <= anchor]
+        frame = load_features(db, anchor.date())
+        frame = frame[frame.index.isin(ids) & (pd.to_datetime(frame["computed_at"]) == pd.Timestamp(anchor))]
+        stored[anchor] = frame.drop(columns=["computed_at"])
+        ids = [channel_id for channel_id in ids if channel_id not in stored[anchor].index]
+        if ids:
+            missing[anchor] = ids
+
+    computed = FeatureExtractor(db).extract_features_snapshots(list(missing)) if missing else None
+    frames = {}
+    for anchor in anchors:
+        frame = stored[anchor]
+        if anchor in missing:
+            rows = computed.xs(anchor, level="as_of")
+            rows = rows[rows.index.isin(missing[anchor])]
+            save_features(db, rows, anchor)
+            frame = pd.concat([frame, rows.reindex(columns=FEATURE_TABLE_COLUMNS).astype(float)]).sort_index()
+        frames[anchor] = frame
+    return concat_snapshots(frames)
+
+
+def latest_channel_features(db: Session, channel_id: int) -> Optional[ChannelFeatures]:
+    """チャンネルの最新の特徴量の行（計算方法のバージョンが今と同じもの）"""
+    return db.query(ChannelFeatures).filter(
+        ChannelFeatures.channel_id == channel_id,
+        ChannelFeatures.feature_version == FEATURE_SCHEMA_VERSION,
+    ).order_by(ChannelFeatures.as_of_date.desc()).first()
@@ -0,0 +1,139 @@
+"""
+追加・更新されたチャンネルの予測をまとめて実行する
+
+チャンネルの追加（POST /api/channels）やデータ収集の直後に submit されたチャンネルを、
+最初の依頼から settings.PREDICTION_BATCH_WAIT_MS ミリ秒、または settings.PREDICTION_BATCH_MAX_SIZE 件まで集め、
+1回の predict_channels（特徴量の一括計算 → 全予測期間のモデルで一括予測 → 一括INSERT）で予測する。
+一括登録のように短時間に多数のチャンネルが追加されても、モデルの呼び出しはチャンネルごとではなくバッチごとになる。
+
+予測はプロセス内のバックグラウンドスレッドで行い、依頼したリクエストは予測の完了を待たない。
+前回の予測から入力が変わっていないチャンネルは予測しない（モデルが変わっていれば全チャンネルを予測し直す）。
+"""
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.database import SessionLocal
+from app.services.prediction_service import predict_channels
+
+# キューに入れる依頼: (チャンネルのDB IDのリスト, 結果を返す Future)
+Request = Tuple[List[int], Future]
+
+
+class PredictionBatcher:
+    """submit された依頼を短時間ためて、まとめて予測するバックグラウンドスレッド"""
+
+    def __init__(self, wait_ms: Optional[int] = None, max_size: Optional[int] = None,
+                 session_factory: Optional[Callable[[], Session]] = None):
+        """
+        Args:
+            wait_ms: 最初の依頼から予測を始めるまでに待つ時間（ミリ秒、省略時は settings.PREDICTION_BATCH_WAIT_MS）
+            max_size: 1回の予測のチャンネル数の上限。たまったら待たずに予測する（省略時は settings.PREDICTION_BATCH_MAX_SIZE）
+            session_factory: 予測に使うセッションを作る関数（省略時は SessionLocal）
+        """
+        self.wait = (settings.PREDICTION_BATCH_WAIT_MS if wait_ms is None else wait_ms) / 1000
+        self.max_size = max(1, max_size or settings.PREDICTION_BATCH_MAX_SIZE)
+        self.session_factory = session_factory or SessionLocal
+        self._queue: "queue.Queue[Optional[Request]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def submit(self, channel_ids: Iterable[int]) -> Future:
+        """
+        チャンネルの予測を依頼
+
+        Returns:
+            予測が保存されると {予測期間: 依頼したチャンネルの予測（channel_id インデックス）} になる Future。
+            入力が変わっていないチャンネルは結果に含まれない
+        """
+        future: Future = Future()
+        ids = [int(channel_id) for channel_id in channel_ids]
+        if not ids:
+            future.set_result({})
+            return future
+
+        self._start()
+        self._queue.put((ids, future))
+        return future
+
+    def stop(self, timeout: Optional[float] = None):
+        """キューに残っている依頼を予測してからスレッドを止める"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is None:
+            return
+        self._queue.put(None)
+        thread.join(timeout)
+
+    def _start(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="prediction-batcher", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            request = self._queue.get()
+            if request is None:
+                return
+
+            batch, stopping = self._collect(request)
+            self._flush(batch)
+            if stopping:
+                return
+
+    def _collect(self, first: Request) -> Tuple[List[Request], bool]:
+        """最初の依頼から wait 秒たつか max_size 件たまるまで依頼を集める（停止の依頼を受けたかも返す）"""
+        batch = [first]
+        size = len(first[0])
+        deadline = time.monotonic() + self.wait
+        while size < self.max_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                request = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if request is None:
+                return batch, True
+            batch.append(request)
+            size += len(request[0])
+        return batch, False
+
+    def _flush(self, batch: List[Request]):
+        """集めた依頼を max_size 件ずつ予測して保存し、依頼ごとの Future に結果を返す"""
+        channel_ids = list(dict.fromkeys(channel_id for ids, _ in batch for channel_id in ids))
+        started = time.perf_counter()
+        try:
+            parts = [self._predict(channel_ids[i:i + self.max_size])
+                     for i in range(0, len(channel_ids), self.max_size)]
+        except Exception as e:
+            print(f"予測バッチのエラー（{len(channel_ids)}チャンネル）: {e}")
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        results = {h: pd.concat([part[h] for part in parts]) for h in parts[0]}
+        predicted = max((len(result) for result in results.values()), default=0)
+        print(f"予測バッチ: {predicted}/{len(channel_ids)} チャンネル（依頼 {len(batch)}件, "
+              f"{time.perf_counter() - started:.2f}秒）")
+        for ids, future in batch:
+            future.set_result({h: result[result.index.isin(ids)] for h, result in results.items()})
+
+    def _predict(self, channel_ids: List[int]) -> Dict[int, pd.DataFrame]:
+        db = self.session_factory()
+        try:
+            return predict_channels(db, channel_ids=channel_ids, only_dirty=True)
+        finally:
+            db.close()
+
+
+# API プロセスで共有するバッチャー（最初の submit でスレッドを起動する）
+prediction_batcher = PredictionBatcher()
@@ -0,0 +1,191 @@
+"""
+成長予測の一括実行
+
+特徴量の読み込み（channel_features、古い分だけ一括抽出） → モデルの一括予測 → predictions への一括INSERT を1つの流れにまとめる。
+scripts/run_prediction.py と POST /api/admin/predict が共通で使う。
+チャンネルの追加・収集直後の予測は prediction_batcher がまとめてから呼ぶ。
+
+予測期間（settings.PREDICTION_HORIZONS）ごとのモデルで、同じ特徴量をまとめて予測する。
+チャレンジャーモデルが登録されていれば、同じ特徴量で同時に予測して shadow_predictions に保存する
+（画面・APIには出さない）。
+
+only_dirty=True の場合は feature_store.dirty_channel_ids のチャンネルだけを予測する。
+予測に使った特徴量はビンごとに数えて feature_drift_bins に足し込む（drift_service）。
+"""
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+from sqlalchemy import insert
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models import Prediction, ShadowPrediction
+from app.services.drift_service import record_feature_histograms
+from app.services.feature_store import current_features, dirty_channel_ids, mark_predicted
+from ml.predictor import GrowthPredictor
+from ml.training_data import HORIZON_DAYS
+
+# Prediction のカラム: 保存する特徴量
+PREDICTION_FEATURE_COLUMNS = {
+    "feature_subscriber_growth_rate": "subscriber_growth_rate_30d",
+    "feature_view_growth_rate": "view_growth_rate_30d",
+    "feature_upload_frequency": "upload_frequency",
+    "feature_engagement_rate": "engagement_rate",
+    "feature_trend_score": "trend_score",
+    "feature_news_count": "news_count",
+    "feature_news_sentiment": "news_positive_ratio",
+}
+
+
+def prediction_rows(features: pd.DataFrame, results: pd.DataFrame,
+                    created_at: Optional[datetime] = None,
+                    model_version: Optional[str] = None,
+                    horizon_days: int = HORIZON_DAYS) -> List[Dict[str, Any]]:
+    """
+    predictions に INSERT する行を作る
+
+    Args:
+        features: channel_id インデックスの特徴量
+        results: GrowthPredictor.predict_batch の結果（同じインデックス、contributions 列があれば保存する）
+        model_version: 予測したモデルのバージョン（ルールベースは None）
+        horizon_days: 予測期間（日）
+    """
+    created_at = created_at or datetime.utcnow()
+    stored = features.reindex(index=results.index, columns=list(PREDICTION_FEATURE_COLUMNS.values()))
+    stored = stored.astype(object).where(stored.notna(), None)
+    contributions = results["contributions"] if "contributions" in results else [None] * len(results)
+
+    rows = []
+    for channel_id, growth, confidence, explained, values in zip(
+        results.index,
+        results["predicted_growth_rate"],
+        results["confidence_score"],
+        contributions,
+        stored.itertuples(index=False, name=None),
+    ):
+        row = {
+            "channel_id": int(channel_id),
+            "predicted_growth_rate": float(growth),
+            "confidence_score": float(confidence),
+            "horizon_days": horizon_days,
+            "model_version": model_version,
+            "contributions": explained,
+            "created_at": created_at,
+        }
+        row.update(zip(PREDICTION_FEATURE_COLUMNS, values))
+        if row["feature_news_count"] is not None:
+            row["feature_news_count"] = int(row["feature_news_count"])
+        rows.append(row)
+    return rows
+
+
+def shadow_rows(results: pd.DataFrame, model_version: str, champion_version: Optional[str],
+                created_at: datetime, horizon_days: int = HORIZON_DAYS) -> List[Dict[str, Any]]:
+    """shadow_predictions に INSERT する行を作る"""
+    return [
+        {
+            "channel_id": int(channel_id),
+            "model_version": model_version,
+            "champion_version": champion_version,
+            "horizon_days": horizon_days,
+            "predicted_growth_rate": float(growth),
+            "confidence_score": float(confidence),
+            "created_at": created_at,
+        }
+        for channel_id, growth, confidence in zip(
+            results.index, results["predicted_growth_rate"], results["confidence_score"]
+        )
+    ]
+
+
+def save_predictions(db: Session, features: pd.DataFrame, results: pd.DataFrame,
+                     created_at: Optional[datetime] = None,
+                     model_version: Optional[str] = None,
+                     challengers: Optional[Dict[str, pd.DataFrame]] = None,
+                     horizon_days: int = HORIZON_DAYS) -> int:
+    """
+    予測結果を一括INSERT（コミットは呼び出し側）し、predictions の件数を返す
+
+    Args:
+        challengers: {チャレンジャーのバージョン: 予測}。shadow_predictions に保存する
+        horizon_days: 予測期間（日）
+    """
+    created_at = created_at or datetime.utcnow()
+    rows = prediction_rows(features, results, created_at, model_version, horizon_days)
+    if rows:
+        db.execute(insert(Prediction), rows)
+
+    for version, shadow in (challengers or {}).items():
+        rows_shadow = shadow_rows(shadow, version, model_version, created_at, horizon_days)
+        if rows_shadow:
+            db.execute(insert(ShadowPrediction), rows_shadow)
+    return len(rows)
+
+
+def horizon_predictors(predictor: Optional[GrowthPredictor] = None,
+                       horizons: Optional[List[int]] = None) -> Dict[int, GrowthPredictor]:
+    """予測期間ごとの GrowthPredictor（predictor を渡すとその予測期間にはそれを使う）"""
+    predictors = {h: GrowthPredictor(horizon_days=h) for h in (horizons or settings.PREDICTION_HORIZONS)
+                  if predictor is None or h != predictor.horizon_days}
+    if predictor is not None:
+        predictors[predictor.horizon_days] = predictor
+    return dict(sorted(predictors.items()))
+
+
+def predict_channels(
+    db: Session,
+    predictor: Optional[GrowthPredictor] = None,
+    features: Optional[pd.DataFrame] = None,
+    channel_ids: Optional[List[int]] = None,
+    only_dirty: bool = False,
+    horizons: Optional[List[int]] = None,
+) -> Dict[int, pd.DataFrame]:
+    """
+    チャンネルの成長予測を一括で実行して保存
+
+    特徴量は1回だけ用意し、全予測期間のモデルで同じ特徴量・同じ時刻で予測する。
+    各期間のチャンピオンとチャレンジャーも同じ特徴量で予測する。
+    チャンピオンの予測は pred_contrib で計算し、寄与の上位を predictions.contributions に保存する。
+
+    Args:
+        predictor: 予測に使うモデル（その予測期間に使う。省略時・他の期間は保存済みモデルを読み込む）
+        features: channel_id インデックスの特徴量（省略時は channel_features から読み込む）
+        channel_ids: 対象チャンネル（省略時は全チャンネル）
+        only_dirty: 前回の予測から入力が変わったチャンネルだけを予測する（モデルが変わった場合は
+                    channel_ids に関係なく全チャンネル。一部だけ新しいモデルで予測すると、
+                    残りのチャンネルのモデル変更が検知されなくなるため）
+        horizons: 予測期間（日、省略時は settings.PREDICTION_HORIZONS）
+
+    Returns:
+        {予測期間: channel_id インデックスの predicted_growth_rate, confidence_score, contributions（チャンピオンの予測）}
+    """
+    predictors = horizon_predictors(predictor, horizons)
+    started_at = datetime.utcnow()
+    states = {h: p.registry.state() for h, p in predictors.items()}
+    versions = {h: state.champion.version if state.champion else None for h, state in states.items()}
+
+    if only_dirty:
+        dirty = dirty_channel_ids(db, versions, started_at)
+        if dirty is None:
+            channel_ids = None
+        else:
+            channel_ids = dirty if channel_ids is None else sorted(set(dirty) & set(channel_ids))
+            if not channel_ids:
+                empty = pd.DataFrame(columns=GrowthPredictor.FEATURE_COLUMNS)
+                return {h: p.predict_batch(empty) for h, p in predictors.items()}
+
+    if features is None:
+        features = current_features(db, channel_ids, started_at)
+    elif channel_ids is not None:
+        features = features[features.index.isin(channel_ids)]
+
+    results = {}
+    for h, p in predictors.items():
+        version, result, challengers = p.predict_with_challengers(features, states[h], contributions=True)
+        save_predictions(db, features, result, started_at, version, challengers, h)
+        record_feature_histograms(db, features, states[h].champion, h, started_at)
+        results[h] = result
+    mark_predicted(db, [int(channel_id) for channel_id in features.index], started_at)
+    db.commit()
+    return results
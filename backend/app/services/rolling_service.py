@@ -0,0 +1,428 @@
+"""
+チャンネルごとの直近の集計（ローリング集計）
+
+統計・トレンドを取り込むたびに channel_rolling_aggregates の行を更新し、直近 window_days 日の
+件数・平均・偏差平方和（Welford 法の M2）・最初と最後の値を持っておく。
+特徴量の計算は期間内の行を読み直さずに、分散（トレンドのボラティリティ）や方向（最初と最後の差）を求める。
+
+- 取り込み（observe）: 行の値を集計に加えるだけ（期間の開始は進めない）
+- 読み出し（current_aggregate）: 期間の開始を現在時刻に合わせ、期間から外れた行だけを読んで取り除く（Welford 法の逆算）。
+  集計の行がない・期間の長さが変わった・期間が丸ごと入れ替わった場合は期間内の行から作り直す
+- 一括の読み出し（advance_aggregates）: 複数チャンネルの集計を同じように進めて channel_rolling_aggregates に書き戻す。
+  FeatureExtractor.extract_features_frame の現在時刻の特徴量（refresh_features）はこの表を結合して読む
+
+channel_stats の行はランレングス形式（recorded_at 〜 last_confirmed_at）のため、
+終了時刻（last_confirmed_at）が期間の開始以降の行を期間内の行とする。
+集計は取り込み順に更新されるため、過去の基準時刻の特徴量には使わない（呼び出し側が行を読む）。
+"""
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import DateTime, Float, bindparam, text
+from sqlalchemy.orm import Session
+
+from app.models import Channel, ChannelRollingAggregate
+
+# 一括の読み出しで1回のクエリに含めるチャンネル数（SQLite のパラメータ数上限対策）
+BULK_CHUNK_SIZE = 500
+
+
+class RollingSource:
+    """集計する指標の元の行（テーブル・値・開始と終了の時刻の式）と期間"""
+
+    def __init__(self, table: str, value: str, begin: str, end: str, window_days: int):
+        self.table = table
+        self.value = value
+        self.begin = begin
+        self.end = end
+        self.window_days = window_days
+
+
+# 指標: 元の行。FeatureExtractor の直近30日のトレンド・投稿頻度の計算に使う
+ROLLING_METRICS = {
+    "trend_score": RollingSource("trend_data", "trend_score", "recorded_at", "recorded_at", 30),
+    "video_count": RollingSource("channel_stats", "video_count", "recorded_at",
+                                 "COALESCE(last_confirmed_at, recorded_at)", 30),
+}
+
+Row = Tuple[float, datetime, datetime]
+
+
+def _rows(db: Session, source: RollingSource, channel_id: int, start: datetime,
+          until: datetime, before: Optional[datetime] = None, first_only: bool = False) -> List[Row]:
+    """
+    終了時刻が start 以降（before を指定した場合は before より前）で、開始時刻が until までの行（開始時刻順）
+
+    期間の開始をまたぐ行はチャンネルに1つしかないため、その行から後だけをインデックスで読む。
+    """
+    sql = f"""
+        SELECT {source.value} AS value, {source.begin} AS begin_at, {source.end} AS end_at
+        FROM {source.table}
+        WHERE channel_id = :channel_id
+          AND {source.begin} >= COALESCE(
+              (SELECT MAX({source.begin}) FROM {source.table}
+               WHERE channel_id = :channel_id AND {source.begin} < :start), :start)
+          AND {source.begin} <= :until AND {source.end} >= :start
+          {f"AND {source.end} < :before" if before is not None else ""}
+        ORDER BY {source.begin}
+        {"LIMIT 1" if first_only else ""}
+    """
+    params = {"channel_id": channel_id, "start": start, "until": until}
+    names = ["start", "until"]
+    if before is not None:
+        params["before"] = before
+        names.append("before")
+    stmt = text(sql).bindparams(*[bindparam(name, type_=DateTime()) for name in names]).columns(
+        value=Float(), begin_at=DateTime(), end_at=DateTime())
+    return [(float(value), begin_at, end_at) for value, begin_at, end_at in db.execute(stmt, params).fetchall()]
+
+
+def _add(aggregate: ChannelRollingAggregate, value: float, begin: datetime, end: datetime):
+    """Welford 法で1行を加え、最初・最後の値を更新"""
+    aggregate.count += 1
+    delta = value - aggregate.mean
+    aggregate.mean += delta / aggregate.count
+    aggregate.m2 += delta * (value - aggregate.mean)
+    if aggregate.first_at is None or begin < aggregate.first_at:
+        aggregate.first_value, aggregate.first_at = value, begin
+    if aggregate.last_at is None or end >= aggregate.last_at:
+        aggregate.last_value, aggregate.last_at = value, end
+
+
+def _remove(aggregate: ChannelRollingAggregate, value: float):
+    """Welford 法の逆算で1行を取り除く（最初・最後の値は呼び出し側で直す）"""
+    if aggregate.count <= 1:
+        _reset(aggregate)
+        return
+    mean = aggregate.mean
+    aggregate.count -= 1
+    aggregate.mean = (mean * (aggregate.count + 1) - value) / aggregate.count
+    aggregate.m2 = max(aggregate.m2 - (value - mean) * (value - aggregate.mean), 0.0)
+
+
+def _reset(aggregate: ChannelRollingAggregate):
+    aggregate.count = 0
+    aggregate.mean = 0.0
+    aggregate.m2 = 0.0
+    aggregate.first_value = aggregate.first_at = None
+    aggregate.last_value = aggregate.last_at = None
+
+
+def _get(db: Session, channel_id: int, metric: str) -> Optional[ChannelRollingAggregate]:
+    return db.query(ChannelRollingAggregate).filter(
+        ChannelRollingAggregate.channel_id == channel_id,
+        ChannelRollingAggregate.metric == metric,
+    ).first()
+
+
+def rebuild_aggregate(db: Session, channel_id: int, metric: str,
+                      now: Optional[datetime] = None) -> ChannelRollingAggregate:
+    """期間内の行から集計を作り直す（コミットは呼び出し側）"""
+    now = now or datetime.utcnow()
+    source = ROLLING_METRICS[metric]
+    start = now - timedelta(days=source.window_days)
+    rows = _rows(db, source, channel_id, start, now)
+
+    aggregate = _get(db, channel_id, metric)
+    created = aggregate is None
+    if created:
+        aggregate = ChannelRollingAggregate(channel_id=channel_id, metric=metric)
+        db.add(aggregate)
+    aggregate.window_days = source.window_days
+    aggregate.window_start = start
+    aggregate.updated_at = now
+    _reset(aggregate)
+    if rows:
+        values = np.array([value for value, _, _ in rows], dtype=np.float64)
+        aggregate.count = len(values)
+        aggregate.mean = float(values.mean())
+        aggregate.m2 = float(((values - values.mean()) ** 2).sum())
+        aggregate.first_value, aggregate.first_at = rows[0][0], rows[0][1]
+        last = max(rows, key=lambda row: row[2])
+        aggregate.last_value, aggregate.last_at = last[0], last[2]
+    if created:
+        # 同じセッションの後の observe が見つけられるように書き出す（autoflush しないセッションのため）
+        db.flush()
+    return aggregate
+
+
+def observe(db: Session, channel_id: int, metric: str, value: float, begin: datetime,
+            end: Optional[datetime] = None, extended_from: Optional[datetime] = None):
+    """
+    取り込んだ行を集計に反映（コミットは呼び出し側）
+
+    集計の行がまだないチャンネルは何もしない（最初の読み出しで期間内の行から作る）。
+
+    Args:
+        begin: 行の開始時刻（recorded_at）
+        end: 行の終了時刻（省略時は begin）
+        extended_from: ランレングス形式の直近行の last_confirmed_at を延長した場合の延長前の値。
+                       期間内の行なら最後の時刻だけを進め、期間から外れていた行なら加え直す
+    """
+    aggregate = _get(db, channel_id, metric)
+    if aggregate is None or aggregate.window_days != ROLLING_METRICS[metric].window_days:
+        return
+
+    end = end or begin
+    if end < aggregate.window_start:
+        return
+    if extended_from is not None and extended_from >= aggregate.window_start and aggregate.count > 0:
+        if end >= aggregate.last_at:
+            aggregate.last_value, aggregate.last_at = float(value), end
+    else:
+        _add(aggregate, float(value), begin, end)
+    aggregate.updated_at = max(aggregate.updated_at, end)
+
+
+def current_aggregate(db: Session, channel_id: int, metric: str,
+                      now: Optional[datetime] = None) -> Optional[ChannelRollingAggregate]:
+    """
+    現在の直近 window_days 日の集計（変更のコミットは呼び出し側。コミットしなくても値は正しい）
+
+    期間の開始を now - window_days に進め、期間から外れた行だけを読んで取り除く。
+
+    Returns:
+        集計。集計に now より後の行が含まれている場合（過去の時刻を指定した場合）は None
+    """
+    now = now or datetime.utcnow()
+    source = ROLLING_METRICS[metric]
+    start = now - timedelta(days=source.window_days)
+    aggregate = _get(db, channel_id, metric)
+
+    if (
+        aggregate is None
+        or aggregate.window_days != source.window_days
+        or aggregate.window_start < start - timedelta(days=source.window_days)
+    ):
+        if aggregate is not None and aggregate.updated_at > now:
+            return None
+        return rebuild_aggregate(db, channel_id, metric, now)
+    if aggregate.updated_at > now:
+        return None
+
+    if start > aggregate.window_start:
+        expired = _rows(db, source, channel_id, aggregate.window_start, aggregate.updated_at, before=start)
+        for value, _, _ in expired:
+            _remove(aggregate, value)
+        if expired and aggregate.count > 0:
+            first = _rows(db, source, channel_id, start, aggregate.updated_at, first_only=True)
+            aggregate.first_value, aggregate.first_at = (first[0][0], first[0][1]) if first else (None, None)
+        aggregate.window_start = start
+    aggregate.updated_at = now
+    return aggregate
+
+
+AGGREGATE_COLUMNS = ["window_days", "window_start", "updated_at", "count", "mean", "m2",
+                     "first_value", "first_at", "last_value", "last_at"]
+
+UPSERT_AGGREGATES_SQL = f"""
+INSERT INTO channel_rolling_aggregates (channel_id, metric, {", ".join(AGGREGATE_COLUMNS)})
+VALUES (:channel_id, :metric, {", ".join(":" + c for c in AGGREGATE_COLUMNS)})
+ON CONFLICT (channel_id, metric) DO UPDATE SET
+    {", ".join(f"{c} = excluded.{c}" for c in AGGREGATE_COLUMNS)}
+"""
+
+_DATETIME_COLUMNS = ["window_start", "updated_at", "first_at", "last_at"]
+
+
+def _bulk_rows(db: Session, source: RollingSource, metric: str, channel_ids: List[int], start: str, until: str,
+               params: dict, before: bool = False, first_only: bool = False) -> pd.DataFrame:
+    """
+    _rows の複数チャンネル版（channel_id・開始時刻順）
+
+    start / until は期間の式で、:start などのパラメータか集計の行（a）の列を指定する。
+    before を指定した場合は終了時刻が :start より前の行（期間から外れた行）だけを返す。
+    期間の開始をまたぐ行（読み始める位置）はチャンネルごとに1回だけ探す（bounds）。
+    """
+    join = ""
+    if "a." in start + until:
+        join = "JOIN channel_rolling_aggregates a ON a.channel_id = c.id AND a.metric = :metric"
+    sql = f"""
+        WITH bounds AS (
+            SELECT c.id AS channel_id, {start} AS start_at, {until} AS until_at,
+                   COALESCE((SELECT MAX({source.begin}) FROM {source.table} s
+                             WHERE s.channel_id = c.id AND {source.begin} < {start}), {start}) AS lower_at
+            FROM channels c
+            {join}
+            WHERE c.id IN :channel_ids
+        )
+        SELECT t.channel_id AS channel_id, {source.value} AS value, {source.begin} AS begin_at,
+               {source.end} AS end_at
+        FROM bounds b
+        JOIN {source.table} t ON t.channel_id = b.channel_id
+             AND {source.begin} >= b.lower_at AND {source.begin} <= b.until_at
+        WHERE {source.end} >= b.start_at
+          {f"AND {source.end} < :start" if before else ""}
+    """
+    if first_only:
+        # 期間内の最初の行の開始時刻をチャンネルごとにインデックスの順に探し、その行だけを読む
+        sql = sql.replace("FROM bounds b", f"""FROM (
+            SELECT channel_id, start_at, first_at AS lower_at, first_at AS until_at
+            FROM (
+                SELECT b.channel_id, b.start_at,
+                       (SELECT {source.begin} FROM {source.table} f
+                        WHERE f.channel_id = b.channel_id AND {source.begin} >= b.lower_at
+                          AND {source.begin} <= b.until_at AND {source.end} >= b.start_at
+                        ORDER BY {source.begin} LIMIT 1) AS first_at
+                FROM bounds b
+            ) firsts
+        ) b""")
+    stmt = text(sql + " ORDER BY channel_id, begin_at").bindparams(
+        *[bindparam(name, type_=DateTime()) for name in params], bindparam("channel_ids", expanding=True))
+    result = db.execute(stmt, {**params, "channel_ids": channel_ids, **({"metric": metric} if join else {})})
+    frame = pd.DataFrame(result.fetchall(), columns=list(result.keys()))
+    if first_only:
+        frame = frame.drop_duplicates("channel_id", ignore_index=True)
+    frame["value"] = frame["value"].astype(float)
+    for col in ["begin_at", "end_at"]:
+        frame[col] = pd.to_datetime(frame[col])
+    return frame
+
+
+def _read_aggregates(db: Session, metric: str, channel_ids: List[int]) -> pd.DataFrame:
+    """集計の行（channel_id インデックス）"""
+    stmt = text(f"""
+        SELECT channel_id, {", ".join(AGGREGATE_COLUMNS)} FROM channel_rolling_aggregates
+        WHERE metric = :metric AND channel_id IN :channel_ids
+    """).bindparams(bindparam("channel_ids", expanding=True))
+    result = db.execute(stmt, {"metric": metric, "channel_ids": channel_ids})
+    frame = pd.DataFrame(result.fetchall(), columns=list(result.keys())).set_index("channel_id")
+    for col in _DATETIME_COLUMNS:
+        frame[col] = pd.to_datetime(frame[col])
+    return frame
+
+
+def _window_aggregates(rows: pd.DataFrame) -> pd.DataFrame:
+    """期間内の行（_bulk_rows）から集計を計算（rebuild_aggregate と同じ値、channel_id インデックス）"""
+    grouped = rows.groupby("channel_id")
+    first = rows.loc[grouped["begin_at"].idxmin()].set_index("channel_id")
+    last = rows.loc[grouped["end_at"].idxmax()].set_index("channel_id")
+    count = grouped["value"].count()
+    return pd.DataFrame({
+        "count": count,
+        "mean": grouped["value"].mean(),
+        "m2": grouped["value"].var(ddof=0) * count,
+        "first_value": first["value"],
+        "first_at": first["begin_at"],
+        "last_value": last["value"],
+        "last_at": last["end_at"],
+    })
+
+
+def _remove_rows(aggregates: pd.DataFrame, expired: pd.DataFrame) -> pd.DataFrame:
+    """期間から外れた行をまとめて取り除く（_remove を行の数だけ繰り返すのと同じ値）"""
+    grouped = expired.groupby("channel_id")["value"]
+    k = grouped.count().reindex(aggregates.index, fill_value=0)
+    removed_mean = grouped.mean().reindex(aggregates.index, fill_value=0.0)
+    removed_m2 = (grouped.var(ddof=0) * grouped.count()).reindex(aggregates.index, fill_value=0.0)
+
+    n = aggregates["count"]
+    remaining = n - k
+    safe = remaining.where(remaining > 0)
+    mean = (aggregates["mean"] * n - removed_mean * k) / safe
+    m2 = aggregates["m2"] - removed_m2 - (removed_mean - mean) ** 2 * k * safe / n
+
+    out = aggregates.copy()
+    out["count"] = remaining.clip(lower=0)
+    out["mean"] = mean.fillna(0.0)
+    out["m2"] = m2.clip(lower=0).fillna(0.0)
+    empty = remaining <= 0
+    out.loc[empty, ["first_value", "first_at", "last_value", "last_at"]] = None
+    return out
+
+
+def _write_aggregates(db: Session, metric: str, aggregates: pd.DataFrame):
+    """集計を channel_rolling_aggregates に書き戻す（channel_id インデックス）"""
+    rows = []
+    for channel_id, row in zip(aggregates.index, aggregates[AGGREGATE_COLUMNS].itertuples(index=False, name=None)):
+        values = {}
+        for col, value in zip(AGGREGATE_COLUMNS, row):
+            if pd.isna(value):
+                values[col] = None
+            elif col in _DATETIME_COLUMNS:
+                values[col] = pd.Timestamp(value).to_pydatetime()
+            elif col in ("window_days", "count"):
+                values[col] = int(value)
+            else:
+                values[col] = float(value)
+        rows.append({"channel_id": int(channel_id), "metric": metric, **values})
+    stmt = text(UPSERT_AGGREGATES_SQL).bindparams(
+        *[bindparam(col, type_=DateTime()) for col in _DATETIME_COLUMNS])
+    db.execute(stmt, rows)
+
+
+def advance_aggregates(db: Session, metric: str, now: Optional[datetime] = None,
+                       channel_ids: Optional[List[int]] = None) -> List[int]:
+    """
+    複数チャンネルの集計を now の直近 window_days 日に進めて書き戻す（current_aggregate の一括版、コミットは呼び出し側）
+
+    集計の行がない・期間の長さが変わった・期間が丸ごと入れ替わったチャンネルは期間内の行から作り直し、
+    それ以外は期間から外れた行だけを読んで取り除く。
+
+    Returns:
+        集計に now より後の行が含まれていて使えないチャンネル（呼び出し側が行を読む）
+    """
+    now = now or datetime.utcnow()
+    source = ROLLING_METRICS[metric]
+    start = now - timedelta(days=source.window_days)
+    if channel_ids is None:
+        channel_ids = [row[0] for row in db.query(Channel.id).order_by(Channel.id).all()]
+    # observe の変更を書き出してから読む（autoflush しないセッションのため）
+    db.flush()
+
+    behind = []
+    for i in range(0, len(channel_ids), BULK_CHUNK_SIZE):
+        chunk = list(dict.fromkeys(channel_ids[i:i + BULK_CHUNK_SIZE]))
+        stored = _read_aggregates(db, metric, chunk)
+        future = stored.index[stored["updated_at"] > pd.Timestamp(now)]
+        behind.extend(int(channel_id) for channel_id in future)
+        stored = stored.drop(index=future)
+
+        stale = (
+            (stored["window_days"] != source.window_days)
+            | (stored["window_start"] < pd.Timestamp(start - timedelta(days=source.window_days)))
+        )
+        rebuild = [channel_id for channel_id in chunk
+                   if channel_id not in future and (channel_id not in stored.index or stale.get(channel_id))]
+        sliding = stored[~stale & (stored["window_start"] < pd.Timestamp(start))]
+        current = stored[~stale & (stored["window_start"] >= pd.Timestamp(start))]
+
+        frames = [current]
+        if rebuild:
+            rows = _bulk_rows(db, source, metric, rebuild, ":start", ":until", {"start": start, "until": now})
+            rebuilt = _window_aggregates(rows).reindex(rebuild)
+            rebuilt["count"] = rebuilt["count"].fillna(0)
+            rebuilt[["mean", "m2"]] = rebuilt[["mean", "m2"]].fillna(0.0)
+            rebuilt["window_start"] = pd.Timestamp(start)
+            frames.append(rebuilt)
+        if not sliding.empty:
+            ids = [int(channel_id) for channel_id in sliding.index]
+            expired = _bulk_rows(db, source, metric, ids, "a.window_start", "a.updated_at",
+                                 {"start": start}, before=True)
+            slid = _remove_rows(sliding, expired)
+            refresh = [int(channel_id) for channel_id in expired["channel_id"].unique()
+                       if slid.at[channel_id, "count"] > 0]
+            if refresh:
+                first = _bulk_rows(db, source, metric, refresh, ":start", "a.updated_at",
+                                   {"start": start}, first_only=True).set_index("channel_id")
+                first = first.reindex(refresh)
+                slid.loc[refresh, "first_value"] = first["value"]
+                slid.loc[refresh, "first_at"] = first["begin_at"]
+            slid["window_start"] = pd.Timestamp(start)
+            frames.append(slid)
+
+        frames = [frame for frame in frames if not frame.empty]
+        if not frames:
+            continue
+        aggregates = pd.concat(frames)
+        aggregates["window_days"] = source.window_days
+        aggregates["updated_at"] = pd.Timestamp(now)
+        _write_aggregates(db, metric, aggregates)
+
+    # 書き戻した行をセッションに読み込み済みの集計にも反映する
+    for obj in list(db.identity_map.values()):
+        if isinstance(obj, ChannelRollingAggregate) and obj.metric == metric:
+            db.expire(obj)
+    return behind
@@ -0,0 +1,291 @@
+"""
+常駐スケジューラ
+cron形式の宣言的なジョブ表に従って、収集・予測・学習を同一プロセス内で実行する
+
+停止中に実行時刻を過ぎていたジョブは、起動時にジョブ表の順に1つずつ実行してから通常の予定に戻る。
+ジョブ表は依存の順（収集 → 集約・エクスポート → 予測 → 学習）に並べる。
+"""
+import os
+import sys
+import json
+import random
+import asyncio
+import inspect
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Set
+
+
+class CronExpression:
+    """
+    5フィールドのcron式（分 時 日 月 曜日）
+
+    各フィールドは `*`, `*/n`, `a-b`, `a-b/n`, `a,b,c` をサポート。
+    曜日は 0(日)〜6(土)、7 も日曜として扱う。
+    日と曜日の両方が指定された場合は通常のcronと同様にOR条件になる。
+    """
+
+    FIELD_RANGES = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+    def __init__(self, expression: str):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"cron式は5フィールドで指定してください: {expression!r}")
+
+        self.expression = expression
+        parsed = [self._parse_field(f, lo, hi) for f, (lo, hi) in zip(fields, self.FIELD_RANGES)]
+        self.minutes, self.hours, self.days, self.months, weekdays = parsed
+        self.weekdays = {d % 7 for d in weekdays}
+        self._day_restricted = fields[2] != "*"
+        self._weekday_restricted = fields[4] != "*"
+
+    @staticmethod
+    def _parse_field(field: str, lo: int, hi: int) -> Set[int]:
+        values: Set[int] = set()
+        for part in field.split(","):
+            step = 1
+            if "/" in part:
+                part, step_str = part.split("/", 1)
+                step = int(step_str)
+                if step <= 0:
+                    raise ValueError(f"不正なステップ: {field!r}")
+
+            if part == "*":
+                start, end = lo, hi
+            elif "-" in part:
+                start_str, end_str = part.split("-", 1)
+                start, end = int(start_str), int(end_str)
+            else:
+                start = int(part)
+                end = hi if step > 1 else start
+
+            if start < lo or end > hi or start > end:
+                raise ValueError(f"範囲外の値: {field!r}")
+            values.update(range(start, end + 1, step))
+        return values
+
+    def _day_matches(self, dt: datetime) -> bool:
+        day_ok = dt.day in self.days
+        # cronの曜日は日曜=0、Pythonのweekday()は月曜=0
+        weekday_ok = (dt.weekday() + 1) % 7 in self.weekdays
+        if self._day_restricted and self._weekday_restricted:
+            return day_ok or weekday_ok
+        return day_ok and weekday_ok
+
+    def next_after(self, dt: datetime) -> datetime:
+        """dt より後で最初に一致する時刻を返す"""
+        t = dt.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = t + timedelta(days=366 * 5)
+
+        while t < limit:
+            if t.month not in self.months:
+                year, month = (t.year + 1, 1) if t.month == 12 else (t.year, t.month + 1)
+                t = t.replace(year=year, month=month, day=1, hour=0, minute=0)
+                continue
+            if not self._day_matches(t):
+                t = (t + timedelta(days=1)).replace(hour=0, minute=0)
+                continue
+            if t.hour not in self.hours:
+                t = (t + timedelta(hours=1)).replace(minute=0)
+                continue
+            if t.minute not in self.minutes:
+                t += timedelta(minutes=1)
+                continue
+            return t
+
+        raise ValueError(f"一致する時刻が見つかりません: {self.expression!r}")
+
+    def __repr__(self) -> str:
+        return f"CronExpression({self.expression!r})"
+
+
+class ScheduledJob:
+    """ジョブ表の1エントリ"""
+
+    def __init__(
+        self,
+        name: str,
+        cron: str,
+        func: Callable[[], Any],
+        jitter_seconds: int = 0,
+        catch_up: bool = True,
+    ):
+        """
+        Args:
+            name: ジョブ名（状態ファイルのキー）
+            cron: 実行スケジュール（cron式）
+            func: 実行する関数（同期関数・コルーチン関数のどちらでも可。どちらも別スレッドで実行する）
+            jitter_seconds: 実行時刻に加えるランダムな遅延の上限（秒）
+            catch_up: 停止中に実行時刻を過ぎていた場合、起動時に1回実行するか
+        """
+        self.name = name
+        self.cron = CronExpression(cron)
+        self.func = func
+        self.jitter_seconds = jitter_seconds
+        self.catch_up = catch_up
+        self.running = False
+
+
+class InstanceLock:
+    """
+    多重起動防止用のファイルロック
+
+    OSのファイルロックを使うため、プロセスが異常終了してもロックは残らない。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = None
+
+    def acquire(self) -> bool:
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        self._file = open(self.path, "a+")
+        try:
+            if sys.platform == "win32":
+                import msvcrt
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_NBLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            self._file.close()
+            self._file = None
+            return False
+
+        self._file.seek(0)
+        self._file.truncate()
+        self._file.write(str(os.getpid()))
+        self._file.flush()
+        return True
+
+    def release(self):
+        if self._file is None:
+            return
+        try:
+            if sys.platform == "win32":
+                import msvcrt
+                self._file.seek(0)
+                msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+            else:
+                import fcntl
+                fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        finally:
+            self._file.close()
+            self._file = None
+
+    def __enter__(self):
+        if not self.acquire():
+            raise RuntimeError(f"スケジューラは既に起動しています (lock: {self.path})")
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class Scheduler:
+    """宣言的なジョブ表を実行する常駐スケジューラ"""
+
+    def __init__(self, jobs: List[ScheduledJob], state_path: str):
+        names = [job.name for job in jobs]
+        if len(names) != len(set(names)):
+            raise ValueError("ジョブ名が重複しています")
+
+        self.jobs = jobs
+        self.state_path = state_path
+        self.state: Dict[str, str] = self._load_state()
+        self._tasks: Set[asyncio.Task] = set()
+
+    def _load_state(self) -> Dict[str, str]:
+        if os.path.exists(self.state_path):
+            with open(self.state_path, "r", encoding="utf-8") as f:
+                return json.load(f)
+        return {}
+
+    def _save_state(self):
+        os.makedirs(os.path.dirname(os.path.abspath(self.state_path)), exist_ok=True)
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.state, f, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+    def last_run(self, job: ScheduledJob) -> Optional[datetime]:
+        value = self.state.get(job.name)
+        return datetime.fromisoformat(value) if value else None
+
+    def is_missed(self, job: ScheduledJob, now: datetime) -> bool:
+        """前回実行後に予定時刻を過ぎていたか"""
+        last = self.last_run(job)
+        if last is None:
+            return False
+        return job.cron.next_after(last) <= now
+
+    async def run_job(self, job: ScheduledJob):
+        """ジョブを1回実行（前回の実行が終わっていなければスキップ）"""
+        if job.running:
+            print(f"[scheduler] {job.name}: 前回の実行が継続中のためスキップ")
+            return
+
+        job.running = True
+        started = datetime.now()
+        print(f"[scheduler] {job.name}: 開始 {started.strftime('%Y-%m-%d %H:%M:%S')}")
+
+        try:
+            # ジョブ本体はCPU・DBを長く使うため、コルーチン関数も別スレッドの自前のイベントループで実行し、
+            # スケジューラのイベントループ（他のジョブの予定時刻の監視）を止めない
+            if inspect.iscoroutinefunction(job.func):
+                await asyncio.to_thread(asyncio.run, job.func())
+            else:
+                await asyncio.to_thread(job.func)
+            elapsed = (datetime.now() - started).total_seconds()
+            print(f"[scheduler] {job.name}: 完了 ({elapsed:.1f}秒)")
+        except Exception as e:
+            print(f"[scheduler] {job.name}: エラー {e}")
+        finally:
+            job.running = False
+            # 失敗時も記録し、次回起動時に同じ回を繰り返し追いかけないようにする
+            self.state[job.name] = started.isoformat()
+            self._save_state()
+
+    async def catch_up(self, now: Optional[datetime] = None):
+        """
+        停止中に実行時刻を過ぎていたジョブをジョブ表の順に1つずつ実行
+
+        同時に実行すると、予測が収集前のデータを読むなど依存する処理の順序が崩れるため、前のジョブの完了を待つ。
+        """
+        now = now or datetime.now()
+        for job in self.jobs:
+            if job.catch_up and self.is_missed(job, now):
+                print(f"[scheduler] {job.name}: 停止中の実行漏れを検出、キャッチアップ実行")
+                await self.run_job(job)
+            elif self.last_run(job) is None:
+                # 初回起動時は基準時刻だけ記録する
+                self.state[job.name] = now.isoformat()
+                self._save_state()
+
+    async def _job_loop(self, job: ScheduledJob):
+        while True:
+            now = datetime.now()
+            fire_at = job.cron.next_after(now)
+            if job.jitter_seconds > 0:
+                fire_at += timedelta(seconds=random.uniform(0, job.jitter_seconds))
+            print(f"[scheduler] {job.name}: 次回 {fire_at.strftime('%Y-%m-%d %H:%M:%S')}")
+
+            await asyncio.sleep(max((fire_at - datetime.now()).total_seconds(), 0))
+            # 実行は別タスクにして、長時間ジョブ中も次の予定時刻を監視する
+            task = asyncio.create_task(self.run_job(job))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+            # 同じ分の中で二重に発火しないよう、予定時刻の分を過ぎるまで待つ
+            await asyncio.sleep(max((fire_at.replace(second=0, microsecond=0)
+                                     + timedelta(minutes=1) - datetime.now()).total_seconds(), 0))
+
+    async def run_forever(self):
+        """実行漏れのジョブを順に実行してから全ジョブのループを起動"""
+        await self.catch_up()
+        await asyncio.gather(*(self._job_loop(job) for job in self.jobs))
+
+    def find_job(self, name: str) -> ScheduledJob:
+        for job in self.jobs:
+            if job.name == name:
+                return job
+        raise KeyError(name)
@@ -0,0 +1,66 @@
+"""
+登録者数の推移が似ているチャンネル（GET /api/channels/{id}/similar）
+
+データ収集の後に全チャンネルの推移のベクトル（ml/similarity.py）を作って settings.SIMILARITY_INDEX_PATH に保存し、
+API プロセスはそのファイルをメモリに読み込んで検索する。ファイルの更新時刻とサイズが変わっていれば次の検索で読み込み直す
+（モデルのレジストリと同じ方式）。
+
+ベクトルの作成はチャンネルを BUILD_CHUNK_CHANNELS 件ずつに分けて日次グリッドを作るため、
+チャンネル数が多くてもグリッドのメモリは分けた分だけで済む。
+"""
+import os
+import threading
+from datetime import datetime, timedelta
+from typing import Optional, Tuple
+
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from ml.resampling import load_daily_grid
+from ml.similarity import (TRAJECTORY_DAYS, TRAJECTORY_POINTS, SimilarityIndex, build_index, load_index,
+                           save_index, trajectory_vectors)
+
+# ベクトルを作るときに1回の日次グリッドに含めるチャンネル数
+BUILD_CHUNK_CHANNELS = 10000
+# 期間の最初の日より前に読む観測の日数（最初の日の値を前後の観測から補間するため。月次の集約の間隔より長くする）
+LOOKBACK_DAYS = 35
+
+_lock = threading.Lock()
+_index: Optional[SimilarityIndex] = None
+_index_stat: Optional[Tuple[int, int]] = None
+
+
+def publish_similarity_index(db: Session, now: Optional[datetime] = None, path: Optional[str] = None) -> SimilarityIndex:
+    """全チャンネルの推移のベクトルから索引を作って保存"""
+    now = now or datetime.utcnow()
+    start = now - timedelta(days=TRAJECTORY_DAYS + LOOKBACK_DAYS)
+    ids = [row[0] for row in db.execute(text("SELECT id FROM channels ORDER BY id")).fetchall()]
+    parts = []
+    for i in range(0, len(ids), BUILD_CHUNK_CHANNELS):
+        grid = load_daily_grid(db, end=now, days=TRAJECTORY_DAYS,
+                               channel_ids=ids[i:i + BUILD_CHUNK_CHANNELS], start=start)
+        parts.append(trajectory_vectors(grid, TRAJECTORY_DAYS, TRAJECTORY_POINTS))
+    index = build_index(parts, now)
+    save_index(index, path or settings.SIMILARITY_INDEX_PATH)
+    return index
+
+
+def current_index() -> Optional[SimilarityIndex]:
+    """保存済みの索引（ファイルが更新されていれば読み込み直す。なければ None）"""
+    global _index, _index_stat
+    path = settings.SIMILARITY_INDEX_PATH
+    try:
+        st = os.stat(path)
+        stat = (st.st_mtime_ns, st.st_size)
+    except FileNotFoundError:
+        stat = None
+    if stat == _index_stat:
+        return _index
+
+    with _lock:
+        if stat != _index_stat:
+            _index = load_index(path) if stat else None
+            _index_stat = stat
+        return _index
+
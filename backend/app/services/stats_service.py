@@ -0,0 +1,238 @@
+"""
+チャンネル統計の時系列を扱うサービス
+
+STATS_STORAGE_MODE=dedup の場合、登録者数・視聴回数・動画数が前回と同じなら
+新しい行を追加せず、直近行の last_confirmed_at だけを更新する（ランレングス形式）。
+各行は recorded_at から次の行の recorded_at まで有効な値で、
+recorded_at と last_confirmed_at の2時点で観測されたものとして復元する。
+append モードでは last_confirmed_at = recorded_at なので、どちらの形式でも同じ読み方ができる。
+
+保持期間を過ぎた生データは日次・週次・月次テーブルに集約される（compaction_service）。
+読み出し関数は生データ → 日次 → 週次 → 月次 の順に参照し、古い期間ほど粗い解像度で返す。
+"""
+from datetime import datetime
+from typing import List, Optional
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.config import settings
+from app.models import ChannelStats, ChannelStatsDaily, ChannelStatsWeekly, ChannelStatsMonthly
+from app.services.feature_store import mark_features_changed
+from app.services.rolling_service import observe
+
+# 細かい順
+ROLLUP_MODELS = [ChannelStatsDaily, ChannelStatsWeekly, ChannelStatsMonthly]
+
+
+class StatsPoint:
+    """ある時点で観測された統計値（ChannelStatsResponse と同じ属性を持つ）"""
+
+    __slots__ = ("subscriber_count", "view_count", "video_count", "recorded_at")
+
+    def __init__(self, subscriber_count: int, view_count: int, video_count: int, recorded_at: datetime):
+        self.subscriber_count = subscriber_count
+        self.view_count = view_count
+        self.video_count = video_count
+        self.recorded_at = recorded_at
+
+
+def last_confirmed_column():
+    """last_confirmed_at（旧データでNULLの場合は recorded_at）"""
+    return func.coalesce(ChannelStats.last_confirmed_at, ChannelStats.recorded_at)
+
+
+def _last_confirmed(stats: ChannelStats) -> datetime:
+    return stats.last_confirmed_at or stats.recorded_at
+
+
+def record_stats(
+    db: Session,
+    channel_id: int,
+    subscriber_count: int,
+    view_count: int,
+    video_count: int,
+    recorded_at: Optional[datetime] = None,
+) -> ChannelStats:
+    """
+    統計を記録
+
+    dedup モードで値が直近行と同じ場合は、その行の last_confirmed_at を更新して返す
+    （特徴量の入力は変わらないため、予測し直す対象にはしない）。
+    新しい行を追加した場合はチャンネルを予測し直す対象にする。
+    どちらの場合も直近の集計（rolling_service）に反映する。
+    """
+    now = recorded_at or datetime.utcnow()
+
+    if settings.STATS_STORAGE_MODE == "dedup":
+        latest = db.query(ChannelStats).filter(
+            ChannelStats.channel_id == channel_id
+        ).order_by(ChannelStats.recorded_at.desc()).first()
+
+        if (
+            latest
+            and latest.subscriber_count == subscriber_count
+            and latest.view_count == view_count
+            and latest.video_count == video_count
+            and _last_confirmed(latest) <= now
+        ):
+            observe(db, channel_id, "video_count", video_count, latest.recorded_at, now,
+                    extended_from=_last_confirmed(latest))
+            latest.last_confirmed_at = now
+            return latest
+
+    stats = ChannelStats(
+        channel_id=channel_id,
+        subscriber_count=subscriber_count,
+        view_count=view_count,
+        video_count=video_count,
+        recorded_at=now,
+        last_confirmed_at=now,
+    )
+    db.add(stats)
+    observe(db, channel_id, "video_count", video_count, now)
+    mark_features_changed(db, channel_id)
+    return stats
+
+
+def expand_points(
+    rows: List[ChannelStats],
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+) -> List[StatsPoint]:
+    """
+    行を観測点に展開（古い順）
+
+    Args:
+        rows: recorded_at 昇順の行
+        start: 指定した場合、これより前の観測は start 時点に切り詰める
+        end: 指定した場合、これより後の観測は end 時点に切り詰める
+    """
+    points = []
+    for row in rows:
+        begin = row.recorded_at
+        last = _last_confirmed(row)
+        if start is not None:
+            if last < start:
+                continue
+            begin = max(begin, start)
+        if end is not None:
+            if begin > end:
+                continue
+            last = min(last, end)
+
+        points.append(StatsPoint(row.subscriber_count, row.view_count, row.video_count, begin))
+        if last != begin:
+            points.append(StatsPoint(row.subscriber_count, row.view_count, row.video_count, last))
+    return points
+
+
+def latest_point(db: Session, channel_id: int) -> Optional[StatsPoint]:
+    """最新の観測値（観測時刻は last_confirmed_at）"""
+    latest = db.query(ChannelStats).filter(
+        ChannelStats.channel_id == channel_id
+    ).order_by(ChannelStats.recorded_at.desc()).first()
+
+    if not latest:
+        return None
+    return StatsPoint(latest.subscriber_count, latest.view_count, latest.video_count, _last_confirmed(latest))
+
+
+def get_window_points(
+    db: Session,
+    channel_id: int,
+    start: datetime,
+    end: Optional[datetime] = None,
+) -> List[StatsPoint]:
+    """start 以降（end を指定した場合は end まで）の観測点（古い順）"""
+    query = db.query(ChannelStats).filter(
+        ChannelStats.channel_id == channel_id,
+        last_confirmed_column() >= start
+    )
+    if end is not None:
+        query = query.filter(ChannelStats.recorded_at <= end)
+
+    return expand_points(query.order_by(ChannelStats.recorded_at).all(), start, end)
+
+
+def _rollup_point(row) -> StatsPoint:
+    return StatsPoint(row.subscriber_count, row.view_count, row.video_count, row.last_recorded_at)
+
+
+def stats_at(db: Session, channel_id: int, at: datetime) -> Optional[StatsPoint]:
+    """
+    at 時点で観測済みの最新の値
+
+    生データになければ集約テーブルを細かい順に探す。
+    集約行は期間内の最後の観測値を last_recorded_at 時点の観測として扱う。
+    """
+    row = db.query(ChannelStats).filter(
+        ChannelStats.channel_id == channel_id,
+        ChannelStats.recorded_at <= at
+    ).order_by(ChannelStats.recorded_at.desc()).first()
+
+    if row:
+        return StatsPoint(row.subscriber_count, row.view_count, row.video_count, row.recorded_at)
+
+    for model in ROLLUP_MODELS:
+        rollup = db.query(model).filter(
+            model.channel_id == channel_id,
+            model.last_recorded_at <= at
+        ).order_by(model.last_recorded_at.desc()).first()
+        if rollup:
+            return _rollup_point(rollup)
+
+    return None
+
+
+def get_stats_series(
+    db: Session,
+    channel_id: int,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+) -> List[StatsPoint]:
+    """
+    期間内の観測点（古い順）
+
+    集約済みの期間は集約テーブルから返すため、古い期間ほど点の間隔が粗くなる。
+    """
+    points: List[StatsPoint] = []
+
+    for model in reversed(ROLLUP_MODELS):
+        query = db.query(model).filter(model.channel_id == channel_id)
+        if start is not None:
+            query = query.filter(model.last_recorded_at >= start)
+        if end is not None:
+            query = query.filter(model.last_recorded_at <= end)
+        points.extend(_rollup_point(r) for r in query.order_by(model.last_recorded_at).all())
+
+    query = db.query(ChannelStats).filter(ChannelStats.channel_id == channel_id)
+    if start is not None:
+        query = query.filter(last_confirmed_column() >= start)
+    if end is not None:
+        query = query.filter(ChannelStats.recorded_at <= end)
+    raw_points = expand_points(query.order_by(ChannelStats.recorded_at).all(), start)
+    if end is not None:
+        raw_points = [p for p in raw_points if p.recorded_at <= end]
+    points.extend(raw_points)
+
+    points.sort(key=lambda p: p.recorded_at)
+    return points
+
+
+def get_stats_history(db: Session, channel_id: int, limit: int = 180) -> List[StatsPoint]:
+    """直近 limit 件の観測点（新しい順）。生データで足りない分は集約テーブルから補う"""
+    rows = db.query(ChannelStats).filter(
+        ChannelStats.channel_id == channel_id
+    ).order_by(ChannelStats.recorded_at.desc()).limit(limit).all()
+
+    points = list(reversed(expand_points(list(reversed(rows)))))[:limit]
+
+    for model in ROLLUP_MODELS:
+        if len(points) >= limit:
+            break
+        rollups = db.query(model).filter(
+            model.channel_id == channel_id
+        ).order_by(model.last_recorded_at.desc()).limit(limit - len(points)).all()
+        points.extend(_rollup_point(r) for r in rollups)
+
+    return points
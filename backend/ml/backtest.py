@@ -0,0 +1,400 @@
+"""
+バックテスト（過去の基準時刻での予測の再現）
+
+過去の多数の基準時刻について、その時点までに観測されたデータだけで特徴量を計算してモデル
+（またはルールベース）で予測し、実際の horizon_days 日後の登録者成長率と比べる。
+
+特徴量は FeatureExtractor.extract_features_frame と同じ値を、基準時刻ごとにSQLを実行せずに計算する
+（PointInTimeSource）。ソーステーブルを1回だけ読み込み、全チャンネル × 全基準時刻の
+「その時点で観測済みの最新の行」「期間内の最初・最後の行」を pandas.merge_asof でまとめて探し、
+期間内の件数・合計は累積和の差で求める。成長率・投稿頻度は読み込み済みの観測から基準時刻ごとに
+日次グリッド（ml.resampling.model_grid）を作って計算する。予測は基準時刻の塊ごとに1回のモデル呼び出しで行う。
+
+前提: channel_stats の各チャンネルの行は recorded_at 順に並べると
+COALESCE(last_confirmed_at, recorded_at) も昇順になる（ランレングス形式の行は期間が重ならない）。
+"""
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+from ml.feature_extractor import FEATURE_SOURCE_COLUMNS, compute_features_frame, concat_snapshots
+from ml.model_registry import ModelVersion
+from ml.predictor import GrowthPredictor
+from ml.resampling import model_features, model_grid
+
+# 1回の特徴量計算・予測で扱う基準時刻の数（メモリ使用量はチャンネル数 × この数に比例する）
+ANCHOR_CHUNK_SIZE = 32
+# 上位の一致率（top_precision）で上位とみなす割合
+TOP_FRACTION = 0.1
+
+COUNT_COLUMNS = ["subscriber_count", "view_count", "video_count"]
+ROLLUP_TABLES = ["channel_stats_daily", "channel_stats_weekly", "channel_stats_monthly"]
+POSITIVE_NEWS_CATEGORIES = ("collaboration", "media", "event")
+
+
+def _session_query(db: Session) -> Callable[[str], pd.DataFrame]:
+    """DBセッションでSQLを実行して DataFrame を返す関数"""
+    def query(sql: str) -> pd.DataFrame:
+        result = db.execute(text(sql))
+        return pd.DataFrame(result.fetchall(), columns=list(result.keys()))
+    return query
+
+
+def _read_frame(query: Callable[[str], pd.DataFrame], sql: str, time_columns: List[str]) -> pd.DataFrame:
+    """SQLの結果を DataFrame にし、時刻の列を datetime64[ns] にする（時刻が NULL の行は除く）"""
+    frame = query(sql)
+    for col in time_columns:
+        frame[col] = pd.to_datetime(frame[col], format="ISO8601").astype("datetime64[ns]")
+    frame = frame.dropna(subset=time_columns).reset_index(drop=True)
+    frame["channel_id"] = frame["channel_id"].astype(np.int64)
+    frame["pos"] = np.arange(len(frame), dtype=np.int64)
+    return frame
+
+
+def _prefix_sum(values: np.ndarray) -> np.ndarray:
+    """values[:k] の合計を k 番目に持つ累積和（長さ len(values) + 1）"""
+    return np.concatenate([[0], np.cumsum(values, dtype=np.float64)])
+
+
+class PointInTimeSource:
+    """
+    ソーステーブルを1回だけ読み込み、任意の基準時刻の特徴量をまとめて計算する
+
+    FEATURE_SOURCE_SQL と同じ集計（stats_service.stats_at の優先順位、直近30日の観測点、
+    直近30日のトレンド、直近90日のニュース）を、SQLを基準時刻ごとに実行せずに行う。
+    """
+
+    def __init__(self, db: Optional[Session] = None,
+                 query: Optional[Callable[[str], pd.DataFrame]] = None):
+        """
+        Args:
+            db: DBセッション
+            query: db の代わりにSQLを実行して DataFrame を返す関数（AnalyticsEngine.query など）
+        """
+        query = query or _session_query(db)
+        self.channels = _read_frame(
+            query, "SELECT id AS channel_id, created_at AS channel_created_at FROM channels ORDER BY id",
+            ["channel_created_at"],
+        )
+        self.raw = _read_frame(query, """
+            SELECT channel_id, recorded_at, COALESCE(last_confirmed_at, recorded_at) AS confirmed_at,
+                   subscriber_count, view_count, video_count
+            FROM channel_stats ORDER BY channel_id, recorded_at
+        """, ["recorded_at", "confirmed_at"])
+        self.rollups = [
+            _read_frame(query, f"""
+                SELECT channel_id, last_recorded_at AS observed_at, subscriber_count, view_count, video_count
+                FROM {table} ORDER BY channel_id, last_recorded_at
+            """, ["observed_at"])
+            for table in ROLLUP_TABLES
+        ]
+        self.trends = _read_frame(
+            query, "SELECT channel_id, recorded_at, trend_score FROM trend_data ORDER BY channel_id, recorded_at",
+            ["recorded_at"],
+        )
+        self.news = _read_frame(
+            query, "SELECT channel_id, created_at, category FROM news ORDER BY channel_id, created_at",
+            ["created_at"],
+        )
+
+        # 観測点が1つ（recorded_at = last_confirmed_at）の行の累積数
+        self._raw_single = _prefix_sum((self.raw["recorded_at"] == self.raw["confirmed_at"]).to_numpy())
+        scores = self.trends["trend_score"].to_numpy(dtype=np.float64)
+        self._trend_sum = _prefix_sum(scores)
+        self._trend_sq_sum = _prefix_sum(scores * scores)
+        category = self.news["category"]
+        self._news_positive = _prefix_sum(category.isin(POSITIVE_NEWS_CATEGORIES).to_numpy())
+        self._news_negative = _prefix_sum((category == "controversy").to_numpy())
+        self._sorted: Dict[tuple, pd.DataFrame] = {}
+        # 日次グリッド用の「同じ値だった期間」（ml.resampling.segments_sql と同じ形式）
+        self.segments = pd.concat(
+            [self.raw.rename(columns={"recorded_at": "begin_at", "confirmed_at": "end_at"})]
+            + [frame.assign(begin_at=frame["observed_at"], end_at=frame["observed_at"]) for frame in self.rollups],
+            ignore_index=True,
+        )[["channel_id", "begin_at", "end_at"] + COUNT_COLUMNS]
+
+    @property
+    def channel_ids(self) -> np.ndarray:
+        return self.channels["channel_id"].to_numpy()
+
+    def _positions(self, name: str, events: pd.DataFrame, on: str,
+                   channel_ids: np.ndarray, times: np.ndarray, direction: str) -> np.ndarray:
+        """
+        (チャンネル, 時刻) ごとに同じチャンネルの events の行位置（なければ -1）
+
+        direction="backward" は on <= 時刻 の最後の行、"forward" は on >= 時刻 の最初の行。
+        """
+        key = (name, on)
+        if key not in self._sorted:
+            self._sorted[key] = events[["channel_id", on, "pos"]].sort_values(on, kind="stable")
+        queries = pd.DataFrame({"channel_id": channel_ids, "at": times, "order": np.arange(len(times))})
+        merged = pd.merge_asof(
+            queries.sort_values("at", kind="stable"), self._sorted[key],
+            left_on="at", right_on=on, by="channel_id", direction=direction,
+        )
+        positions = np.full(len(times), -1, dtype=np.int64)
+        found = merged["pos"].notna().to_numpy()
+        positions[merged["order"].to_numpy()[found]] = merged["pos"].to_numpy()[found].astype(np.int64)
+        return positions
+
+    def stats_at(self, channel_ids: np.ndarray, times: np.ndarray) -> pd.DataFrame:
+        """
+        (チャンネル, 時刻) ごとの観測済みの最新の統計（FeatureExtractor.stats_at_frame の一括版）
+
+        Returns:
+            入力と同じ順の subscriber_count / view_count / video_count（なければ NaN）
+        """
+        values = np.full((len(times), len(COUNT_COLUMNS)), np.nan)
+        found = np.zeros(len(times), dtype=bool)
+        tiers = [("raw", self.raw, "recorded_at")] + [
+            (table, frame, "observed_at") for table, frame in zip(ROLLUP_TABLES, self.rollups)
+        ]
+        for name, frame, on in tiers:
+            if frame.empty:
+                continue
+            pos = self._positions(name, frame, on, channel_ids, times, "backward")
+            take = ~found & (pos >= 0)
+            values[take] = frame[COUNT_COLUMNS].to_numpy(dtype=np.float64)[pos[take]]
+            found |= take
+        return pd.DataFrame(values, columns=COUNT_COLUMNS)
+
+    def _range(self, name: str, events: pd.DataFrame, on: str, channel_ids: np.ndarray,
+               start: np.ndarray, end: np.ndarray, start_on: Optional[str] = None):
+        """start <= on（start_on を指定した場合は start <= start_on）かつ on <= end の行の範囲（最初・最後の位置と有無）"""
+        if events.empty:
+            empty = np.full(len(channel_ids), -1, dtype=np.int64)
+            return empty, empty, np.zeros(len(channel_ids), dtype=bool)
+        first = self._positions(name, events, start_on or on, channel_ids, start, "forward")
+        last = self._positions(name, events, on, channel_ids, end, "backward")
+        return first, last, (first >= 0) & (last >= 0) & (first <= last)
+
+    def feature_source(self, anchors: List[datetime]) -> pd.DataFrame:
+        """
+        全チャンネル × 基準時刻の FEATURE_SOURCE_SQL と同じ列（と as_of 列）
+
+        Returns:
+            基準時刻順・channel_id 順の DataFrame
+        """
+        ids = self.channel_ids
+        anchors = sorted(anchors)
+        channel_ids = np.tile(ids, len(anchors))
+        now = np.repeat(pd.to_datetime(anchors).to_numpy(dtype="datetime64[ns]"), len(ids))
+        t30 = now - np.timedelta64(30, "D")
+        t90 = now - np.timedelta64(90, "D")
+
+        source = pd.DataFrame({"as_of": now, "channel_id": channel_ids})
+        source["channel_created_at"] = np.tile(self.channels["channel_created_at"].to_numpy(), len(anchors))
+        latest = self.stats_at(channel_ids, now)
+        source["latest_subscriber"] = latest["subscriber_count"].to_numpy()
+        source["latest_view"] = latest["view_count"].to_numpy()
+        source["latest_video"] = latest["video_count"].to_numpy()
+
+        self._add_activity(source, channel_ids, t30, now)
+        self._add_trends(source, channel_ids, t30, now)
+        self._add_news(source, channel_ids, t90, now)
+        return source[["as_of"] + FEATURE_SOURCE_COLUMNS]
+
+    def _add_activity(self, source: pd.DataFrame, channel_ids: np.ndarray,
+                      start: np.ndarray, end: np.ndarray):
+        """直近30日の観測点（stats_service.get_window_points で展開した点）の集計"""
+        first, last, valid = self._range("raw", self.raw, "recorded_at", channel_ids, start, end,
+                                         start_on="confirmed_at")
+        recorded = self.raw["recorded_at"].to_numpy()
+        confirmed = self.raw["confirmed_at"].to_numpy()
+        f, l, a, b = first[valid], last[valid], start[valid], end[valid]
+
+        # 最初の行は start に、最後の行は end に切り詰める（間の行はそのまま2点、同じ時刻なら1点）
+        begin_first = np.maximum(recorded[f], a)
+        end_first = np.minimum(confirmed[f], b)
+        begin_last = np.maximum(recorded[l], a)
+        end_last = np.minimum(confirmed[l], b)
+        rows = l - f + 1
+        interior_single = np.where(rows >= 2, self._raw_single[l] - self._raw_single[np.minimum(f + 1, l)], 0)
+        points = 2 * rows - interior_single - (begin_first == end_first) - (begin_last == end_last)
+        points = np.where(rows == 1, np.where(begin_first == end_last, 1, 2), points)
+
+        def column(values, dtype="float64"):
+            out = np.full(len(valid), np.nan if dtype == "float64" else np.datetime64("NaT"), dtype=dtype)
+            out[valid] = values
+            return out
+
+        counts = self.raw[COUNT_COLUMNS].to_numpy(dtype=np.float64)
+        source["activity_points"] = column(points)
+        source["activity_last_at"] = column(end_last, "datetime64[ns]")
+        source["activity_last_subscriber"] = column(counts[l, 0])
+        source["activity_last_view"] = column(counts[l, 1])
+        source["activity_last_video"] = column(counts[l, 2])
+
+    def _add_trends(self, source: pd.DataFrame, channel_ids: np.ndarray,
+                    start: np.ndarray, end: np.ndarray):
+        """直近30日のトレンドスコアの件数・最初・最後・分散"""
+        first, last, valid = self._range("trends", self.trends, "recorded_at", channel_ids, start, end)
+        scores = self.trends["trend_score"].to_numpy(dtype=np.float64)
+        f, l = first[valid], last[valid]
+        count = (l - f + 1).astype(np.float64)
+        mean = (self._trend_sum[l + 1] - self._trend_sum[f]) / count
+        variance = (self._trend_sq_sum[l + 1] - self._trend_sq_sum[f]) / count - mean * mean
+
+        for col, values in [("trend_count", count), ("trend_first", scores[f]),
+                            ("trend_last", scores[l]), ("trend_variance", variance)]:
+            out = np.full(len(valid), np.nan)
+            out[valid] = values
+            source[col] = out
+
+    def _add_news(self, source: pd.DataFrame, channel_ids: np.ndarray,
+                  start: np.ndarray, end: np.ndarray):
+        """直近90日のニュースの件数とポジティブ・ネガティブの件数"""
+        first, last, valid = self._range("news", self.news, "created_at", channel_ids, start, end)
+        f, l = first[valid], last[valid]
+        for col, values in [("news_count", (l - f + 1).astype(np.float64)),
+                            ("news_positive", self._news_positive[l + 1] - self._news_positive[f]),
+                            ("news_negative", self._news_negative[l + 1] - self._news_negative[f])]:
+            out = np.full(len(valid), np.nan)
+            out[valid] = values
+            source[col] = out
+
+    def features(self, anchors: List[datetime]) -> pd.DataFrame:
+        """
+        全チャンネルの複数の基準時刻の特徴量（FeatureExtractor.extract_features_snapshots と同じ形式）
+
+        Returns:
+            (as_of, channel_id) をインデックスとする DataFrame
+        """
+        source = self.feature_source(anchors)
+        frames = {}
+        for anchor, group in source.groupby("as_of", sort=True):
+            anchor = pd.Timestamp(anchor).to_pydatetime()
+            growth = model_features(model_grid(self.segments, anchor, self.channel_ids))
+            frames[anchor] = compute_features_frame(group.drop(columns="as_of"), anchor, growth)
+        return concat_snapshots(frames)
+
+    def growth_labels(self, features: pd.DataFrame, horizon_days: int) -> pd.Series:
+        """
+        (as_of, channel_id) インデックスの特徴量に対する horizon_days 日後までの実際の登録者成長率（%）
+
+        training_data.growth_labels と同じ式。基準時刻の登録者数が0以下・後の統計がない行は NaN。
+        """
+        as_of = features.index.get_level_values("as_of").to_numpy(dtype="datetime64[ns]")
+        channel_ids = features.index.get_level_values("channel_id").to_numpy(dtype=np.int64)
+        future = self.stats_at(channel_ids, as_of + np.timedelta64(horizon_days, "D"))["subscriber_count"].to_numpy()
+        base = features["subscriber_count"].to_numpy(dtype=np.float64)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            growth = np.where(base > 0, (future - base) / base * 100, np.nan)
+        return pd.Series(growth, index=features.index, name="actual_growth_rate")
+
+
+def backtest_anchors(
+    now: Optional[datetime] = None,
+    horizon_days: int = 180,
+    days: int = 365,
+    step_days: int = 1,
+) -> List[datetime]:
+    """正解が確定している最新の基準時刻（now の horizon_days 日前）から days 日分さかのぼる基準時刻（古い順）"""
+    latest = (now or datetime.utcnow()) - timedelta(days=horizon_days)
+    return [latest - timedelta(days=offset) for offset in reversed(range(0, days, step_days))]
+
+
+def replay(
+    source: PointInTimeSource,
+    predictor: GrowthPredictor,
+    models: Dict[str, Optional[ModelVersion]],
+    anchors: List[datetime],
+    chunk_size: int = ANCHOR_CHUNK_SIZE,
+) -> pd.DataFrame:
+    """
+    基準時刻ごとの予測を再現して実際の成長率と並べる
+
+    Args:
+        models: {表示名: モデルのバージョン（None はルールベース）}
+        anchors: 基準時刻（正解が確定しているもの）
+
+    Returns:
+        model, as_of, channel_id, predicted_growth_rate, actual_growth_rate の DataFrame
+        （実際の成長率が計算できない行は含まない）
+    """
+    anchors = sorted(anchors)
+    results = []
+    for i in range(0, len(anchors), chunk_size):
+        features = source.features(anchors[i:i + chunk_size])
+        actual = source.growth_labels(features, predictor.horizon_days)
+        features = features[actual.notna().to_numpy()]
+        if features.empty:
+            continue
+        actual = actual[actual.notna()].to_numpy()
+        for name, result in predictor.predict_versions(features, models).items():
+            results.append(pd.DataFrame({
+                "model": name,
+                "as_of": result.index.get_level_values("as_of"),
+                "channel_id": result.index.get_level_values("channel_id"),
+                "predicted_growth_rate": result["predicted_growth_rate"].to_numpy(),
+                "actual_growth_rate": actual,
+            }))
+
+    if not results:
+        return pd.DataFrame(columns=["model", "as_of", "channel_id", "predicted_growth_rate", "actual_growth_rate"])
+    return pd.concat(results, ignore_index=True)
+
+
+def backtest_metrics(replayed: pd.DataFrame, top_fraction: float = TOP_FRACTION) -> pd.DataFrame:
+    """
+    モデル・基準時刻ごとの誤差と順位の一致度
+
+    Returns:
+        model, as_of, channels, mae, rmse, bias（予測 - 実際の平均）,
+        rank_corr（スピアマンの順位相関）, top_precision（予測の上位 top_fraction のうち実際も上位の割合）
+    """
+    df = replayed[["model", "as_of", "predicted_growth_rate", "actual_growth_rate"]].copy()
+    groups = df.groupby(["model", "as_of"], sort=True)
+    error = df["predicted_growth_rate"] - df["actual_growth_rate"]
+    df["abs_error"] = error.abs()
+    df["sq_error"] = error * error
+    df["error"] = error
+
+    rank_pred = groups["predicted_growth_rate"].rank()
+    rank_actual = groups["actual_growth_rate"].rank()
+    df["rank_pred"] = rank_pred
+    df["rank_actual"] = rank_actual
+    df["rank_pred_sq"] = rank_pred * rank_pred
+    df["rank_actual_sq"] = rank_actual * rank_actual
+    df["rank_product"] = rank_pred * rank_actual
+    top_pred = groups["predicted_growth_rate"].rank(ascending=False, pct=True) <= top_fraction
+    top_actual = groups["actual_growth_rate"].rank(ascending=False, pct=True) <= top_fraction
+    df["top_pred"] = top_pred.astype(float)
+    df["top_hit"] = (top_pred & top_actual).astype(float)
+
+    agg = df.groupby(["model", "as_of"], sort=True).agg(
+        channels=("error", "size"),
+        mae=("abs_error", "mean"),
+        mse=("sq_error", "mean"),
+        bias=("error", "mean"),
+        rank_pred=("rank_pred", "mean"),
+        rank_actual=("rank_actual", "mean"),
+        rank_pred_sq=("rank_pred_sq", "mean"),
+        rank_actual_sq=("rank_actual_sq", "mean"),
+        rank_product=("rank_product", "mean"),
+        top_pred=("top_pred", "sum"),
+        top_hit=("top_hit", "sum"),
+    )
+    covariance = agg["rank_product"] - agg["rank_pred"] * agg["rank_actual"]
+    spread = np.sqrt((agg["rank_pred_sq"] - agg["rank_pred"] ** 2) * (agg["rank_actual_sq"] - agg["rank_actual"] ** 2))
+    agg["rank_corr"] = (covariance / spread.where(spread > 0)).astype(float)
+    agg["rmse"] = np.sqrt(agg["mse"])
+    agg["top_precision"] = agg["top_hit"] / agg["top_pred"].where(agg["top_pred"] > 0)
+    return agg[["channels", "mae", "rmse", "bias", "rank_corr", "top_precision"]].reset_index()
+
+
+def summarize(metrics: pd.DataFrame) -> pd.DataFrame:
+    """backtest_metrics の結果をモデルごとに基準時刻で平均"""
+    return metrics.groupby("model", sort=False).agg(
+        dates=("as_of", "size"),
+        channels=("channels", "mean"),
+        mae=("mae", "mean"),
+        rmse=("rmse", "mean"),
+        bias=("bias", "mean"),
+        rank_corr=("rank_corr", "mean"),
+        top_precision=("top_precision", "mean"),
+    ).reset_index()
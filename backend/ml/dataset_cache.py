@@ -0,0 +1,139 @@
+"""
+LightGBM のデータセットのキャッシュ
+
+lgb.Dataset は作るたびに全特徴量のビン分割をやり直す。同じ学習データで学習・CV・パラメータ探索を
+繰り返すときのために、ビン分割済みのデータセットを LightGBM のバイナリ形式で
+settings.DATASET_CACHE_DIR に保存し、次からはファイルを読み込むだけにする。
+
+キーは特徴量・ラベルの値と列名、ビン分割に影響するパラメータ、検証データの場合は学習データのキー、
+LightGBM のバージョンのハッシュ。読み込んだファイルは更新時刻を更新し、保存のたびに
+DATASET_CACHE_MAX_AGE_DAYS 日より古いファイルと、合計が DATASET_CACHE_MAX_MB を超えた分を古い順に削除する。
+
+ファイルは一時ファイルに書いてから os.replace で置き換えるため、複数のプロセスが同じデータを
+同時に保存しても読み込み側が書きかけのファイルを見ることはない。
+"""
+import hashlib
+import json
+import os
+import time
+from typing import Any, Dict, Optional, Tuple, Union
+
+import lightgbm as lgb
+import numpy as np
+import pandas as pd
+
+from app.config import resolve_path, settings
+
+# ビン分割に影響するパラメータ（これ以外は学習時に変えても同じデータセットを使える）
+DATASET_PARAM_KEYS = [
+    "max_bin", "min_data_in_bin", "bin_construct_sample_cnt", "use_missing", "zero_as_missing",
+    "feature_pre_filter", "min_data_in_leaf", "categorical_feature", "linear_tree",
+]
+
+# feature_pre_filter を切って min_data_in_leaf の違うパラメータでも同じデータセットを使えるようにする
+DEFAULT_DATASET_PARAMS = {"feature_pre_filter": False, "verbose": -1}
+
+
+def dataset_params(params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """データセットの作成に使うパラメータ"""
+    merged = {**DEFAULT_DATASET_PARAMS, **{k: v for k, v in (params or {}).items() if k in DATASET_PARAM_KEYS}}
+    if not merged["feature_pre_filter"]:
+        merged.pop("min_data_in_leaf", None)
+    return merged
+
+
+def dataset_key(X: Union[pd.DataFrame, np.ndarray], y: Union[pd.Series, np.ndarray],
+                params: Dict[str, Any], reference_key: Optional[str] = None) -> str:
+    """データセットのキャッシュキー"""
+    digest = hashlib.sha256()
+    columns = list(X.columns) if isinstance(X, pd.DataFrame) else [str(i) for i in range(X.shape[1])]
+    digest.update(json.dumps({
+        "columns": columns,
+        "shape": list(X.shape),
+        "params": params,
+        "reference": reference_key,
+        "lightgbm": lgb.__version__,
+    }, sort_keys=True, default=str).encode("utf-8"))
+    digest.update(np.ascontiguousarray(np.asarray(X, dtype=np.float64)).tobytes())
+    digest.update(np.ascontiguousarray(np.asarray(y, dtype=np.float64)).tobytes())
+    return digest.hexdigest()
+
+
+def _cache_path(key: str, cache_dir: Optional[str] = None) -> str:
+    return os.path.join(resolve_path(cache_dir or settings.DATASET_CACHE_DIR), f"{key}.bin")
+
+
+def cached_dataset(
+    X: Union[pd.DataFrame, np.ndarray],
+    y: Union[pd.Series, np.ndarray],
+    params: Optional[Dict[str, Any]] = None,
+    reference: Optional[Tuple[lgb.Dataset, str]] = None,
+    cache_dir: Optional[str] = None,
+) -> Tuple[lgb.Dataset, str]:
+    """
+    キャッシュ済みならバイナリから読み込み、なければ作って保存したデータセット
+
+    Args:
+        params: 学習パラメータ（ビン分割に影響するものだけを使う）
+        reference: 検証データの場合は学習データの (データセット, キー)
+
+    Returns:
+        (データセット, キー)。キーは検証データの reference に渡す
+    """
+    params = dataset_params(params)
+    reference_dataset, reference_key = reference if reference else (None, None)
+    key = dataset_key(X, y, params, reference_key)
+    path = _cache_path(key, cache_dir)
+
+    if os.path.exists(path):
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return lgb.Dataset(path, reference=reference_dataset, params=params), key
+
+    dataset = lgb.Dataset(X, label=y, reference=reference_dataset, params=params, free_raw_data=False)
+    dataset.construct()
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    dataset.save_binary(tmp_path)
+    os.replace(tmp_path, path)
+    evict(cache_dir)
+    return dataset, key
+
+
+def evict(cache_dir: Optional[str] = None, max_age_days: Optional[int] = None,
+          max_mb: Optional[int] = None) -> int:
+    """期間を過ぎたファイルと、合計サイズの上限を超えた分を古い順に削除し、削除件数を返す"""
+    cache_dir = resolve_path(cache_dir or settings.DATASET_CACHE_DIR)
+    max_age_days = settings.DATASET_CACHE_MAX_AGE_DAYS if max_age_days is None else max_age_days
+    max_bytes = (settings.DATASET_CACHE_MAX_MB if max_mb is None else max_mb) * 1024 * 1024
+    if not os.path.isdir(cache_dir):
+        return 0
+
+    entries = []
+    for name in os.listdir(cache_dir):
+        if not name.endswith(".bin"):
+            continue
+        path = os.path.join(cache_dir, name)
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            continue
+        entries.append((st.st_mtime, st.st_size, path))
+    entries.sort()
+
+    expire_before = time.time() - max_age_days * 86400
+    total = sum(size for _, size, _ in entries)
+    removed = 0
+    for mtime, size, path in entries:
+        if mtime >= expire_before and total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+        removed += 1
+    return removed
@@ -0,0 +1,94 @@
+"""
+特徴量の分布の変化（ドリフト）
+
+学習時に特徴量ごとの分位点で固定のビン境界を決め、学習データのビンごとの件数（欠損は最後のビン）を
+モデルのメタデータ（meta.json の feature_baseline）に保存する。
+予測のたびに同じ境界で入力の件数を数えて足し込めば（app/services/drift_service.py）、
+特徴量ごとの状態はビンの数だけの件数で済み、生データを読み直さずに学習時の分布と比べられる。
+
+比較には PSI（population stability index）を使う。
+    PSI = Σ (予測時の割合 - 学習時の割合) × ln(予測時の割合 / 学習時の割合)
+目安は 0.1 未満が安定、0.1〜0.25 が変化あり、0.25 以上が大きな変化（学習し直しを検討する）。
+"""
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+# 特徴量ごとのビンの数（欠損のビンを除く。値の種類が少ない特徴量は少なくなる）
+DRIFT_BINS = 10
+# 件数が0のビンの割合（ln(0) を避ける）
+PSI_EPSILON = 1e-4
+# PSI の目安
+PSI_WARN = 0.1
+PSI_ALERT = 0.25
+
+
+def bin_edges(values: np.ndarray, bins: int = DRIFT_BINS) -> List[float]:
+    """値の分位点によるビンの境界（重複は除く。値がなければ空）"""
+    values = np.asarray(values, dtype=np.float64)
+    present = values[np.isfinite(values)]
+    if len(present) == 0:
+        return []
+    edges = np.unique(np.quantile(present, np.linspace(0, 1, bins + 1)[1:-1]))
+    return [float(edge) for edge in edges]
+
+
+def bin_counts(values: np.ndarray, edges: List[float]) -> np.ndarray:
+    """
+    境界 edges で区切ったビンごとの件数
+
+    Returns:
+        長さ len(edges) + 2 の件数（i 番目は edges[i-1] <= 値 < edges[i]。最後の要素は欠損）
+    """
+    values = np.asarray(values, dtype=np.float64)
+    present = np.isfinite(values)
+    index = np.searchsorted(np.asarray(edges, dtype=np.float64), values[present], side="right")
+    counts = np.bincount(index, minlength=len(edges) + 1)
+    return np.append(counts, len(values) - present.sum()).astype(np.int64)
+
+
+def feature_baseline(X: pd.DataFrame, columns: Iterable[str], bins: int = DRIFT_BINS,
+                     base: Optional[Dict[str, Any]] = None) -> Dict[str, Dict[str, list]]:
+    """
+    学習データの特徴量ごとのビンの境界と件数（欠損を埋める前の値で数える）
+
+    Args:
+        base: 元のモデルの feature_baseline（継続学習用。同じ境界で件数を足す）
+
+    Returns:
+        {特徴量: {"edges": 境界, "counts": ビンごとの件数}}
+    """
+    baseline = {}
+    for column in columns:
+        values = X[column].to_numpy(dtype=np.float64, na_value=np.nan)
+        if base and column in base:
+            edges = base[column]["edges"]
+            counts = np.asarray(base[column]["counts"], dtype=np.int64) + bin_counts(values, edges)
+        else:
+            edges = bin_edges(values, bins)
+            counts = bin_counts(values, edges)
+        baseline[column] = {"edges": list(edges), "counts": counts.tolist()}
+    return baseline
+
+
+def psi(expected: np.ndarray, actual: np.ndarray, epsilon: float = PSI_EPSILON) -> Optional[float]:
+    """学習時と予測時のビンごとの件数から PSI を計算（どちらかが0件なら None）"""
+    expected = np.asarray(expected, dtype=np.float64)
+    actual = np.asarray(actual, dtype=np.float64)
+    if expected.sum() <= 0 or actual.sum() <= 0:
+        return None
+    p = np.maximum(expected / expected.sum(), epsilon)
+    q = np.maximum(actual / actual.sum(), epsilon)
+    return float(((q - p) * np.log(q / p)).sum())
+
+
+def drift_level(value: Optional[float]) -> str:
+    """PSI の目安（stable / warn / alert。計算できなければ unknown）"""
+    if value is None:
+        return "unknown"
+    if value >= PSI_ALERT:
+        return "alert"
+    if value >= PSI_WARN:
+        return "warn"
+    return "stable"
@@ -1,54 +1,218 @@
 from typing import Dict, Any, List, Optional
 from datetime import datetime, timedelta
+import numpy as np
+import pandas as pd
+from sqlalchemy import text, bindparam, DateTime
 from sqlalchemy.orm import Session
-from app.models import Channel, ChannelStats, News, TrendData
+from app.models import Channel, News, TrendData
+from app.services.stats_service import StatsPoint, get_window_points, stats_at
+from app.services.rolling_service import advance_aggregates, current_aggregate
+from ml.resampling import load_model_grid, model_features
 
 
 class FeatureExtractor:
     """チャンネルデータから機械学習用の特徴量を抽出"""
 
-    def __init__(self, db: Session):
+    # 一括抽出で1回のクエリに含めるチャンネル数（SQLite のパラメータ数上限対策）
+    BULK_CHUNK_SIZE = 500
+
+    def __init__(self, db: Session, as_of: Optional[datetime] = None):
+        """
+        Args:
+            db: DBセッション
+            as_of: 基準時刻（省略時は抽出のたびに現在時刻）。
+                   指定すると、その時点までに観測されたデータだけで特徴量を計算する
+        """
         self.db = db
+        self.as_of = as_of
+
+    def _as_of(self, as_of: Optional[datetime] = None) -> datetime:
+        return as_of or self.as_of or datetime.utcnow()
+
+    def _execute_bulk(self, sql: str, params: Dict[str, Any],
+                      channel_ids: Optional[List[int]]) -> pd.DataFrame:
+        """
+        {channel_filter} / {channel_filter_c} を含むSQLを実行して DataFrame で返す
+
+        channel_ids を指定した場合は BULK_CHUNK_SIZE 件ずつに分けて実行する。
+        """
+        time_params = [bindparam(name, type_=DateTime()) for name in params]
+
+        if channel_ids is None:
+            stmt = text(sql.format(channel_filter="", channel_filter_c="")).bindparams(*time_params)
+            statements = [(stmt, params)]
+        else:
+            stmt = text(sql.format(
+                channel_filter="AND channel_id IN :channel_ids",
+                channel_filter_c="AND c.id IN :channel_ids",
+            )).bindparams(*time_params, bindparam("channel_ids", expanding=True))
+            ids = list(dict.fromkeys(channel_ids))
+            statements = [
+                (stmt, {**params, "channel_ids": ids[i:i + self.BULK_CHUNK_SIZE]})
+                for i in range(0, len(ids), self.BULK_CHUNK_SIZE)
+            ]
+
+        frames = []
+        for stmt, stmt_params in statements:
+            result = self.db.execute(stmt, stmt_params)
+            frames.append(pd.DataFrame(result.fetchall(), columns=list(result.keys())))
+        return pd.concat(frames, ignore_index=True) if frames else None
+
+    def extract_features_frame(
+        self,
+        channel_ids: Optional[List[int]] = None,
+        as_of: Optional[datetime] = None,
+        rolling: Optional[bool] = None,
+    ) -> pd.DataFrame:
+        """
+        複数チャンネルの特徴量を一括で抽出
+
+        extract_features と同じ値を、チャンネル数によらず数回のSQL（ウィンドウ関数・集約）と
+        pandas のベクトル演算で計算する。成長率・投稿頻度は日次グリッド（ml/resampling.py）から計算する。
+        現在時刻の特徴量では、トレンドと活動量を直近の集計（rolling_service）から読み、期間内の行を読み直さない。
+
+        Args:
+            channel_ids: 対象チャンネルのDB ID（省略時は全チャンネル）
+            as_of: 基準時刻（省略時はインスタンスの as_of または現在時刻）
+            rolling: 直近の集計を使うか（省略時は基準時刻を指定しない場合だけ使う）。
+                     過去の基準時刻には使わない（集計は取り込み順に更新されるため）
+
+        Returns:
+            channel_id をインデックスとする DataFrame（存在しないチャンネル・基準時刻より後に追加されたチャンネルは含まない）
+        """
+        if rolling is None:
+            rolling = as_of is None and self.as_of is None
+        as_of = self._as_of(as_of)
+        params = feature_source_params(as_of)
+        if rolling:
+            source = self._rolling_source(channel_ids, as_of)
+        else:
+            source = self._execute_bulk(FEATURE_SOURCE_SQL, params, channel_ids)
+        if source is None:
+            source = pd.DataFrame(columns=FEATURE_SOURCE_COLUMNS)
+        growth = model_features(load_model_grid(self.db, as_of, channel_ids))
+        return compute_features_frame(source, as_of, growth)
+
+    def _rolling_source(self, channel_ids: Optional[List[int]], as_of: datetime) -> Optional[pd.DataFrame]:
+        """
+        FEATURE_SOURCE_SQL と同じ列を、トレンド・活動量は直近の集計から読む（ROLLING_FEATURE_SOURCE_SQL）
+
+        集計に as_of より後の行が含まれているチャンネルだけは FEATURE_SOURCE_SQL で行を読む。
+        """
+        behind = set(advance_aggregates(self.db, "trend_score", as_of, channel_ids))
+        behind |= set(advance_aggregates(self.db, "video_count", as_of, channel_ids))
+        params = feature_source_params(as_of)
+        if not behind:
+            return self._execute_bulk(ROLLING_FEATURE_SOURCE_SQL, params, channel_ids)
+
+        if channel_ids is None:
+            channel_ids = [row[0] for row in self.db.query(Channel.id).all()]
+        ready = [channel_id for channel_id in channel_ids if channel_id not in behind]
+        frames = [
+            self._execute_bulk(ROLLING_FEATURE_SOURCE_SQL, params, ready),
+            self._execute_bulk(FEATURE_SOURCE_SQL, params, sorted(behind)),
+        ]
+        frames = [frame for frame in frames if frame is not None]
+        if not frames:
+            return None
+        return pd.concat(frames, ignore_index=True).sort_values("channel_id", ignore_index=True)
+
+    def extract_features_bulk(
+        self,
+        channel_ids: Optional[List[int]] = None,
+        as_of: Optional[datetime] = None,
+    ) -> Dict[int, Dict[str, Any]]:
+        """
+        複数チャンネルの特徴量を一括で抽出（extract_features と同じ形式の辞書）
+
+        Returns:
+            {チャンネルのDB ID: 特徴量の辞書}
+        """
+        return features_to_records(self.extract_features_frame(channel_ids, as_of))
+
+    def extract_features_snapshots(
+        self,
+        anchors: List[datetime],
+        channel_ids: Optional[List[int]] = None,
+    ) -> pd.DataFrame:
+        """
+        複数の基準時刻について特徴量を一括で抽出（学習データ・バックテスト用）
+
+        基準時刻ごとにSQLを実行せず、ソーステーブルを1回読んで全基準時刻をまとめて計算する
+        （ml.backtest.PointInTimeSource。extract_features_frame と同じ値）。
+
+        Returns:
+            (as_of, channel_id) をインデックスとする DataFrame
+        """
+        from ml.backtest import PointInTimeSource
+
+        if not anchors:
+            return concat_snapshots({})
+        features = PointInTimeSource(self.db).features(anchors)
+        if channel_ids is not None:
+            features = features[features.index.get_level_values("channel_id").isin(channel_ids)]
+        return features
+
+    def stats_at_frame(
+        self,
+        at: datetime,
+        channel_ids: Optional[List[int]] = None,
+    ) -> pd.DataFrame:
+        """
+        全チャンネルの at 時点で観測済みの最新の統計（stats_service.stats_at の一括版）
+
+        Returns:
+            channel_id をインデックスとし、subscriber_count / view_count / video_count を持つ DataFrame
+        """
+        frame = self._execute_bulk(STATS_AT_SQL, {"at": at}, channel_ids)
+        if frame is None:
+            frame = pd.DataFrame(columns=["channel_id", "subscriber_count", "view_count", "video_count"])
+        return frame.set_index("channel_id").astype(float)
 
-    def extract_features(self, channel_id: int) -> Dict[str, Any]:
+    def extract_features(self, channel_id: int, as_of: Optional[datetime] = None) -> Dict[str, Any]:
         """
         チャンネルの特徴量を抽出
 
         Args:
             channel_id: チャンネルのDB ID
+            as_of: 基準時刻（省略時はインスタンスの as_of または現在時刻）
         """
         channel = self.db.query(Channel).filter(Channel.id == channel_id).first()
-        if not channel:
+        now = self._as_of(as_of)
+        # 基準時刻より後に追加されたチャンネルは存在しないものとして扱う
+        if not channel or channel.created_at > now:
             return {}
 
+        latest_stats = stats_at(self.db, channel_id, now)
+        # 現在時刻の特徴量は直近の集計（rolling_service）から求め、過去の基準時刻では行を読む
+        current = as_of is None and self.as_of is None
+
         features = {}
 
         # 基本統計
-        features.update(self._extract_basic_stats(channel_id))
+        features.update(self._extract_basic_stats(latest_stats))
 
-        # 成長率
-        features.update(self._extract_growth_rates(channel_id))
+        # 成長率・投稿頻度
+        features.update(self._extract_growth_rates(channel_id, now))
 
-        # 投稿頻度・エンゲージメント
-        features.update(self._extract_activity_features(channel_id))
+        # エンゲージメント
+        activity = self._rolling_activity_features(channel_id, latest_stats, now) if current else None
+        features.update(activity or self._extract_activity_features(channel_id, now))
 
         # トレンドスコア
-        features.update(self._extract_trend_features(channel_id))
+        trends = self._rolling_trend_features(channel_id, now) if current else None
+        features.update(trends or self._extract_trend_features(channel_id, now))
 
         # ニュース関連
-        features.update(self._extract_news_features(channel_id))
+        features.update(self._extract_news_features(channel_id, now))
 
         # チャンネル年齢
-        features["channel_age_days"] = (datetime.utcnow() - channel.created_at).days
+        features["channel_age_days"] = (now - channel.created_at).days
 
         return features
 
-    def _extract_basic_stats(self, channel_id: int) -> Dict[str, Any]:
+    def _extract_basic_stats(self, latest_stats: Optional[StatsPoint]) -> Dict[str, Any]:
         """基本統計の抽出"""
-        latest_stats = self.db.query(ChannelStats).filter(
-            ChannelStats.channel_id == channel_id
-        ).order_by(ChannelStats.recorded_at.desc()).first()
-
         if not latest_stats:
             return {
                 "subscriber_count": None,
@@ -62,84 +226,24 @@ class FeatureExtractor:
             "video_count": latest_stats.video_count,
         }
 
-    def _extract_growth_rates(self, channel_id: int) -> Dict[str, Any]:
-        """成長率の計算"""
-        now = datetime.utcnow()
-
-        # 直近のデータ
-        latest_stats = self.db.query(ChannelStats).filter(
-            ChannelStats.channel_id == channel_id
-        ).order_by(ChannelStats.recorded_at.desc()).first()
-
-        if not latest_stats:
-            return {
-                "subscriber_growth_rate_30d": None,
-                "subscriber_growth_rate_90d": None,
-                "view_growth_rate_30d": None,
-            }
-
-        # 30日前のデータ
-        stats_30d = self.db.query(ChannelStats).filter(
-            ChannelStats.channel_id == channel_id,
-            ChannelStats.recorded_at <= now - timedelta(days=30)
-        ).order_by(ChannelStats.recorded_at.desc()).first()
-
-        # 90日前のデータ
-        stats_90d = self.db.query(ChannelStats).filter(
-            ChannelStats.channel_id == channel_id,
-            ChannelStats.recorded_at <= now - timedelta(days=90)
-        ).order_by(ChannelStats.recorded_at.desc()).first()
-
-        result = {
-            "subscriber_growth_rate_30d": None,
-            "subscriber_growth_rate_90d": None,
-            "view_growth_rate_30d": None,
-        }
+    def _extract_growth_rates(self, channel_id: int, now: datetime) -> Dict[str, Any]:
+        """成長率と投稿頻度（日次グリッドから計算）"""
+        growth = model_features(load_model_grid(self.db, now, [channel_id]))
+        return {col: None if pd.isna(value) else float(value) for col, value in growth.iloc[0].items()}
 
-        if stats_30d and stats_30d.subscriber_count > 0:
-            result["subscriber_growth_rate_30d"] = (
-                (latest_stats.subscriber_count - stats_30d.subscriber_count)
-                / stats_30d.subscriber_count
-            )
-            if stats_30d.view_count > 0:
-                result["view_growth_rate_30d"] = (
-                    (latest_stats.view_count - stats_30d.view_count)
-                    / stats_30d.view_count
-                )
-
-        if stats_90d and stats_90d.subscriber_count > 0:
-            result["subscriber_growth_rate_90d"] = (
-                (latest_stats.subscriber_count - stats_90d.subscriber_count)
-                / stats_90d.subscriber_count
-            )
-
-        return result
-
-    def _extract_activity_features(self, channel_id: int) -> Dict[str, Any]:
-        """投稿頻度とエンゲージメントの抽出"""
-        # 直近30日の統計変化から推定
-        now = datetime.utcnow()
-
-        stats_list = self.db.query(ChannelStats).filter(
-            ChannelStats.channel_id == channel_id,
-            ChannelStats.recorded_at >= now - timedelta(days=30)
-        ).order_by(ChannelStats.recorded_at).all()
+    def _extract_activity_features(self, channel_id: int, now: datetime) -> Dict[str, Any]:
+        """平均視聴回数とエンゲージメントの抽出"""
+        # 直近30日の最後の観測から計算（dedup形式の行も観測点に展開して扱う）
+        stats_list = get_window_points(self.db, channel_id, now - timedelta(days=30), now)
 
         if len(stats_list) < 2:
             return {
-                "upload_frequency": None,
                 "avg_views_per_video": None,
                 "engagement_rate": None,
             }
 
-        first = stats_list[0]
         last = stats_list[-1]
 
-        # 投稿頻度（動画/週）
-        video_diff = last.video_count - first.video_count
-        days_diff = (last.recorded_at - first.recorded_at).days or 1
-        upload_frequency = (video_diff / days_diff) * 7
-
         # 平均視聴回数
         avg_views = last.view_count / last.video_count if last.video_count > 0 else 0
 
@@ -150,19 +254,64 @@ class FeatureExtractor:
         )
 
         return {
-            "upload_frequency": upload_frequency,
             "avg_views_per_video": avg_views,
             "engagement_rate": engagement_rate,
         }
 
-    def _extract_trend_features(self, channel_id: int) -> Dict[str, Any]:
-        """トレンド関連の特徴量"""
-        now = datetime.utcnow()
+    def _rolling_activity_features(self, channel_id: int, latest_stats: Optional[StatsPoint],
+                                   now: datetime) -> Optional[Dict[str, Any]]:
+        """_extract_activity_features と同じ値を video_count の直近の集計から計算（集計が使えなければ None）"""
+        aggregate = current_aggregate(self.db, channel_id, "video_count", now)
+        if aggregate is None or latest_stats is None:
+            return None
+
+        if aggregate.count == 0:
+            points = 0
+        else:
+            first_at = max(aggregate.first_at, now - timedelta(days=30))
+            last_at = min(aggregate.last_at, now)
+            points = 2 if aggregate.count >= 2 or first_at != last_at else 1
+        if points < 2:
+            return {
+                "avg_views_per_video": None,
+                "engagement_rate": None,
+            }
 
+        # 期間内の最後の行は latest_stats と同じ行
+        return {
+            "avg_views_per_video": (
+                latest_stats.view_count / latest_stats.video_count if latest_stats.video_count > 0 else 0
+            ),
+            "engagement_rate": (
+                latest_stats.view_count / latest_stats.subscriber_count if latest_stats.subscriber_count > 0 else 0
+            ),
+        }
+
+    def _rolling_trend_features(self, channel_id: int, now: datetime) -> Optional[Dict[str, Any]]:
+        """_extract_trend_features と同じ値を直近の集計から計算（集計が使えなければ None）"""
+        aggregate = current_aggregate(self.db, channel_id, "trend_score", now)
+        if aggregate is None:
+            return None
+        if aggregate.count == 0:
+            return {
+                "trend_score": None,
+                "trend_direction": None,
+                "trend_volatility": None,
+            }
+
+        return {
+            "trend_score": int(aggregate.last_value),
+            "trend_direction": int(aggregate.last_value - aggregate.first_value) if aggregate.count >= 2 else 0,
+            "trend_volatility": float(np.sqrt(aggregate.m2 / aggregate.count)) if aggregate.count > 1 else 0,
+        }
+
+    def _extract_trend_features(self, channel_id: int, now: datetime) -> Dict[str, Any]:
+        """トレンド関連の特徴量"""
         # 直近のトレンドデータ
         recent_trends = self.db.query(TrendData).filter(
             TrendData.channel_id == channel_id,
-            TrendData.recorded_at >= now - timedelta(days=30)
+            TrendData.recorded_at >= now - timedelta(days=30),
+            TrendData.recorded_at <= now
         ).order_by(TrendData.recorded_at).all()
 
         if not recent_trends:
@@ -184,7 +333,6 @@ class FeatureExtractor:
             trend_direction = 0
 
         # ボラティリティ（標準偏差）
-        import numpy as np
         volatility = float(np.std(scores)) if len(scores) > 1 else 0
 
         return {
@@ -193,14 +341,13 @@ class FeatureExtractor:
             "trend_volatility": volatility,
         }
 
-    def _extract_news_features(self, channel_id: int) -> Dict[str, Any]:
+    def _extract_news_features(self, channel_id: int, now: datetime) -> Dict[str, Any]:
         """ニュース関連の特徴量"""
-        now = datetime.utcnow()
-
         # 直近90日のニュース
         recent_news = self.db.query(News).filter(
             News.channel_id == channel_id,
-            News.created_at >= now - timedelta(days=90)
+            News.created_at >= now - timedelta(days=90),
+            News.created_at <= now
         ).all()
 
         news_count = len(recent_news)
@@ -224,3 +371,259 @@ class FeatureExtractor:
             "news_positive_ratio": positive_count / news_count,
             "news_negative_ratio": negative_count / news_count,
         }
+
+
+# 各チャンネルの :at 時点で観測済みの最新の統計（stats_service.stats_at と同じ優先順位）
+# 生データ → 日次 → 週次 → 月次 の順に探し、集約行は last_recorded_at 時点の観測として扱う。
+STATS_AT_SQL = """
+    SELECT channel_id, subscriber_count, view_count, video_count
+    FROM (
+        SELECT channel_id, subscriber_count, view_count, video_count,
+               ROW_NUMBER() OVER (PARTITION BY channel_id ORDER BY tier, observed_at DESC) AS rn
+        FROM (
+            SELECT channel_id, subscriber_count, view_count, video_count, 0 AS tier, recorded_at AS observed_at
+            FROM channel_stats WHERE recorded_at <= :at {channel_filter}
+            UNION ALL
+            SELECT channel_id, subscriber_count, view_count, video_count, 1, last_recorded_at
+            FROM channel_stats_daily WHERE last_recorded_at <= :at {channel_filter}
+            UNION ALL
+            SELECT channel_id, subscriber_count, view_count, video_count, 2, last_recorded_at
+            FROM channel_stats_weekly WHERE last_recorded_at <= :at {channel_filter}
+            UNION ALL
+            SELECT channel_id, subscriber_count, view_count, video_count, 3, last_recorded_at
+            FROM channel_stats_monthly WHERE last_recorded_at <= :at {channel_filter}
+        ) candidates
+    ) t
+    WHERE rn = 1
+"""
+
+# 直近90日のニュースの件数（FEATURE_SOURCE_SQL / ROLLING_FEATURE_SOURCE_SQL 共通）
+NEWS_COUNTS_SQL = """
+    SELECT channel_id,
+           COUNT(*) AS news_count,
+           SUM(CASE WHEN category IN ('collaboration', 'media', 'event') THEN 1 ELSE 0 END) AS news_positive,
+           SUM(CASE WHEN category = 'controversy' THEN 1 ELSE 0 END) AS news_negative
+    FROM news
+    WHERE created_at >= :t90 AND created_at <= :now {channel_filter}
+    GROUP BY channel_id
+"""
+
+# 全チャンネル分の特徴量の材料を集計するSQL（SQLite / DuckDB 共通）
+# :now は基準時刻、:t30 / :t90 はその30日前・90日前（feature_source_params で作る）。
+# {channel_filter} で対象チャンネルを絞り込む。
+# 各CTEは extract_features の各メソッドと同じ条件で集計し、基準時刻より後のデータは使わない。
+# 成長率・投稿頻度は含まない（日次グリッドの ml.resampling.model_features で計算して compute_features_frame に渡す）。
+FEATURE_SOURCE_SQL = f"""
+WITH
+latest AS ({STATS_AT_SQL.replace(":at", ":now")}),
+activity_rows AS (
+    SELECT channel_id, subscriber_count, view_count, video_count,
+           CASE WHEN recorded_at > :t30 THEN recorded_at ELSE :t30 END AS begin_at,
+           CASE WHEN COALESCE(last_confirmed_at, recorded_at) < :now
+                THEN COALESCE(last_confirmed_at, recorded_at) ELSE :now END AS end_at,
+           ROW_NUMBER() OVER (PARTITION BY channel_id ORDER BY recorded_at DESC) AS rn_last
+    FROM channel_stats
+    WHERE COALESCE(last_confirmed_at, recorded_at) >= :t30 AND recorded_at <= :now {{channel_filter}}
+),
+activity AS (
+    SELECT channel_id,
+           SUM(CASE WHEN begin_at = end_at THEN 1 ELSE 2 END) AS point_count,
+           MAX(CASE WHEN rn_last = 1 THEN end_at END) AS last_at,
+           MAX(CASE WHEN rn_last = 1 THEN subscriber_count END) AS last_subscriber,
+           MAX(CASE WHEN rn_last = 1 THEN view_count END) AS last_view,
+           MAX(CASE WHEN rn_last = 1 THEN video_count END) AS last_video
+    FROM activity_rows
+    GROUP BY channel_id
+),
+trend_rows AS (
+    SELECT channel_id, trend_score,
+           AVG(trend_score) OVER (PARTITION BY channel_id) AS mean_score,
+           ROW_NUMBER() OVER (PARTITION BY channel_id ORDER BY recorded_at) AS rn_first,
+           ROW_NUMBER() OVER (PARTITION BY channel_id ORDER BY recorded_at DESC) AS rn_last
+    FROM trend_data
+    WHERE recorded_at >= :t30 AND recorded_at <= :now {{channel_filter}}
+),
+trends AS (
+    SELECT channel_id,
+           COUNT(*) AS trend_count,
+           MAX(CASE WHEN rn_first = 1 THEN trend_score END) AS trend_first,
+           MAX(CASE WHEN rn_last = 1 THEN trend_score END) AS trend_last,
+           AVG((trend_score - mean_score) * (trend_score - mean_score)) AS trend_variance
+    FROM trend_rows
+    GROUP BY channel_id
+),
+news_counts AS ({NEWS_COUNTS_SQL})
+SELECT
+    c.id AS channel_id,
+    c.created_at AS channel_created_at,
+    latest.subscriber_count AS latest_subscriber,
+    latest.view_count AS latest_view,
+    latest.video_count AS latest_video,
+    activity.point_count AS activity_points,
+    activity.last_at AS activity_last_at,
+    activity.last_subscriber AS activity_last_subscriber,
+    activity.last_view AS activity_last_view,
+    activity.last_video AS activity_last_video,
+    trends.trend_count,
+    trends.trend_first,
+    trends.trend_last,
+    trends.trend_variance,
+    news_counts.news_count,
+    news_counts.news_positive,
+    news_counts.news_negative
+FROM channels c
+LEFT JOIN latest ON latest.channel_id = c.id
+LEFT JOIN activity ON activity.channel_id = c.id
+LEFT JOIN trends ON trends.channel_id = c.id
+LEFT JOIN news_counts ON news_counts.channel_id = c.id
+WHERE 1 = 1 {{channel_filter_c}}
+ORDER BY c.id
+"""
+
+
+# FEATURE_SOURCE_SQL と同じ列を、トレンド・活動量は channel_rolling_aggregates から読むSQL
+# （rolling_service.advance_aggregates で :now の直近30日に進めてから実行する。SQLite のみ）
+# 活動量の観測点の数は集計の件数から求める（1行だけの場合は期間内の開始と終了が違えば2点）。
+# 期間内の最後の行は最新の統計と同じ行のため、activity_last_* は latest の値を使う。
+ROLLING_FEATURE_SOURCE_SQL = f"""
+WITH
+latest AS ({STATS_AT_SQL.replace(":at", ":now")}),
+news_counts AS ({NEWS_COUNTS_SQL})
+SELECT
+    c.id AS channel_id,
+    c.created_at AS channel_created_at,
+    latest.subscriber_count AS latest_subscriber,
+    latest.view_count AS latest_view,
+    latest.video_count AS latest_video,
+    CASE WHEN activity.count IS NULL OR activity.count = 0 THEN NULL
+         WHEN activity.count >= 2 THEN 2
+         WHEN (CASE WHEN activity.first_at > :t30 THEN activity.first_at ELSE :t30 END)
+              <> (CASE WHEN activity.last_at < :now THEN activity.last_at ELSE :now END) THEN 2
+         ELSE 1 END AS activity_points,
+    CASE WHEN activity.count > 0 THEN
+         CASE WHEN activity.last_at < :now THEN activity.last_at ELSE :now END END AS activity_last_at,
+    latest.subscriber_count AS activity_last_subscriber,
+    latest.view_count AS activity_last_view,
+    latest.video_count AS activity_last_video,
+    NULLIF(trends.count, 0) AS trend_count,
+    trends.first_value AS trend_first,
+    trends.last_value AS trend_last,
+    CASE WHEN trends.count > 0 THEN trends.m2 / trends.count END AS trend_variance,
+    news_counts.news_count,
+    news_counts.news_positive,
+    news_counts.news_negative
+FROM channels c
+LEFT JOIN latest ON latest.channel_id = c.id
+LEFT JOIN channel_rolling_aggregates activity ON activity.channel_id = c.id AND activity.metric = 'video_count'
+LEFT JOIN channel_rolling_aggregates trends ON trends.channel_id = c.id AND trends.metric = 'trend_score'
+LEFT JOIN news_counts ON news_counts.channel_id = c.id
+WHERE 1 = 1 {{channel_filter_c}}
+ORDER BY c.id
+"""
+
+
+def feature_source_params(as_of: datetime) -> Dict[str, datetime]:
+    """FEATURE_SOURCE_SQL のパラメータ"""
+    return {
+        "now": as_of,
+        "t30": as_of - timedelta(days=30),
+        "t90": as_of - timedelta(days=90),
+    }
+
+
+FEATURE_SOURCE_COLUMNS = [
+    "channel_id", "channel_created_at", "latest_subscriber", "latest_view", "latest_video",
+    "activity_points", "activity_last_at", "activity_last_subscriber", "activity_last_view",
+    "activity_last_video", "trend_count", "trend_first", "trend_last", "trend_variance",
+    "news_count", "news_positive", "news_negative",
+]
+
+# 整数で返す特徴量（欠損があると pandas では float になるため）
+INTEGER_FEATURES = {"subscriber_count", "view_count", "video_count", "trend_score",
+                    "trend_direction", "news_count", "channel_age_days"}
+
+
+def compute_features_frame(source: pd.DataFrame, now: datetime, growth: pd.DataFrame) -> pd.DataFrame:
+    """
+    FEATURE_SOURCE_SQL の結果から特徴量を計算（extract_features と同じ式をベクトル化）
+
+    Args:
+        growth: 同じ基準時刻の ml.resampling.model_features の結果（成長率・投稿頻度）
+
+    Returns:
+        channel_id をインデックスとし、extract_features と同じキー順の列を持つ DataFrame
+    """
+    src = source.set_index("channel_id")
+    for col in ["channel_created_at", "activity_last_at"]:
+        src[col] = pd.to_datetime(src[col])
+    # 基準時刻より後に追加されたチャンネルは含めない（チャンネル年齢が負になる）
+    src = src[~(src["channel_created_at"] > pd.Timestamp(now))]
+    num = src.drop(columns=["channel_created_at", "activity_last_at"]).astype(float)
+    growth = growth.reindex(src.index)
+
+    out = pd.DataFrame(index=src.index)
+
+    # 基本統計
+    out["subscriber_count"] = num["latest_subscriber"]
+    out["view_count"] = num["latest_view"]
+    out["video_count"] = num["latest_video"]
+
+    # 成長率・投稿頻度（日次グリッドから）
+    for col in ["subscriber_growth_rate_30d", "subscriber_growth_rate_90d", "view_growth_rate_30d",
+                "upload_frequency"]:
+        out[col] = growth[col].astype(float)
+
+    # エンゲージメント（観測点が2つ以上ある場合のみ）
+    has_activity = num["activity_points"].fillna(0) >= 2
+    last_video = num["activity_last_video"]
+    last_subscriber = num["activity_last_subscriber"]
+    out["avg_views_per_video"] = np.where(last_video > 0, num["activity_last_view"] / last_video.where(last_video > 0), 0.0)
+    out["avg_views_per_video"] = out["avg_views_per_video"].where(has_activity)
+    out["engagement_rate"] = np.where(last_subscriber > 0,
+                                      num["activity_last_view"] / last_subscriber.where(last_subscriber > 0), 0.0)
+    out["engagement_rate"] = out["engagement_rate"].where(has_activity)
+
+    # トレンド
+    trend_count = num["trend_count"].fillna(0)
+    has_trend = trend_count > 0
+    out["trend_score"] = num["trend_last"].where(has_trend)
+    out["trend_direction"] = np.where(trend_count >= 2, num["trend_last"] - num["trend_first"], 0.0)
+    out["trend_direction"] = out["trend_direction"].where(has_trend)
+    out["trend_volatility"] = np.where(trend_count > 1, np.sqrt(num["trend_variance"].clip(lower=0)), 0.0)
+    out["trend_volatility"] = out["trend_volatility"].where(has_trend)
+
+    # ニュース
+    news_count = num["news_count"].fillna(0)
+    has_news = news_count > 0
+    out["news_count"] = news_count
+    out["news_positive_ratio"] = (num["news_positive"] / news_count.where(has_news)).where(has_news, 0.0)
+    out["news_negative_ratio"] = (num["news_negative"] / news_count.where(has_news)).where(has_news, 0.0)
+
+    # チャンネル年齢
+    out["channel_age_days"] = (pd.Timestamp(now) - src["channel_created_at"]).dt.days
+
+    return out
+
+
+def features_to_records(frame: pd.DataFrame) -> Dict[int, Dict[str, Any]]:
+    """compute_features_frame の結果を extract_features と同じ形式の辞書に変換"""
+    records = {}
+    columns = list(frame.columns)
+    for channel_id, row in zip(frame.index, frame.itertuples(index=False, name=None)):
+        features = {}
+        for col, value in zip(columns, row):
+            if pd.isna(value):
+                features[col] = None
+            elif col in INTEGER_FEATURES:
+                features[col] = int(value)
+            else:
+                features[col] = float(value)
+        records[int(channel_id)] = features
+    return records
+
+
+def concat_snapshots(frames: Dict[datetime, pd.DataFrame]) -> pd.DataFrame:
+    """基準時刻ごとの特徴量を (as_of, channel_id) インデックスの1つの DataFrame にまとめる"""
+    if not frames:
+        return pd.DataFrame(index=pd.MultiIndex.from_arrays([[], []], names=["as_of", "channel_id"]))
+    return pd.concat(frames, names=["as_of", "channel_id"])
@@ -0,0 +1,234 @@
+"""
+特徴量行列のスナップショット（メモリマップで読む float32 の行列）
+
+特徴量を使う処理（予測・学習・バックテスト・管理画面の集計）がチャンネルごとの辞書を作り直さずに済むように、
+全チャンネルの特徴量をバージョン付きのファイルとして公開する。settings.FEATURE_SNAPSHOT_DIR 以下に次の形式で保存する。
+
+    LATEST                     最新のバージョン
+    {version}/features.npy     (チャンネル数, 特徴量数) の float32 行列（C順・列は GrowthPredictor.FEATURE_COLUMNS の順、欠損は NaN）
+    {version}/missing.npy      同じ形の欠損フラグ（bool）
+    {version}/channel_ids.npy  行に対応するチャンネルのDB ID（int64・昇順）
+    {version}/meta.json        基準時刻・公開時刻・列名・行数・特徴量の計算方法のバージョン
+
+バージョン名は公開時刻と連番（{公開時刻:%Y%m%d-%H%M%S}-{連番:03d}）で、基準時刻が同じでも前後しても重ならない。
+古いバージョンの削除は meta.json の公開時刻（created_at）の順に行う。
+
+読み込みは np.load(mmap_mode="r") で、ファイルをコピーせずにページ単位で必要な分だけ読む。
+100万チャンネルでも読み込みは一瞬で、複数のプロセスが同じページキャッシュを共有する。
+
+バージョンのディレクトリは一時ディレクトリに書いてから os.replace で置き換え、LATEST はその後に更新する。
+読み込み側が書きかけのファイルを見ることはなく、古いバージョンを削除しても開いているメモリマップはそのまま使える。
+"""
+import json
+import os
+import shutil
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from app.config import settings
+from ml.training_data import FEATURE_SCHEMA_VERSION, LEGACY_FEATURE_SCHEMA_VERSION
+
+LATEST_NAME = "LATEST"
+# 列ごとの統計を計算するときに一度に読む行数
+STATS_CHUNK_ROWS = 262144
+
+
+def _snapshot_dir(directory: Optional[str] = None) -> str:
+    return directory or settings.FEATURE_SNAPSHOT_DIR
+
+
+def _write_text_atomic(path: str, content: str):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(content)
+    os.replace(tmp_path, path)
+
+
+class FeatureSnapshot:
+    """公開済みのスナップショット（行列はメモリマップのまま持つ）"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            self.meta: Dict[str, Any] = json.load(f)
+        self.version: str = self.meta["version"]
+        self.as_of = datetime.fromisoformat(self.meta["as_of"])
+        self.columns: List[str] = self.meta["columns"]
+        self.feature_version: int = self.meta.get("feature_version", LEGACY_FEATURE_SCHEMA_VERSION)
+        self.matrix: np.ndarray = np.load(os.path.join(path, "features.npy"), mmap_mode="r")
+        self.missing: np.ndarray = np.load(os.path.join(path, "missing.npy"), mmap_mode="r")
+        self.channel_ids: np.ndarray = np.load(os.path.join(path, "channel_ids.npy"), mmap_mode="r")
+
+    def __len__(self) -> int:
+        return len(self.channel_ids)
+
+    def rows(self, channel_ids: Iterable[int]) -> np.ndarray:
+        """チャンネルのDB IDに対応する行（スナップショットにないチャンネルは -1）"""
+        ids = np.asarray(list(channel_ids), dtype=np.int64)
+        if len(self.channel_ids) == 0:
+            return np.full(len(ids), -1)
+        pos = np.minimum(np.searchsorted(self.channel_ids, ids), len(self.channel_ids) - 1)
+        return np.where(self.channel_ids[pos] == ids, pos, -1)
+
+    def column(self, name: str) -> np.ndarray:
+        """1列分（メモリマップのビュー。行の間隔は列数分）"""
+        return self.matrix[:, self.columns.index(name)]
+
+    def frame(self, channel_ids: Optional[Iterable[int]] = None) -> pd.DataFrame:
+        """
+        channel_id インデックスの特徴量（GrowthPredictor.predict_batch にそのまま渡せる）
+
+        Args:
+            channel_ids: 対象チャンネル（省略時は全行。スナップショットにないチャンネルは含まない）
+        """
+        if channel_ids is None:
+            matrix, ids = self.matrix, self.channel_ids
+        else:
+            rows = self.rows(channel_ids)
+            rows = np.unique(rows[rows >= 0])
+            matrix, ids = self.matrix[rows], self.channel_ids[rows]
+        return pd.DataFrame(matrix, index=pd.Index(np.asarray(ids), name="channel_id"), columns=self.columns)
+
+    def column_stats(self, chunk_rows: int = STATS_CHUNK_ROWS) -> pd.DataFrame:
+        """
+        列ごとの件数・欠損率・平均・標準偏差・最小・最大（行の塊ごとに読んで集計し、全体をメモリに載せない）
+
+        Returns:
+            列名インデックスの DataFrame
+        """
+        k = len(self.columns)
+        count = np.zeros(k)
+        total = np.zeros(k)
+        total_sq = np.zeros(k)
+        low = np.full(k, np.inf)
+        high = np.full(k, -np.inf)
+        for start in range(0, len(self), chunk_rows):
+            block = np.asarray(self.matrix[start:start + chunk_rows], dtype=np.float64)
+            present = ~np.asarray(self.missing[start:start + chunk_rows])
+            values = np.where(present, block, 0.0)
+            count += present.sum(axis=0)
+            total += values.sum(axis=0)
+            total_sq += (values * values).sum(axis=0)
+            low = np.minimum(low, np.where(present, block, np.inf).min(axis=0, initial=np.inf))
+            high = np.maximum(high, np.where(present, block, -np.inf).max(axis=0, initial=-np.inf))
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean = np.where(count > 0, total / count, np.nan)
+            std = np.sqrt(np.maximum(np.where(count > 0, total_sq / count, np.nan) - mean * mean, 0.0))
+        rows = max(len(self), 1)
+        return pd.DataFrame({
+            "count": count.astype(np.int64),
+            "missing_ratio": (len(self) - count) / rows,
+            "mean": mean,
+            "std": std,
+            "min": np.where(count > 0, low, np.nan),
+            "max": np.where(count > 0, high, np.nan),
+        }, index=pd.Index(self.columns, name="feature"))
+
+
+def write_snapshot(features: pd.DataFrame, as_of: datetime, columns: List[str],
+                   directory: Optional[str] = None, keep: Optional[int] = None) -> str:
+    """
+    特徴量をスナップショットとして公開し、バージョンを返す
+
+    Args:
+        features: channel_id インデックスの特徴量
+        as_of: 特徴量の基準時刻
+        columns: 行列の列（GrowthPredictor.FEATURE_COLUMNS の順）
+        keep: 残すバージョン数（省略時は settings.FEATURE_SNAPSHOT_KEEP。古いものから削除する）
+    """
+    root = _snapshot_dir(directory)
+    os.makedirs(root, exist_ok=True)
+
+    created_at = datetime.utcnow()
+    version, tmp_dir = _reserve_version(root, created_at)
+
+    frame = features.reindex(columns=columns).sort_index()
+    matrix = np.ascontiguousarray(frame.to_numpy(dtype=np.float32, na_value=np.nan))
+    channel_ids = frame.index.to_numpy(dtype=np.int64)
+
+    np.save(os.path.join(tmp_dir, "features.npy"), matrix)
+    np.save(os.path.join(tmp_dir, "missing.npy"), np.isnan(matrix))
+    np.save(os.path.join(tmp_dir, "channel_ids.npy"), channel_ids)
+    meta = {
+        "version": version,
+        "as_of": as_of.isoformat(),
+        "created_at": created_at.isoformat(),
+        "columns": list(columns),
+        "rows": int(len(channel_ids)),
+        "feature_version": FEATURE_SCHEMA_VERSION,
+    }
+    with open(os.path.join(tmp_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_dir, os.path.join(root, version))
+    _write_text_atomic(os.path.join(root, LATEST_NAME), version)
+
+    keep = settings.FEATURE_SNAPSHOT_KEEP if keep is None else keep
+    for old in list_snapshots(root)[:-keep] if keep > 0 else []:
+        if old != version:
+            shutil.rmtree(os.path.join(root, old), ignore_errors=True)
+    return version
+
+
+def _reserve_version(root: str, created_at: datetime):
+    """
+    公開時刻のバージョン名と書き込み用の一時ディレクトリを確保する
+
+    一時ディレクトリの作成（os.mkdir）で連番を取り合うため、同時に公開しても同じバージョンにならない。
+
+    Returns:
+        (バージョン, 一時ディレクトリ)
+    """
+    base = created_at.strftime("%Y%m%d-%H%M%S")
+    n = 1
+    while True:
+        version = f"{base}-{n:03d}"
+        tmp_dir = os.path.join(root, f"_tmp-{version}")
+        try:
+            os.mkdir(tmp_dir)
+        except FileExistsError:
+            n += 1
+            continue
+        if not os.path.exists(os.path.join(root, version)):
+            return version, tmp_dir
+        os.rmdir(tmp_dir)
+        n += 1
+
+
+def _created_at(root: str, version: str) -> str:
+    """バージョンの公開時刻（meta.json の created_at。読めない場合は空文字）"""
+    try:
+        with open(os.path.join(root, version, "meta.json"), encoding="utf-8") as f:
+            return json.load(f).get("created_at") or ""
+    except (OSError, ValueError):
+        return ""
+
+
+def list_snapshots(directory: Optional[str] = None) -> List[str]:
+    """公開済みのバージョン（meta.json の公開時刻の古い順）"""
+    root = _snapshot_dir(directory)
+    if not os.path.isdir(root):
+        return []
+    versions = [
+        name for name in os.listdir(root)
+        if not name.startswith("_tmp-") and os.path.isfile(os.path.join(root, name, "meta.json"))
+    ]
+    return sorted(versions, key=lambda name: (_created_at(root, name), name))
+
+
+def load_snapshot(version: Optional[str] = None, directory: Optional[str] = None) -> Optional[FeatureSnapshot]:
+    """スナップショットを開く（version 省略時は最新。公開されていなければ None）"""
+    root = _snapshot_dir(directory)
+    if version is None:
+        try:
+            with open(os.path.join(root, LATEST_NAME), encoding="utf-8") as f:
+                version = f.read().strip()
+        except FileNotFoundError:
+            return None
+    path = os.path.join(root, version)
+    if not os.path.isfile(os.path.join(path, "meta.json")):
+        return None
+    return FeatureSnapshot(path)
@@ -0,0 +1,290 @@
+"""
+予測モデルのバージョン管理（プロセス内で共有）
+
+settings.MODEL_REGISTRY_DIR 以下に次の形式で保存する。
+
+    registry.json            チャンピオン（本番の予測に使う）とチャレンジャー（影で予測するだけ）のバージョン
+    {version}/model.txt      LightGBM のテキスト形式
+    {version}/meta.json      評価指標・特徴量リスト・学習データのフィンガープリント・パラメータ・特徴量の分布（ドリフトの比較元）・
+                             特徴量の計算方法のバージョン（今と違うバージョンはチャンピオン・チャレンジャーでも予測に使わない）
+
+バージョンのディレクトリは一度書いたら変更しないので、読み込んだ Booster はバージョンごとにキャッシュする。
+registry.json は state() のたびに更新時刻とサイズを確認し、変わっていればチェックサムを計算して
+内容が変わったときだけ読み込み直す。読み込んだ状態（チャンピオン・チャレンジャーの組）は1回の代入で
+差し替えるため、予測中のスレッドは常に古いか新しいどちらか一方の完全な組を使う。
+
+予測期間ごとにモデルを分けて管理する。180日のモデルは MODEL_REGISTRY_DIR 直下、
+それ以外の期間は MODEL_REGISTRY_DIR/h{日数}/ に同じ形式で保存する（horizon_registry_dir）。
+
+書き込みはすべて一時ファイル（ディレクトリ）に書いてから os.replace で置き換えるため、
+学習プロセスとAPIプロセスが別でも、読み込み側が書きかけのファイルを見ることはない。
+"""
+import hashlib
+import json
+import os
+import shutil
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import lightgbm as lgb
+
+from app.config import resolve_path, settings
+from ml.training_data import FEATURE_SCHEMA_VERSION, HORIZON_DAYS, LEGACY_FEATURE_SCHEMA_VERSION
+
+MANIFEST_NAME = "registry.json"
+
+# 同時に影で予測するチャレンジャーの最大数（超えたら古いものから外す）
+MAX_CHALLENGERS = 3
+
+
+class ModelVersion(NamedTuple):
+    """登録済みのモデル"""
+    version: str
+    model: lgb.Booster
+    meta: Dict[str, Any]
+
+    @property
+    def feature_names(self) -> List[str]:
+        return self.meta.get("features") or self.model.feature_name()
+
+    @property
+    def feature_version(self) -> int:
+        """学習に使った特徴量の計算方法のバージョン（ml.training_data.FEATURE_SCHEMA_VERSION）"""
+        return self.meta.get("feature_version", LEGACY_FEATURE_SCHEMA_VERSION)
+
+
+class RegistryState(NamedTuple):
+    """ある時点のチャンピオンとチャレンジャー"""
+    champion: Optional[ModelVersion]
+    challengers: List[ModelVersion]
+
+
+EMPTY_STATE = RegistryState(None, [])
+
+
+def _write_json_atomic(path: str, data: Dict[str, Any]):
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2, default=str)
+    os.replace(tmp_path, path)
+
+
+class ModelRegistry:
+    """バージョン管理されたモデルの保存先"""
+
+    def __init__(self, root: str):
+        self.root = root
+        self.manifest_path = os.path.join(root, MANIFEST_NAME)
+        self._lock = threading.Lock()
+        self._versions: Dict[str, ModelVersion] = {}
+        self._state: RegistryState = EMPTY_STATE
+        self._stat: Optional[Tuple[int, int]] = None
+        self.checksum: Optional[str] = None
+        self.loaded_at: Optional[datetime] = None
+
+    # ---- 読み込み ----
+
+    def _current_stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = os.stat(self.manifest_path)
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def state(self) -> RegistryState:
+        """現在のチャンピオンとチャレンジャー。registry.json が更新されていれば読み込み直す"""
+        stat = self._current_stat()
+        if stat == self._stat:
+            return self._state
+
+        with self._lock:
+            stat = self._current_stat()
+            if stat != self._stat:
+                self._reload(stat)
+            return self._state
+
+    def champion(self) -> Optional[ModelVersion]:
+        return self.state().champion
+
+    def _reload(self, stat: Optional[Tuple[int, int]]):
+        if stat is None:
+            self._state, self._stat, self.checksum, self.loaded_at = EMPTY_STATE, None, None, None
+            return
+
+        with open(self.manifest_path, "rb") as f:
+            content = f.read()
+        checksum = hashlib.sha256(content).hexdigest()
+
+        # 更新時刻だけ変わって内容が同じなら読み込み直さない
+        if checksum != self.checksum:
+            manifest = json.loads(content)
+            champion = manifest.get("champion")
+            self._state = RegistryState(
+                champion=self._servable(champion) if champion else None,
+                challengers=[m for m in map(self._servable, manifest.get("challengers", [])) if m is not None],
+            )
+            self.checksum = checksum
+            self.loaded_at = datetime.utcnow()
+            print(f"モデルを読み込みました: champion={self._state.champion.version if self._state.champion else None} "
+                  f"challengers={[m.version for m in self._state.challengers]}")
+        self._stat = stat
+
+    def load(self, version: str) -> ModelVersion:
+        """バージョンを読み込み（読み込み済みならキャッシュから）"""
+        if version not in self._versions:
+            version_dir = os.path.join(self.root, version)
+            with open(os.path.join(version_dir, "model.txt"), encoding="utf-8") as f:
+                model = lgb.Booster(model_str=f.read())
+            self._versions[version] = ModelVersion(version, model, self.read_meta(version))
+        return self._versions[version]
+
+    def _servable(self, version: str) -> Optional[ModelVersion]:
+        """予測に使えるバージョン（特徴量の計算方法が今と違えば None）"""
+        model = self.load(version)
+        if model.feature_version != FEATURE_SCHEMA_VERSION:
+            print(f"{version} は特徴量のバージョンが異なるため使いません"
+                  f"（{model.feature_version} != {FEATURE_SCHEMA_VERSION}。全データで学習し直してください）")
+            return None
+        return model
+
+    def read_meta(self, version: str) -> Dict[str, Any]:
+        """バージョンのメタデータ"""
+        with open(os.path.join(self.root, version, "meta.json"), encoding="utf-8") as f:
+            return json.load(f)
+
+    def read_manifest(self) -> Dict[str, Any]:
+        """registry.json の内容（なければ空）"""
+        if not os.path.exists(self.manifest_path):
+            return {"champion": None, "challengers": []}
+        with open(self.manifest_path, encoding="utf-8") as f:
+            return json.load(f)
+
+    def list_versions(self) -> List[str]:
+        """登録済みのバージョン（古い順）"""
+        if not os.path.isdir(self.root):
+            return []
+        return sorted(
+            name for name in os.listdir(self.root)
+            if not name.startswith("_") and os.path.exists(os.path.join(self.root, name, "meta.json"))
+        )
+
+    def latest_descendant(self, version: str) -> str:
+        """
+        version から継続学習（meta の metrics.base_version）でたどれる最新のバージョン（なければ version）
+
+        継続学習はチャンピオンに昇格しなかったバージョンからも続けるため、次の継続学習の元を探すのに使う。
+        """
+        versions = self.list_versions()
+        parents = {v: (self.read_meta(v).get("metrics") or {}).get("base_version") for v in versions}
+        latest = version
+        for candidate in versions:  # 古い順
+            ancestor = candidate
+            while ancestor is not None and ancestor != version:
+                ancestor = parents.get(ancestor)
+            if ancestor == version:
+                latest = candidate
+        return latest
+
+    # ---- 書き込み ----
+
+    def register(
+        self,
+        model: lgb.Booster,
+        metrics: Dict[str, Any],
+        features: List[str],
+        data_fingerprint: Optional[str],
+        params: Optional[Dict[str, Any]] = None,
+        role: str = "challenger",
+        feature_baseline: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        """
+        新しいバージョンを保存
+
+        Args:
+            role: "champion"（すぐに本番で使う）/ "challenger"（影で予測する）/ "none"（保存のみ）
+            feature_baseline: 学習データの特徴量ごとのビンの境界と件数（ml.drift.feature_baseline。ドリフトの比較元）
+
+        Returns:
+            バージョン名
+        """
+        created_at = datetime.utcnow()
+        version = f"{created_at:%Y%m%d-%H%M%S}-{(data_fingerprint or 'unknown')[:8]}"
+        meta = {
+            "version": version,
+            "created_at": created_at.isoformat(),
+            "metrics": metrics,
+            "features": features,
+            "data_fingerprint": data_fingerprint,
+            "params": params or {},
+            "feature_baseline": feature_baseline,
+            "feature_version": FEATURE_SCHEMA_VERSION,
+        }
+
+        os.makedirs(self.root, exist_ok=True)
+        tmp_dir = os.path.join(self.root, f"_tmp-{version}")
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        os.makedirs(tmp_dir)
+        model.save_model(os.path.join(tmp_dir, "model.txt"))
+        _write_json_atomic(os.path.join(tmp_dir, "meta.json"), meta)
+        os.replace(tmp_dir, os.path.join(self.root, version))
+
+        if role == "champion":
+            self.promote(version)
+        elif role == "challenger":
+            self.add_challenger(version)
+        return version
+
+    def _update_manifest(self, champion: Optional[str], challengers: List[str]):
+        challengers = [v for v in dict.fromkeys(challengers) if v != champion][-MAX_CHALLENGERS:]
+        _write_json_atomic(self.manifest_path, {
+            "champion": champion,
+            "challengers": challengers,
+            "updated_at": datetime.utcnow().isoformat(),
+        })
+        with self._lock:
+            self._reload(self._current_stat())
+
+    def promote(self, version: str):
+        """バージョンをチャンピオンにする（チャレンジャーからは外す）"""
+        self._require(version)
+        manifest = self.read_manifest()
+        self._update_manifest(version, manifest.get("challengers", []))
+
+    def add_challenger(self, version: str):
+        """バージョンをチャレンジャーに加える"""
+        self._require(version)
+        manifest = self.read_manifest()
+        self._update_manifest(manifest.get("champion"), manifest.get("challengers", []) + [version])
+
+    def retire(self, version: str):
+        """バージョンをチャレンジャーから外す（ファイルは残す）"""
+        manifest = self.read_manifest()
+        challengers = [v for v in manifest.get("challengers", []) if v != version]
+        self._update_manifest(manifest.get("champion"), challengers)
+
+    def _require(self, version: str):
+        if version not in self.list_versions():
+            raise ValueError(f"バージョンが見つかりません: {version}")
+        feature_version = self.read_meta(version).get("feature_version", LEGACY_FEATURE_SCHEMA_VERSION)
+        if feature_version != FEATURE_SCHEMA_VERSION:
+            raise ValueError(f"{version} は特徴量のバージョンが異なります（{feature_version} != {FEATURE_SCHEMA_VERSION}）")
+
+
+_registries: Dict[str, ModelRegistry] = {}
+_registries_lock = threading.Lock()
+
+
+def horizon_registry_dir(horizon_days: int, root: Optional[str] = None) -> str:
+    """予測期間のモデルの保存先（180日は root 直下、それ以外は root/h{日数}）"""
+    root = root or settings.MODEL_REGISTRY_DIR
+    return root if horizon_days == HORIZON_DAYS else os.path.join(root, f"h{horizon_days}")
+
+
+def get_registry(root: Optional[str] = None) -> ModelRegistry:
+    """保存先ごとに1つのレジストリを返す（省略時は settings.MODEL_REGISTRY_DIR）"""
+    key = os.path.normpath(resolve_path(root or settings.MODEL_REGISTRY_DIR))
+    with _registries_lock:
+        if key not in _registries:
+            _registries[key] = ModelRegistry(key)
+        return _registries[key]
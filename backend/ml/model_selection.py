@@ -0,0 +1,222 @@
+"""
+時系列交差検証とハイパーパラメータ探索
+
+学習データ（ml.training_data.build_snapshot_dataset）の基準時刻 as_of で前向きに分割する。
+各フォールドは検証時点より前の時点だけで学習し、検証時点の行で評価する。
+正解ラベルは基準時刻から horizon 日後までのデータを含むため、検証時点との間隔が gap_days 未満の
+時点は学習に使わない（ラベルの期間が検証時点より後にはみ出して未来の情報が混ざるのを防ぐ）。
+
+パラメータの組み合わせはプロセスプールで並列に評価する。1プロセスあたりの LightGBM のスレッド数は
+CPUコア数 / プロセス数にして、プロセス数 × スレッド数がコア数を超えないようにする。
+フォールドのデータセットは探索の前に親プロセスで ml.dataset_cache に保存し、各ワーカーは
+ビン分割済みのバイナリを読み込む。
+"""
+import itertools
+import json
+import multiprocessing
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from datetime import timedelta
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import lightgbm as lgb
+import numpy as np
+import pandas as pd
+from sklearn.metrics import mean_squared_error, r2_score
+
+from ml.dataset_cache import cached_dataset, dataset_params
+from ml.training_data import HORIZON_DAYS
+
+# 探索するパラメータ（全組み合わせ）
+PARAM_GRID = {
+    "num_leaves": [15, 31, 63],
+    "learning_rate": [0.03, 0.05, 0.1],
+    "min_data_in_leaf": [20, 50],
+    "feature_fraction": [0.8, 0.9],
+}
+
+# フォールドの数（最新の時点から数えて）
+N_FOLDS = 4
+# 1フォールドの最大ラウンド数と early stopping のラウンド数
+NUM_BOOST_ROUND = 1000
+EARLY_STOPPING_ROUNDS = 50
+
+
+class Fold(NamedTuple):
+    """時系列CVの1フォールド"""
+    as_of: Any  # 検証に使う基準時刻
+    train_index: np.ndarray
+    val_index: np.ndarray
+
+
+def time_series_folds(
+    as_of: pd.Series,
+    n_folds: int = N_FOLDS,
+    gap_days: int = HORIZON_DAYS,
+) -> List[Fold]:
+    """
+    基準時刻で前向きに分割したフォールド（古い順）
+
+    最新の基準時刻から順に検証時点にし、学習に使える時点（検証時点より gap_days 日以上前）が
+    1つ以上あるものを最大 n_folds 個選ぶ。
+
+    Args:
+        as_of: 学習データの各行の基準時刻
+    """
+    as_of = pd.to_datetime(as_of).reset_index(drop=True)
+    dates = sorted(as_of.unique())
+    gap = pd.Timedelta(timedelta(days=gap_days))
+
+    folds = []
+    for val_date in reversed(dates):
+        if len(folds) >= n_folds:
+            break
+        train_mask = (as_of + gap <= val_date).to_numpy()
+        if not train_mask.any():
+            continue
+        folds.append(Fold(
+            as_of=pd.Timestamp(val_date).to_pydatetime(),
+            train_index=np.flatnonzero(train_mask),
+            val_index=np.flatnonzero((as_of == val_date).to_numpy()),
+        ))
+    return list(reversed(folds))
+
+
+def param_candidates(grid: Optional[Dict[str, List[Any]]] = None,
+                     max_configs: Optional[int] = None, seed: int = 42) -> List[Dict[str, Any]]:
+    """
+    探索するパラメータの組み合わせ
+
+    max_configs を指定すると、全組み合わせから固定シードでその数だけ選ぶ。
+    """
+    grid = grid or PARAM_GRID
+    keys = list(grid)
+    candidates = [dict(zip(keys, values)) for values in itertools.product(*(grid[k] for k in keys))]
+    if max_configs is not None and max_configs < len(candidates):
+        candidates = random.Random(seed).sample(candidates, max_configs)
+    return candidates
+
+
+# ---- ワーカープロセス ----
+
+_worker_data: Dict[str, Any] = {}
+
+
+def _init_worker(X: np.ndarray, y: np.ndarray, folds: List[Fold], num_threads: int):
+    """ワーカーごとに1回だけ学習データを受け取る（パラメータごとに送り直さない）"""
+    _worker_data.update(X=X, y=y, folds=folds, num_threads=num_threads)
+
+
+def _fold_datasets(X: np.ndarray, y: np.ndarray, fold: Fold,
+                   params: Dict[str, Any]) -> Tuple[lgb.Dataset, lgb.Dataset]:
+    """フォールドの学習・検証データセット（キャッシュから）"""
+    train_data, train_key = cached_dataset(X[fold.train_index], y[fold.train_index], params)
+    val_data, _ = cached_dataset(X[fold.val_index], y[fold.val_index], params,
+                                 reference=(train_data, train_key))
+    return train_data, val_data
+
+
+def _evaluate(params: Dict[str, Any]) -> Dict[str, Any]:
+    """1つのパラメータを全フォールドで評価"""
+    X, y = _worker_data["X"], _worker_data["y"]
+    params = {**params, "num_threads": _worker_data["num_threads"]}
+
+    fold_results = []
+    for fold in _worker_data["folds"]:
+        train_data, val_data = _fold_datasets(X, y, fold, params)
+        model = lgb.train(
+            params,
+            train_data,
+            num_boost_round=NUM_BOOST_ROUND,
+            valid_sets=[val_data],
+            callbacks=[lgb.early_stopping(stopping_rounds=EARLY_STOPPING_ROUNDS, verbose=False)],
+        )
+        y_val = y[fold.val_index]
+        y_pred = model.predict(X[fold.val_index], num_iteration=model.best_iteration)
+        fold_results.append({
+            "as_of": fold.as_of.isoformat(),
+            "train_rows": int(len(fold.train_index)),
+            "val_rows": int(len(fold.val_index)),
+            "rmse": float(np.sqrt(mean_squared_error(y_val, y_pred))),
+            "r2": float(r2_score(y_val, y_pred)) if len(y_val) > 1 else None,
+            "best_iteration": int(model.best_iteration or NUM_BOOST_ROUND),
+        })
+
+    r2_values = [f["r2"] for f in fold_results if f["r2"] is not None]
+    return {
+        "params": {k: v for k, v in params.items() if k != "num_threads"},
+        "rmse": float(np.mean([f["rmse"] for f in fold_results])),
+        "r2": float(np.mean(r2_values)) if r2_values else None,
+        "best_iteration": int(round(np.mean([f["best_iteration"] for f in fold_results]))),
+        "folds": fold_results,
+    }
+
+
+# ---- 探索 ----
+
+def search(
+    X: pd.DataFrame,
+    y: pd.Series,
+    as_of: pd.Series,
+    base_params: Dict[str, Any],
+    grid: Optional[Dict[str, List[Any]]] = None,
+    n_folds: int = N_FOLDS,
+    gap_days: int = HORIZON_DAYS,
+    n_jobs: Optional[int] = None,
+    max_configs: Optional[int] = None,
+) -> Dict[str, Any]:
+    """
+    時系列CVでパラメータを探索
+
+    Args:
+        X: 特徴量（欠損は埋めておく）
+        y: 正解ラベル
+        as_of: 各行の基準時刻
+        base_params: 全組み合わせに共通のパラメータ（探索するパラメータで上書きする）
+        n_jobs: プロセス数（省略時はCPUコア数）
+
+    Returns:
+        best（最良の設定: params, rmse, r2, best_iteration, folds）と
+        configs（全設定の結果、RMSEの小さい順）を持つ辞書
+
+    Raises:
+        ValueError: フォールドを作れるだけの時点がない場合
+    """
+    folds = time_series_folds(as_of, n_folds, gap_days)
+    if not folds:
+        raise ValueError(
+            f"時系列CVに必要な時点が不足しています（検証時点より {gap_days} 日以上前の時点が必要）"
+        )
+
+    candidates = [{**base_params, **params} for params in param_candidates(grid, max_configs)]
+    cpu_count = os.cpu_count() or 1
+    n_jobs = max(1, min(n_jobs or cpu_count, len(candidates)))
+    num_threads = max(1, cpu_count // n_jobs)
+    print(f"時系列CV: {len(folds)}フォールド × {len(candidates)}設定 "
+          f"({n_jobs}プロセス × {num_threads}スレッド)")
+
+    X_values = X.to_numpy(dtype=np.float64)
+    y_values = y.to_numpy(dtype=np.float64)
+
+    # ビン分割に影響するパラメータが同じ設定は同じデータセットを使うため、先に1回ずつ作って保存しておく
+    warm = {json.dumps(dataset_params(params), sort_keys=True, default=str): params for params in candidates}
+    for params in warm.values():
+        for fold in folds:
+            _fold_datasets(X_values, y_values, fold, params)
+
+    if n_jobs == 1:
+        _init_worker(X_values, y_values, folds, num_threads)
+        results = [_evaluate(params) for params in candidates]
+    else:
+        # fork だと親プロセスの OpenMP の状態を引き継いで止まることがあるため spawn で起動する
+        with ProcessPoolExecutor(
+            max_workers=n_jobs,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_init_worker,
+            initargs=(X_values, y_values, folds, num_threads),
+        ) as pool:
+            results = list(pool.map(_evaluate, candidates))
+
+    results.sort(key=lambda r: r["rmse"])
+    return {"best": results[0], "configs": results}
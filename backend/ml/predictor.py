@@ -1,12 +1,16 @@
-import os
-import pickle
-from typing import Dict, Any, Optional, List
+import json
+from typing import Dict, Any, Optional, List, Tuple, Union
 import numpy as np
 import pandas as pd
 import lightgbm as lgb
-from sklearn.model_selection import train_test_split
 from sklearn.metrics import mean_squared_error, r2_score
 
+from ml import model_selection
+from ml.drift import feature_baseline
+from ml.dataset_cache import cached_dataset
+from ml.model_registry import ModelRegistry, ModelVersion, RegistryState, get_registry, horizon_registry_dir
+from ml.training_data import FEATURE_SCHEMA_VERSION, HORIZON_DAYS, data_fingerprint
+
 
 class GrowthPredictor:
     """YouTuberの成長予測を行うLightGBMモデル"""
@@ -30,23 +34,49 @@ class GrowthPredictor:
         "channel_age_days",
     ]
 
-    def __init__(self, model_path: str = "ml/model.pkl"):
-        self.model_path = model_path
-        self.model: Optional[lgb.Booster] = None
-        self._load_model()
+    # 学習パラメータ（train_cv では探索するパラメータで上書きする）
+    PARAMS = {
+        "objective": "regression",
+        "metric": "rmse",
+        "boosting_type": "gbdt",
+        "num_leaves": 31,
+        "learning_rate": 0.05,
+        "feature_fraction": 0.9,
+        "bagging_fraction": 0.8,
+        "bagging_freq": 5,
+        "verbose": -1,
+    }
+
+    # 予測ごとに保存する寄与（pred_contrib）の上位件数
+    CONTRIBUTION_TOP_K = 5
+
+    # 継続学習で追加する最大ラウンド数と early stopping のラウンド数
+    INCREMENTAL_ROUNDS = 100
+    INCREMENTAL_EARLY_STOPPING_ROUNDS = 20
+    # 継続学習を重ねられる回数（超えたら全データで学習し直す）
+    MAX_INCREMENTAL_DEPTH = 30
+
+    def __init__(self, registry_dir: Optional[str] = None, horizon_days: int = HORIZON_DAYS):
+        """
+        Args:
+            registry_dir: モデルの保存先（省略時は settings.MODEL_REGISTRY_DIR）。
+                          同じ保存先の GrowthPredictor はプロセス内で読み込み済みのモデルを共有する
+            horizon_days: 予測期間（日）。期間ごとに別のモデルを使う（保存先は horizon_registry_dir）
+        """
+        self.horizon_days = horizon_days
+        self.registry: ModelRegistry = get_registry(horizon_registry_dir(horizon_days, registry_dir))
 
-    def _load_model(self):
-        """保存されたモデルを読み込み"""
-        if os.path.exists(self.model_path):
-            with open(self.model_path, "rb") as f:
-                self.model = pickle.load(f)
+    @property
+    def model(self) -> Optional[lgb.Booster]:
+        """チャンピオンのモデル（registry.json が更新されていれば読み込み直したもの）"""
+        champion = self.registry.champion()
+        return champion.model if champion else None
 
-    def save_model(self):
-        """モデルを保存"""
-        if self.model:
-            os.makedirs(os.path.dirname(self.model_path), exist_ok=True)
-            with open(self.model_path, "wb") as f:
-                pickle.dump(self.model, f)
+    @property
+    def version(self) -> Optional[str]:
+        """チャンピオンのバージョン（モデルがなければ None）"""
+        champion = self.registry.champion()
+        return champion.version if champion else None
 
     def prepare_features(self, channel_data: Dict[str, Any]) -> np.ndarray:
         """
@@ -65,9 +95,25 @@ class GrowthPredictor:
 
         return np.array(features).reshape(1, -1)
 
+    def feature_frame(self, data: Union[pd.DataFrame, np.ndarray, List[Dict[str, Any]]],
+                      columns: Optional[List[str]] = None) -> pd.DataFrame:
+        """
+        複数チャンネルのデータを特徴量の列順の float の DataFrame にそろえる（欠損は NaN）
+
+        Args:
+            data: DataFrame・特徴量の辞書のリスト・FEATURE_COLUMNS 順の行列のいずれか
+            columns: 特徴量の列（省略時は FEATURE_COLUMNS）
+        """
+        columns = columns or self.FEATURE_COLUMNS
+        if isinstance(data, np.ndarray):
+            return pd.DataFrame(data, columns=self.FEATURE_COLUMNS, dtype=float).reindex(columns=columns)
+        if not isinstance(data, pd.DataFrame):
+            data = pd.DataFrame(list(data))
+        return data.reindex(columns=columns).astype(float)
+
     def predict(self, channel_data: Dict[str, Any]) -> Dict[str, float]:
         """
-        半年後の成長率を予測
+        予測期間（horizon_days）後の成長率を予測
 
         Args:
             channel_data: チャンネルの各種データ
@@ -75,64 +121,171 @@ class GrowthPredictor:
         Returns:
             予測結果（成長率、信頼度）
         """
-        if self.model is None:
-            # モデルがない場合はルールベースで予測
-            return self._rule_based_prediction(channel_data)
+        result = self.predict_batch([channel_data]).iloc[0]
+        return {
+            "predicted_growth_rate": float(result["predicted_growth_rate"]),
+            "confidence_score": float(result["confidence_score"]),
+        }
+
+    def predict_batch(self, data: Union[pd.DataFrame, np.ndarray, List[Dict[str, Any]]]) -> pd.DataFrame:
+        """
+        複数チャンネルの予測期間後の成長率をまとめて予測（モデルの呼び出しは1回）
 
-        features = self.prepare_features(channel_data)
-        prediction = self.model.predict(features)[0]
+        Args:
+            data: DataFrame・特徴量の辞書のリスト・FEATURE_COLUMNS 順の行列のいずれか
 
-        # 信頼度の計算（特徴量の欠損が少ないほど高い）
-        non_null_count = sum(1 for col in self.FEATURE_COLUMNS if channel_data.get(col) is not None)
-        confidence = non_null_count / len(self.FEATURE_COLUMNS)
+        Returns:
+            predicted_growth_rate, confidence_score の DataFrame（入力が DataFrame ならインデックスを引き継ぐ）
+        """
+        # 途中でモデルが差し替わっても1回の予測では同じモデルを使う
+        return self._predict_version(self.feature_frame(data), self.registry.champion())
+
+    def predict_with_challengers(
+        self,
+        data: Union[pd.DataFrame, np.ndarray, List[Dict[str, Any]]],
+        state: Optional[RegistryState] = None,
+        contributions: bool = False,
+    ) -> Tuple[Optional[str], pd.DataFrame, Dict[str, pd.DataFrame]]:
+        """
+        チャンピオンと全チャレンジャーで同じ特徴量をまとめて予測
 
-        return {
-            "predicted_growth_rate": float(prediction),
-            "confidence_score": float(confidence)
+        Args:
+            state: 使うモデルの組（省略時は現在のもの）
+            contributions: チャンピオンの予測に特徴量ごとの寄与の上位（contributions 列）を付ける
+
+        Returns:
+            (チャンピオンのバージョン, チャンピオンの予測, {チャレンジャーのバージョン: 予測})
+        """
+        state = state or self.registry.state()
+        X = self.feature_frame(data)
+        champion = self._predict_version(X, state.champion, contributions)
+        challengers = {
+            challenger.version: self._predict_version(X, challenger)
+            for challenger in state.challengers
         }
+        return (state.champion.version if state.champion else None), champion, challengers
 
-    def _rule_based_prediction(self, channel_data: Dict[str, Any]) -> Dict[str, float]:
+    def predict_versions(
+        self,
+        data: Union[pd.DataFrame, np.ndarray, List[Dict[str, Any]]],
+        versions: Dict[str, Optional[ModelVersion]],
+    ) -> Dict[str, pd.DataFrame]:
+        """
+        同じ特徴量を指定したモデルでまとめて予測（バックテスト用）
+
+        Args:
+            versions: {表示名: モデルのバージョン（None はルールベース）}
+        """
+        X = self.feature_frame(data)
+        return {name: self._predict_version(X, version) for name, version in versions.items()}
+
+    def _predict_version(self, X: pd.DataFrame, version: Optional[ModelVersion],
+                         contributions: bool = False) -> pd.DataFrame:
+        """
+        feature_frame の結果をモデルのバージョンで予測（None ならルールベース）
+
+        contributions=True の場合は pred_contrib で予測し（寄与の合計が予測値）、
+        上位の寄与を contributions 列に付ける（ルールベースは None）。
+        """
+        # 信頼度の計算（特徴量の欠損が少ないほど高い）
+        confidence = X.notna().sum(axis=1) / len(self.FEATURE_COLUMNS)
+        explained = [None] * len(X)
+
+        if version is None:
+            # モデルがない場合はルールベースで予測
+            growth = self._rule_based_growth(X)
+            confidence = confidence * 0.7  # ルールベースなので70%に抑える
+        elif len(X) == 0:
+            growth = np.empty(0)
+        else:
+            columns = version.feature_names
+            matrix = X.to_numpy() if columns == self.FEATURE_COLUMNS else X.reindex(columns=columns).to_numpy()
+            matrix = np.nan_to_num(matrix, nan=0.0)
+            if contributions:
+                contrib = version.model.predict(matrix, pred_contrib=True)
+                growth = contrib.sum(axis=1)
+                explained = self.top_contributions(contrib, columns, matrix)
+            else:
+                growth = version.model.predict(matrix)
+
+        result = pd.DataFrame({
+            "predicted_growth_rate": np.asarray(growth, dtype=float),
+            "confidence_score": confidence.to_numpy(dtype=float),
+        }, index=X.index)
+        if contributions:
+            result["contributions"] = explained
+        return result
+
+    def top_contributions(self, contrib: np.ndarray, columns: List[str], matrix: np.ndarray) -> List[str]:
+        """
+        pred_contrib の結果から各行の寄与の上位を保存用の JSON にする
+
+        形式: {"base": 期待値, "top": [[特徴量, 寄与, 特徴量の値], ...]}（寄与の絶対値の大きい順）
+        """
+        k = min(self.CONTRIBUTION_TOP_K, len(columns))
+        feature_contrib = contrib[:, :-1]
+        order = np.argsort(-np.abs(feature_contrib), axis=1, kind="stable")[:, :k]
+        rows = np.arange(len(contrib))[:, None]
+        top_values = feature_contrib[rows, order]
+        top_inputs = matrix[rows, order]
+
+        explained = []
+        for base, indices, values, inputs in zip(contrib[:, -1], order, top_values, top_inputs):
+            explained.append(json.dumps({
+                "base": round(float(base), 6),
+                "top": [[columns[i], round(float(v), 6), round(float(x), 6)]
+                        for i, v, x in zip(indices, values, inputs)],
+            }, separators=(",", ":")))
+        return explained
+
+    def _rule_based_growth(self, X: pd.DataFrame) -> np.ndarray:
         """
         モデルがない場合のルールベース予測
 
-        直近の成長率とトレンドスコアを基に予測
+        直近の成長率とトレンドスコアを基に予測（X は feature_frame の結果、欠損・0 は既定値として扱う）
         """
+        def value_or(col: str, default: float) -> np.ndarray:
+            values = X[col].fillna(0).to_numpy()
+            return np.where(values != 0, values, default)
+
         # 直近の成長率（30日）を基準に
-        growth_30d = channel_data.get("subscriber_growth_rate_30d", 0) or 0
-        growth_90d = channel_data.get("subscriber_growth_rate_90d", 0) or 0
+        growth_30d = value_or("subscriber_growth_rate_30d", 0)
+        growth_90d = value_or("subscriber_growth_rate_90d", 0)
 
         # トレンドスコアによる調整
-        trend_score = channel_data.get("trend_score", 50) or 50
+        trend_score = value_or("trend_score", 50)
         trend_factor = (trend_score - 50) / 100  # -0.5 ~ 0.5
 
         # ニュース数による調整
-        news_count = channel_data.get("news_count", 0) or 0
-        news_factor = min(news_count * 0.01, 0.1)  # 最大10%上乗せ
+        news_count = value_or("news_count", 0)
+        news_factor = np.minimum(news_count * 0.01, 0.1)  # 最大10%上乗せ
 
         # 投稿頻度による調整
-        upload_frequency = channel_data.get("upload_frequency", 0) or 0
-        upload_factor = min(upload_frequency * 0.5, 0.1)  # 定期投稿で上乗せ
+        upload_frequency = value_or("upload_frequency", 0)
+        upload_factor = np.minimum(upload_frequency * 0.5, 0.1)  # 定期投稿で上乗せ
 
-        # 半年後の成長率を推定（月次成長率 × 6 + 調整）
-        base_growth = (growth_30d + growth_90d / 3) / 2 * 6
-        adjusted_growth = base_growth * (1 + trend_factor) + news_factor + upload_factor
+        # 予測期間後の成長率を推定（月次成長率 × 月数 + 調整）
+        base_growth = (growth_30d + growth_90d / 3) / 2 * (self.horizon_days / 30)
+        return base_growth * (1 + trend_factor) + news_factor + upload_factor
 
-        # 信頼度（ルールベースは低め）
-        non_null_count = sum(1 for col in self.FEATURE_COLUMNS if channel_data.get(col) is not None)
-        confidence = (non_null_count / len(self.FEATURE_COLUMNS)) * 0.7  # ルールベースなので70%に抑える
-
-        return {
-            "predicted_growth_rate": float(adjusted_growth),
-            "confidence_score": float(confidence)
-        }
-
-    def train(self, training_data: pd.DataFrame, target_column: str = "actual_growth_rate"):
+    def train(self, training_data: pd.DataFrame, target_column: str = "actual_growth_rate",
+              role: str = "challenger"):
         """
-        モデルを学習
+        モデルを学習して新しいバージョンとして登録
+
+        検証データは最新の基準時刻の行で、学習には検証時点より予測期間以上前の基準時刻の行だけを使う
+        （time_series_folds の最後のフォールド。正解の期間が検証と重なる行を学習に入れない）。
+        履歴が予測期間より短い場合は、検証より前のすべての基準時刻の行で学習する（train_incremental と同じ）。
+        early stopping で決めたラウンド数で、最後に全データを学習し直す（train_cv と同じ）。
 
         Args:
-            training_data: 学習データ（特徴量 + 正解ラベル）
+            training_data: 学習データ（特徴量 + 正解ラベル + 基準時刻の as_of）
             target_column: 正解ラベルのカラム名
+            role: 登録後の扱い（"champion" / "challenger" / "none"）。
+                  チャンピオンがまだない場合は常にチャンピオンにする
+
+        Raises:
+            ValueError: 基準時刻が1つしかなく検証データを分けられない場合
         """
         # 特徴量とターゲットを分離
         X = training_data[self.FEATURE_COLUMNS]
@@ -141,52 +294,283 @@ class GrowthPredictor:
         # 欠損値を0で埋める
         X = X.fillna(0)
 
-        # 学習データと検証データに分割
-        X_train, X_val, y_train, y_val = train_test_split(X, y, test_size=0.2, random_state=42)
-
-        # LightGBMのデータセット
-        train_data = lgb.Dataset(X_train, label=y_train)
-        val_data = lgb.Dataset(X_val, label=y_val, reference=train_data)
+        # 最新の基準時刻を検証に分ける（ランダムに分けると同じチャンネル・同じ時期の行が学習と検証の両方に入る）
+        gap_days = self.horizon_days
+        folds = model_selection.time_series_folds(training_data["as_of"], n_folds=1, gap_days=gap_days)
+        if not folds:
+            print(f"最新の基準時刻より {gap_days} 日以上前の基準時刻がないため、検証より前のすべての基準時刻で学習します")
+            gap_days = 0
+            as_of = pd.to_datetime(training_data["as_of"]).reset_index(drop=True)
+            is_val = (as_of == as_of.max()).to_numpy()
+            if is_val.all():
+                raise ValueError("基準時刻が1つしかないため、検証データを分けられません")
+            folds = [model_selection.Fold(as_of=as_of.max().to_pydatetime(), train_index=np.flatnonzero(~is_val),
+                                          val_index=np.flatnonzero(is_val))]
+        fold = folds[-1]
+        X_train, X_val = X.iloc[fold.train_index], X.iloc[fold.val_index]
+        y_train, y_val = y.iloc[fold.train_index], y.iloc[fold.val_index]
 
         # パラメータ
-        params = {
-            "objective": "regression",
-            "metric": "rmse",
-            "boosting_type": "gbdt",
-            "num_leaves": 31,
-            "learning_rate": 0.05,
-            "feature_fraction": 0.9,
-            "bagging_fraction": 0.8,
-            "bagging_freq": 5,
-            "verbose": -1,
-        }
+        params = dict(self.PARAMS)
+
+        # LightGBMのデータセット（同じ学習データならビン分割済みのキャッシュを読み込む）
+        train_data, train_key = cached_dataset(X_train, y_train, params)
+        val_data, _ = cached_dataset(X_val, y_val, params, reference=(train_data, train_key))
 
         # 学習
-        self.model = lgb.train(
+        holdout_model = lgb.train(
             params,
             train_data,
             num_boost_round=1000,
             valid_sets=[train_data, val_data],
             callbacks=[lgb.early_stopping(stopping_rounds=50)]
         )
+        best_iteration = holdout_model.best_iteration or holdout_model.current_iteration()
 
         # 評価
-        y_pred = self.model.predict(X_val)
+        y_pred = holdout_model.predict(X_val, num_iteration=best_iteration)
         rmse = np.sqrt(mean_squared_error(y_val, y_pred))
         r2 = r2_score(y_val, y_pred)
 
+        # 全データで学習し直す
+        all_data, _ = cached_dataset(X, y, params)
+        model = lgb.train(params, all_data, num_boost_round=best_iteration)
+
         print(f"Validation RMSE: {rmse:.4f}")
         print(f"Validation R2: {r2:.4f}")
 
         # モデルを保存
-        self.save_model()
+        metrics = {
+            "rmse": float(rmse),
+            "r2": float(r2),
+            "train_rows": len(X),
+            "holdout_train_rows": len(X_train),
+            "val_rows": len(X_val),
+            "val_as_of": pd.Timestamp(fold.as_of).isoformat(),
+            "val_gap_days": gap_days,
+            "best_iteration": best_iteration,
+            "data_as_of_max": self._data_as_of_max(training_data),
+            "incremental_depth": 0,
+            "horizon_days": self.horizon_days,
+            **self._validation_drift(X_val, y_val, rmse, self.registry.champion()),
+        }
+        if self.registry.champion() is None:
+            role = "champion"
+        version = self.registry.register(
+            model,
+            metrics=metrics,
+            features=list(self.FEATURE_COLUMNS),
+            data_fingerprint=data_fingerprint(training_data, self.FEATURE_COLUMNS + [target_column]),
+            params=params,
+            role=role,
+            feature_baseline=feature_baseline(training_data, self.FEATURE_COLUMNS),
+        )
+
+        return {**metrics, "version": version, "role": role}
+
+    def train_incremental(self, training_data: pd.DataFrame, target_column: str = "actual_growth_rate",
+                          role: str = "challenger", base_version: Optional[str] = None):
+        """
+        登録済みのモデルから継続して学習（init_model）し、新しいバージョンとして登録
+
+        元のモデルの学習データより新しい基準時刻（as_of > data_as_of_max）の行だけを使い、
+        最大 INCREMENTAL_ROUNDS ラウンドの木を追加する。検証データは新しい行のうち最新の基準時刻の行
+        （学習には検証より前の基準時刻の行だけを使う）。
+
+        Args:
+            training_data: 学習データ（as_of カラムが必要。古い行は含まれていても無視する）
+            role: 登録の扱い。"auto" は同じ検証データでチャンピオンよりRMSEが悪くなければチャンピオンにし、
+                  悪ければ保存だけする（チャレンジャーの枠を使わない）
+            base_version: 元にするバージョン（省略時はチャンピオン）
+
+        Returns:
+            評価指標（元のモデルと同じ検証データでの差 rmse_drift を含む）、バージョン、役割
+
+        Raises:
+            ValueError: 元のモデルがない、全データでの学習が必要、または新しい行・基準時刻が足りない場合
+        """
+        base = self.registry.load(base_version) if base_version else self.registry.champion()
+        if base is None:
+            raise ValueError("継続学習の元になるモデルがありません")
+        base_metrics = base.meta.get("metrics") or {}
+        since = base_metrics.get("data_as_of_max")
+        if since is None:
+            raise ValueError(f"{base.version} は学習データの期間が記録されていないため継続学習できません")
+        if base.feature_names != list(self.FEATURE_COLUMNS) or base.feature_version != FEATURE_SCHEMA_VERSION:
+            raise ValueError(f"{base.version} は特徴量が異なるため継続学習できません")
+        depth = base_metrics.get("incremental_depth", 0) + 1
+        if depth > self.MAX_INCREMENTAL_DEPTH:
+            raise ValueError(f"{base.version} は継続学習を {depth - 1} 回重ねているため全データで学習し直してください")
+
+        new_rows = training_data[pd.to_datetime(training_data["as_of"]) > pd.Timestamp(since)]
+        if len(new_rows) < 10:
+            raise ValueError(f"{since} より新しい学習データが不足しています（{len(new_rows)}件）")
+
+        # 最新の基準時刻を検証に分ける（ランダムに分けると同じ時期の行が学習と検証の両方に入る）
+        as_of = pd.to_datetime(new_rows["as_of"])
+        is_val = (as_of == as_of.max()).to_numpy()
+        if is_val.all():
+            raise ValueError(f"{since} より新しい基準時刻が1つしかないため、検証データを分けられません")
+        X = new_rows[self.FEATURE_COLUMNS].fillna(0)
+        y = new_rows[target_column]
+        X_train, X_val, y_train, y_val = X[~is_val], X[is_val], y[~is_val], y[is_val]
+
+        train_data = lgb.Dataset(X_train, label=y_train)
+        val_data = lgb.Dataset(X_val, label=y_val, reference=train_data)
+        params = {**self.PARAMS, **(base.meta.get("params") or {})}
+
+        model = lgb.train(
+            params,
+            train_data,
+            num_boost_round=self.INCREMENTAL_ROUNDS,
+            init_model=base.model,
+            valid_sets=[val_data],
+            callbacks=[lgb.early_stopping(stopping_rounds=self.INCREMENTAL_EARLY_STOPPING_ROUNDS, verbose=False)],
+        )
+
+        # 保存されるのは best_iteration までの木（元のモデルの木を含む通し番号）
+        best_iteration = model.best_iteration or model.current_iteration()
+        y_pred = model.predict(X_val, num_iteration=best_iteration)
+        rmse = np.sqrt(mean_squared_error(y_val, y_pred))
+        r2 = r2_score(y_val, y_pred)
+
+        print(f"Validation RMSE: {rmse:.4f}")
+        print(f"Validation R2: {r2:.4f}")
+
+        champion_rmse = None
+        if role == "auto":
+            champion = self.registry.champion()
+            compared = self._validation_drift(X_val, y_val, rmse, champion)
+            champion_rmse = compared.get("baseline_rmse")
+            if not compared:
+                role = "challenger"
+            else:
+                role = "champion" if compared["rmse_drift"] <= 0 else "none"
+                print(f"チャンピオン {champion.version} の同じ検証データでのRMSE: {champion_rmse:.4f}")
+
+        metrics = {
+            "rmse": float(rmse),
+            "r2": float(r2),
+            "train_rows": len(X_train),
+            "val_rows": len(X_val),
+            "val_as_of": as_of.max().isoformat(),
+            "champion_rmse": champion_rmse,
+            "best_iteration": best_iteration,
+            "added_iterations": best_iteration - base.model.current_iteration(),
+            "data_as_of_max": self._data_as_of_max(training_data),
+            "base_version": base.version,
+            "incremental_depth": depth,
+            "horizon_days": self.horizon_days,
+            **self._validation_drift(X_val, y_val, rmse, base),
+        }
+        version = self.registry.register(
+            model,
+            metrics=metrics,
+            features=list(self.FEATURE_COLUMNS),
+            data_fingerprint=data_fingerprint(new_rows, self.FEATURE_COLUMNS + [target_column]),
+            params=params,
+            role=role,
+            # 元のモデルの学習データに新しい行を足した分布（同じビンの境界で数える）
+            feature_baseline=feature_baseline(new_rows, self.FEATURE_COLUMNS, base=base.meta.get("feature_baseline")),
+        )
+
+        return {**metrics, "version": version, "role": role}
+
+    @staticmethod
+    def _data_as_of_max(training_data: pd.DataFrame) -> Optional[str]:
+        """学習データの最新の基準時刻（継続学習で新しい行を選ぶのに使う）"""
+        if "as_of" not in training_data or training_data.empty:
+            return None
+        return pd.Timestamp(training_data["as_of"].max()).isoformat()
+
+    def _validation_drift(self, X_val: pd.DataFrame, y_val: pd.Series, rmse: float,
+                          baseline: Optional[ModelVersion]) -> Dict[str, Any]:
+        """
+        同じ検証データでの比較元モデルとの差
+
+        Returns:
+            baseline_version, baseline_rmse（比較元モデルの同じ検証データでのRMSE）,
+            baseline_recorded_rmse（比較元モデルの登録時のRMSE）, rmse_drift（今回 - 比較元）
+        """
+        if baseline is None or baseline.feature_names != list(self.FEATURE_COLUMNS):
+            return {}
+        baseline_pred = baseline.model.predict(X_val[baseline.feature_names])
+        baseline_rmse = float(np.sqrt(mean_squared_error(y_val, baseline_pred)))
+        return {
+            "baseline_version": baseline.version,
+            "baseline_rmse": baseline_rmse,
+            "baseline_recorded_rmse": (baseline.meta.get("metrics") or {}).get("rmse"),
+            "rmse_drift": float(rmse) - baseline_rmse,
+        }
+
+    def train_cv(self, training_data: pd.DataFrame, target_column: str = "actual_growth_rate",
+                 role: str = "challenger", n_folds: int = model_selection.N_FOLDS,
+                 gap_days: Optional[int] = None, n_jobs: Optional[int] = None,
+                 max_configs: Optional[int] = None):
+        """
+        時系列CVでパラメータを探索し、最良の設定で全データを学習して登録
+
+        training_data には基準時刻の as_of カラムが必要。
+        最終モデルのラウンド数は最良の設定の各フォールドの best_iteration の平均。
+
+        Args:
+            n_folds: フォールドの数
+            gap_days: 学習時点と検証時点の最小間隔（日、省略時は予測期間）
+            n_jobs: 並列に評価するプロセス数（省略時はCPUコア数）
+            max_configs: 評価するパラメータの組み合わせの上限（省略時は全組み合わせ）
+
+        Returns:
+            評価指標（rmse・r2 はCVの平均）、バージョン、役割、最良の設定のフォールドごとの結果、
+            上位の設定の一覧
+        """
+        X = training_data[self.FEATURE_COLUMNS].fillna(0)
+        y = training_data[target_column]
+        gap_days = self.horizon_days if gap_days is None else gap_days
+
+        report = model_selection.search(
+            X, y, training_data["as_of"], self.PARAMS,
+            n_folds=n_folds, gap_days=gap_days, n_jobs=n_jobs, max_configs=max_configs,
+        )
+        best = report["best"]
+
+        train_data, _ = cached_dataset(X, y, best["params"])
+        model = lgb.train(best["params"], train_data, num_boost_round=best["best_iteration"])
+
+        metrics = {
+            "rmse": best["rmse"],
+            "r2": best["r2"],
+            "train_rows": len(X),
+            "val_rows": sum(fold["val_rows"] for fold in best["folds"]),
+            "best_iteration": best["best_iteration"],
+            "cv_folds": best["folds"],
+            "cv_gap_days": gap_days,
+            "cv_configs": len(report["configs"]),
+            "data_as_of_max": self._data_as_of_max(training_data),
+            "incremental_depth": 0,
+            "horizon_days": self.horizon_days,
+        }
+        if self.registry.champion() is None:
+            role = "champion"
+        version = self.registry.register(
+            model,
+            metrics=metrics,
+            features=list(self.FEATURE_COLUMNS),
+            data_fingerprint=data_fingerprint(training_data, self.FEATURE_COLUMNS + [target_column]),
+            params=best["params"],
+            role=role,
+            feature_baseline=feature_baseline(training_data, self.FEATURE_COLUMNS),
+        )
 
-        return {"rmse": rmse, "r2": r2}
+        return {**metrics, "version": version, "role": role, "configs": report["configs"]}
 
-    def get_feature_importance(self) -> Dict[str, float]:
-        """特徴量の重要度を取得"""
-        if self.model is None:
+    def get_feature_importance(self, version: Optional[str] = None) -> Dict[str, float]:
+        """特徴量の重要度を取得（省略時はチャンピオン）"""
+        if version is None:
+            champion = self.registry.champion()
+        else:
+            champion = self.registry.load(version)
+        if champion is None:
             return {}
 
-        importance = self.model.feature_importance(importance_type="gain")
-        return dict(zip(self.FEATURE_COLUMNS, importance))
+        importance = champion.model.feature_importance(importance_type="gain")
+        return dict(zip(champion.feature_names, importance))
@@ -0,0 +1,351 @@
+"""
+チャンネル統計の日次グリッド（不規則な観測を1日間隔の配列にそろえる）
+
+channel_stats と集約テーブルの観測は収集の間隔が不規則で、集約済みの期間は週次・月次の点しかない。
+全チャンネルの観測を一度に読み込み、基準時刻 end から1日ずつさかのぼった時刻の値を
+numpy の searchsorted でまとめて求めて (チャンネル数, 日数) の配列にする。
+
+- ランレングス形式の行（recorded_at 〜 last_confirmed_at）は期間中ずっと同じ値として扱う
+- 観測と観測の間は線形補間、最後の観測より後は最後の値のまま、最初の観測より前は NaN
+- observed: その日（前日の同時刻より後〜その時刻）に観測があった
+- gap: 前後の観測の間隔（最後の観測より後はそこからの経過）が max_gap_days 日を超える、または値がない
+
+配列にしておけば、任意の期間の成長率・速度・加速度・欠損の割合は添字で引くだけで全チャンネル分求まる。
+基準時刻より後の観測は使わない（その時点までに観測されたデータだけで計算する）。
+
+予測モデルの成長率・投稿頻度（model_features）もこのグリッドから計算する。
+観測の間隔や集約の粒度によって「30日前の値」が何日も前の観測になることがなく、どの抽出経路でも同じ値になる。
+"""
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+from sqlalchemy import text, bindparam, DateTime
+from sqlalchemy.orm import Session
+
+COUNT_COLUMNS = ["subscriber_count", "view_count", "video_count"]
+ROLLUP_TABLES = ["channel_stats_daily", "channel_stats_weekly", "channel_stats_monthly"]
+# channel_ids を指定した読み込みで1回のクエリに含めるチャンネル数（SQLite のパラメータ数上限対策）
+BULK_CHUNK_SIZE = 500
+
+# これより長い間隔を補間した値・最後の観測からこれより後の値は gap とする（日）
+MAX_GAP_DAYS = 3
+# grid_features で計算する期間（日）
+FEATURE_WINDOWS = (7, 30, 90)
+# model_features のグリッドの列数（90日前の列まで）と、最初の列より前に読む観測の日数
+# （最初の列の値を前後の観測から補間するため。月次の集約の間隔より長くする）
+MODEL_GRID_DAYS = 91
+MODEL_LOOKBACK_DAYS = 35
+
+DAY = np.timedelta64(1, "D")
+
+
+def segments_sql(channel_filter: str = "", start: bool = False) -> str:
+    """
+    :end まで（start=True の場合は :start 以降に終わった）の観測を「同じ値だった期間」（begin_at 〜 end_at）として読むSQL
+
+    SQLite / DuckDB 共通。channel_filter は各テーブルの WHERE に足す条件（例: "AND channel_id IN :channel_ids"）。
+    """
+    raw_start = "AND COALESCE(last_confirmed_at, recorded_at) >= :start" if start else ""
+    rollup_start = "AND last_recorded_at >= :start" if start else ""
+    rollups = " UNION ALL ".join(
+        f"""SELECT channel_id, last_recorded_at AS begin_at, last_recorded_at AS end_at,
+                   subscriber_count, view_count, video_count
+            FROM {table} WHERE last_recorded_at <= :end {rollup_start} {channel_filter}"""
+        for table in ROLLUP_TABLES
+    )
+    return f"""
+        SELECT channel_id, recorded_at AS begin_at,
+               CASE WHEN COALESCE(last_confirmed_at, recorded_at) < :end
+                    THEN COALESCE(last_confirmed_at, recorded_at) ELSE :end END AS end_at,
+               subscriber_count, view_count, video_count
+        FROM channel_stats WHERE recorded_at <= :end {raw_start} {channel_filter}
+        UNION ALL {rollups}
+    """
+
+
+def segments_frame(frame: pd.DataFrame) -> pd.DataFrame:
+    """segments_sql の結果の時刻を datetime64 にする（時刻が NULL の行は除く）"""
+    for col in ["begin_at", "end_at"]:
+        frame[col] = pd.to_datetime(frame[col], format="ISO8601")
+    return frame.dropna(subset=["begin_at", "end_at"])
+
+
+def _read_segments(db: Session, end: datetime, channel_ids: Optional[List[int]],
+                   start: Optional[datetime] = None) -> pd.DataFrame:
+    """end まで（start を指定した場合は start 以降に終わった）の観測を segments_sql で読み込む"""
+    sql = segments_sql("AND channel_id IN :channel_ids" if channel_ids is not None else "", start is not None)
+    params = {"end": end}
+    stmt = text(sql).bindparams(bindparam("end", type_=DateTime()))
+    if start is not None:
+        params["start"] = start
+        stmt = stmt.bindparams(bindparam("start", type_=DateTime()))
+    if channel_ids is None:
+        statements = [(stmt, params)]
+    else:
+        stmt = stmt.bindparams(bindparam("channel_ids", expanding=True))
+        ids = [int(channel_id) for channel_id in dict.fromkeys(channel_ids)]
+        statements = [(stmt, {**params, "channel_ids": ids[i:i + BULK_CHUNK_SIZE]})
+                      for i in range(0, len(ids), BULK_CHUNK_SIZE)]
+
+    columns = ["channel_id", "begin_at", "end_at"] + COUNT_COLUMNS
+    frame = pd.DataFrame([row for stmt, params in statements for row in db.execute(stmt, params).fetchall()],
+                         columns=columns)
+    return segments_frame(frame)
+
+
+class DailyGrid:
+    """
+    全チャンネルの日次グリッド
+
+    values[列] は (チャンネル数, 日数) の float64 配列で、day 番目の列は end - (days - 1 - day) 日の時刻の値。
+    channel_ids は行の順（昇順）。
+    """
+
+    def __init__(self, channel_ids: np.ndarray, end: datetime, values: Dict[str, np.ndarray],
+                 observed: np.ndarray, gap: np.ndarray, max_gap_days: float = MAX_GAP_DAYS):
+        self.channel_ids = channel_ids
+        self.end = end
+        self.values = values
+        self.observed = observed
+        self.gap = gap
+        self.max_gap_days = max_gap_days
+        self.days = gap.shape[1]
+        # 欠損の割合を O(1) で求めるための累積数
+        self._gap_count = np.concatenate(
+            [np.zeros((len(channel_ids), 1), dtype=np.int32), np.cumsum(gap, axis=1, dtype=np.int32)], axis=1
+        )
+
+    @property
+    def dates(self) -> pd.DatetimeIndex:
+        """各列の時刻"""
+        end = pd.Timestamp(self.end)
+        return pd.DatetimeIndex([end - timedelta(days=self.days - 1 - day) for day in range(self.days)])
+
+    def day_index(self, at: Optional[datetime] = None) -> int:
+        """at 以前で最も近い列（省略時は最後の列）"""
+        if at is None:
+            return self.days - 1
+        offset = (self.end - at) / timedelta(days=1)
+        return self.days - 1 - int(np.ceil(offset - 1e-9))
+
+    def rows(self, channel_ids: Iterable[int]) -> np.ndarray:
+        """チャンネルのDB IDに対応する行（グリッドにないチャンネルは -1）"""
+        ids = np.asarray(list(channel_ids), dtype=np.int64)
+        if len(self.channel_ids) == 0:
+            return np.full(len(ids), -1)
+        pos = np.minimum(np.searchsorted(self.channel_ids, ids), len(self.channel_ids) - 1)
+        return np.where(self.channel_ids[pos] == ids, pos, -1)
+
+    def _at(self, column: str, day: int) -> np.ndarray:
+        if day < 0 or day >= self.days:
+            return np.full(len(self.channel_ids), np.nan)
+        return self.values[column][:, day]
+
+    def growth_rate(self, column: str, window: int, at: Optional[datetime] = None) -> np.ndarray:
+        """window 日前からの成長率（window 日前の値が0以下・ない場合は NaN）"""
+        day = self.day_index(at)
+        current, past = self._at(column, day), self._at(column, day - window)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return np.where(past > 0, (current - past) / past, np.nan)
+
+    def velocity(self, column: str, window: int, at: Optional[datetime] = None) -> np.ndarray:
+        """直近 window 日の1日あたりの増加数"""
+        day = self.day_index(at)
+        return (self._at(column, day) - self._at(column, day - window)) / window
+
+    def acceleration(self, column: str, window: int, at: Optional[datetime] = None) -> np.ndarray:
+        """直近 window 日の速度とその前の window 日の速度の差（1日あたり）"""
+        day = self.day_index(at)
+        current, middle, past = (self._at(column, day - k * window) for k in range(3))
+        return (current - 2 * middle + past) / (window * window)
+
+    def gap_ratio(self, window: int, at: Optional[datetime] = None) -> np.ndarray:
+        """直近 window 日のうち gap の日の割合（グリッドの範囲外の日は gap とみなす）"""
+        day = self.day_index(at)
+        if day < 0:
+            return np.ones(len(self.channel_ids))
+        start = max(day + 1 - window, 0)
+        outside = window - (day + 1 - start)
+        return (self._gap_count[:, day + 1] - self._gap_count[:, start] + outside) / window
+
+    def series(self, channel_id: int) -> pd.DataFrame:
+        """1チャンネル分のグリッド（時刻インデックスで values の列と observed / gap）"""
+        row = self.rows([channel_id])[0]
+        if row < 0:
+            raise KeyError(channel_id)
+        frame = pd.DataFrame({column: values[row] for column, values in self.values.items()}, index=self.dates)
+        frame["observed"] = self.observed[row]
+        frame["gap"] = self.gap[row]
+        return frame
+
+
+def resample_daily(
+    segments: pd.DataFrame,
+    end: datetime,
+    days: Optional[int] = None,
+    channel_ids: Optional[Iterable[int]] = None,
+    max_gap_days: float = MAX_GAP_DAYS,
+) -> DailyGrid:
+    """
+    観測の期間を日次グリッドにする
+
+    Args:
+        segments: channel_id, begin_at, end_at と COUNT_COLUMNS の列。
+                  同じチャンネルの期間は重ならないこと（観測が1回なら begin_at = end_at）
+        end: 最後の列の時刻（これより後の観測は使わない）
+        days: 列数（省略時は最も古い観測まで）
+        channel_ids: 行にするチャンネル（省略時は segments にあるチャンネル。観測がないチャンネルは全て NaN）
+        max_gap_days: これより長い間隔の補間・最後の観測からの経過を gap とする（日）
+    """
+    end_ts = np.datetime64(pd.Timestamp(end).to_datetime64(), "ns")
+    segments = segments[segments["begin_at"] <= pd.Timestamp(end)]
+    ids = np.unique(segments["channel_id"].to_numpy(dtype=np.int64)) if channel_ids is None \
+        else np.unique(np.asarray(list(channel_ids), dtype=np.int64))
+    segments = segments[segments["channel_id"].isin(ids)]
+
+    # 時刻は end からの日数（負の値）で扱う
+    begin = (segments["begin_at"].to_numpy(dtype="datetime64[ns]") - end_ts) / DAY
+    finish = np.minimum((segments["end_at"].to_numpy(dtype="datetime64[ns]") - end_ts) / DAY, 0.0)
+    if days is None:
+        days = int(np.floor(-begin.min())) + 1 if len(begin) else 1
+    rows = np.searchsorted(ids, segments["channel_id"].to_numpy(dtype=np.int64))
+
+    # (チャンネル, 開始時刻) 順に並べ、チャンネルごとに重ならないキーにして1本の配列で検索する
+    order = np.lexsort((begin, rows))
+    rows, begin, finish = rows[order], begin[order], finish[order]
+    counts = segments[COUNT_COLUMNS].to_numpy(dtype=np.float64)[order]
+    span = float(np.ceil(max(-begin.min() if len(begin) else 0, days))) + 2
+    begin_key = rows * span + begin
+
+    grid_times = np.arange(days, dtype=np.float64) - (days - 1)
+    query_rows = np.repeat(np.arange(len(ids)), days)
+    query_times = np.tile(grid_times, len(ids))
+    query_key = query_rows * span + query_times
+
+    prev = np.searchsorted(begin_key, query_key, side="right") - 1
+    has_prev = prev >= 0
+    has_prev[has_prev] = rows[prev[has_prev]] == query_rows[has_prev]
+    nxt = prev + 1
+    has_next = has_prev & (nxt < len(rows))
+    has_next[has_next] = rows[nxt[has_next]] == query_rows[has_next]
+
+    p = np.where(has_prev, prev, 0)
+    n = np.where(has_next, nxt, 0)
+    prev_end = np.where(has_prev, finish[p] if len(finish) else 0.0, np.nan)
+    inside = has_prev & (query_times <= prev_end)
+    interpolate = has_next & ~inside
+    next_begin = np.where(has_next, begin[n] if len(begin) else 0.0, np.nan)
+
+    # 前後の観測の間隔（期間内なら0、最後の観測より後はそこからの経過日数）
+    with np.errstate(invalid="ignore"):
+        interval = np.where(inside, 0.0, np.where(interpolate, next_begin - prev_end, query_times - prev_end))
+        weight = np.where(interpolate, (query_times - prev_end) / np.where(interpolate, next_begin - prev_end, 1.0), 0.0)
+
+    values = {}
+    for i, column in enumerate(COUNT_COLUMNS):
+        before = counts[p, i] if len(counts) else np.zeros(len(p))
+        after = counts[n, i] if len(counts) else np.zeros(len(n))
+        value = np.where(interpolate, before + (after - before) * weight, before)
+        values[column] = np.where(has_prev, value, np.nan).reshape(len(ids), days)
+
+    observed = has_prev & (prev_end > query_times - 1)
+    gap = ~has_prev | (interval > max_gap_days)
+    return DailyGrid(ids, end, values, observed.reshape(len(ids), days), gap.reshape(len(ids), days), max_gap_days)
+
+
+def load_daily_grid(
+    db: Session,
+    end: Optional[datetime] = None,
+    days: Optional[int] = None,
+    channel_ids: Optional[List[int]] = None,
+    max_gap_days: float = MAX_GAP_DAYS,
+    start: Optional[datetime] = None,
+) -> DailyGrid:
+    """
+    channel_stats と集約テーブルから全チャンネル（channel_ids 指定時はそのチャンネル）の日次グリッドを作る
+
+    Args:
+        end: 最後の列の時刻（省略時は現在時刻）。これより後の観測は使わない
+        days: 列数（省略時は最も古い観測まで）
+        start: これより前に終わった観測は読まない（最初の列の補間に前の観測が要るので、最初の列より十分前を渡す）
+    """
+    end = end or datetime.utcnow()
+    segments = _read_segments(db, end, channel_ids, start)
+    if channel_ids is None:
+        ids = [row[0] for row in db.execute(text("SELECT id FROM channels")).fetchall()]
+    else:
+        ids = channel_ids
+    return resample_daily(segments, end, days, ids, max_gap_days)
+
+
+def grid_features(grid: DailyGrid, windows: Iterable[int] = FEATURE_WINDOWS,
+                  at: Optional[datetime] = None) -> pd.DataFrame:
+    """
+    期間ごとの登録者・再生回数の成長率・速度・加速度と欠損の割合
+
+    Returns:
+        channel_id インデックスで {subscriber,view}_{growth_rate,velocity,acceleration}_{期間}d と
+        gap_ratio_{期間}d の列を持つ DataFrame
+    """
+    out = pd.DataFrame(index=pd.Index(grid.channel_ids, name="channel_id"))
+    for window in windows:
+        for prefix, column in [("subscriber", "subscriber_count"), ("view", "view_count")]:
+            out[f"{prefix}_growth_rate_{window}d"] = grid.growth_rate(column, window, at)
+            out[f"{prefix}_velocity_{window}d"] = grid.velocity(column, window, at)
+            out[f"{prefix}_acceleration_{window}d"] = grid.acceleration(column, window, at)
+        out[f"gap_ratio_{window}d"] = grid.gap_ratio(window, at)
+    return out
+
+
+def model_grid_start(as_of: datetime) -> datetime:
+    """model_features のグリッドに読む観測の開始時刻（これより前に終わった観測は使わない）"""
+    return as_of - timedelta(days=MODEL_GRID_DAYS - 1 + MODEL_LOOKBACK_DAYS)
+
+
+def model_grid(segments: pd.DataFrame, as_of: datetime,
+               channel_ids: Optional[Iterable[int]] = None) -> DailyGrid:
+    """
+    観測の期間から model_features のグリッドを作る（load_model_grid と同じ範囲の観測だけを使う）
+
+    DuckDB（segments_sql の結果）やバックテスト（読み込み済みの全期間の観測）から呼ぶ。
+    """
+    segments = segments[segments["end_at"] >= pd.Timestamp(model_grid_start(as_of))]
+    return resample_daily(segments, as_of, MODEL_GRID_DAYS, channel_ids)
+
+
+def load_model_grid(db: Session, as_of: datetime, channel_ids: Optional[List[int]] = None) -> DailyGrid:
+    """基準時刻 as_of の model_features のグリッド"""
+    return load_daily_grid(db, end=as_of, days=MODEL_GRID_DAYS, channel_ids=channel_ids,
+                           start=model_grid_start(as_of))
+
+
+def model_features(grid: DailyGrid, at: Optional[datetime] = None) -> pd.DataFrame:
+    """
+    予測モデルの成長率と投稿頻度（GrowthPredictor.FEATURE_COLUMNS の列名のまま）
+
+    - subscriber_growth_rate_30d / 90d, view_growth_rate_30d: 30日前・90日前の時刻の値（前後の観測から補間）からの成長率
+    - upload_frequency: 直近30日の動画数の増加（動画/週）。30日前より後に最初の観測があるチャンネルは
+      最初の値がある日からの増加で計算する。直近30日に観測がない・値が1日分しかない場合は NaN
+
+    Returns:
+        channel_id インデックスの DataFrame
+    """
+    day = grid.day_index(at)
+    out = pd.DataFrame(index=pd.Index(grid.channel_ids, name="channel_id"))
+    out["subscriber_growth_rate_30d"] = grid.growth_rate("subscriber_count", 30, at)
+    out["subscriber_growth_rate_90d"] = grid.growth_rate("subscriber_count", 90, at)
+    out["view_growth_rate_30d"] = grid.growth_rate("view_count", 30, at)
+
+    start = max(day - 30, 0)
+    videos = grid.values["video_count"][:, start:day + 1]
+    has_value = ~np.isnan(videos)
+    first = np.argmax(has_value, axis=1)
+    span = (videos.shape[1] - 1 - first).astype(np.float64)
+    first_value = videos[np.arange(len(videos)), first] if videos.size else np.full(len(videos), np.nan)
+    recent = grid.observed[:, max(day - 29, 0):day + 1].any(axis=1) if day >= 0 else np.zeros(len(videos), bool)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        frequency = (videos[:, -1] - first_value) / span * 7 if videos.size else np.full(len(videos), np.nan)
+    out["upload_frequency"] = np.where(recent & has_value.any(axis=1) & (span > 0), frequency, np.nan)
+    return out
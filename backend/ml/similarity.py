@@ -0,0 +1,163 @@
+"""
+登録者数の推移が似ているチャンネルの近傍検索
+
+日次グリッド（ml/resampling.py）の直近 TRAJECTORY_DAYS 日の登録者数を TRAJECTORY_POINTS 区間の平均にまとめ、
+期間の最初の値との比の対数（ln(x / x_0)）を固定長のベクトルにする。
+規模の違うチャンネルでも、伸び方（どれだけ・いつ伸びたか）が近ければベクトルの距離が近くなる。
+
+索引は全チャンネルのベクトルを (チャンネル数, TRAJECTORY_POINTS) の float32 行列としてメモリに持ち、
+検索は SEARCH_BLOCK_ROWS 行ずつ ||a||² - 2a·b + ||b||² でユークリッド距離を計算して、
+ブロックごとに argpartition で上位 k 件を残してから最後に並べる（一度に作る距離の配列はブロックの大きさまで）。
+5万チャンネルでも1回の検索は1ミリ秒程度。
+
+索引は index.npz（ベクトル・チャンネルID・メタデータ）の1ファイルに書き、一時ファイルから os.replace で置き換える。
+"""
+import json
+import os
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from ml.resampling import DailyGrid
+
+# ベクトルにする期間（日）と区間の数
+TRAJECTORY_DAYS = 90
+TRAJECTORY_POINTS = 30
+# 期間のうち gap（観測の間隔が空いている・値がない）の日がこの割合を超えるチャンネルは索引に入れない
+MAX_GAP_RATIO = 0.5
+# 検索で一度に距離を計算する行数
+SEARCH_BLOCK_ROWS = 8192
+
+
+def trajectory_vectors(grid: DailyGrid, days: int = TRAJECTORY_DAYS,
+                       points: int = TRAJECTORY_POINTS) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    グリッドの直近 days 日の登録者数の推移のベクトル
+
+    期間の最初の日の値がない・0以下のチャンネル、gap の日が MAX_GAP_RATIO を超えるチャンネルは除く。
+
+    Returns:
+        (チャンネルのDB ID, (チャンネル数, points) の float32 行列)
+    """
+    days = min(days, grid.days)
+    subscribers = grid.values["subscriber_count"][:, grid.days - days:]
+    start = subscribers[:, 0]
+    with np.errstate(invalid="ignore"):
+        valid = (start > 0) & ~np.isnan(subscribers).any(axis=1) & (grid.gap_ratio(days) <= MAX_GAP_RATIO)
+
+    # 区間ごとの平均（日数が区間の数で割り切れなくても区間の境界は均等に近くなる）
+    bounds = np.linspace(0, days, min(points, days) + 1).round().astype(int)[:-1]
+    selected = subscribers[valid]
+    pooled = np.add.reduceat(selected, bounds, axis=1) / np.diff(np.append(bounds, days))
+    with np.errstate(divide="ignore", invalid="ignore"):
+        vectors = np.log(np.maximum(pooled, 1.0) / start[valid][:, None])
+    return grid.channel_ids[valid], np.ascontiguousarray(vectors, dtype=np.float32)
+
+
+class SimilarityIndex:
+    """推移のベクトルのメモリ上の索引"""
+
+    def __init__(self, channel_ids: np.ndarray, vectors: np.ndarray, meta: Dict[str, Any]):
+        order = np.argsort(channel_ids, kind="stable")
+        self.channel_ids = np.asarray(channel_ids, dtype=np.int64)[order]
+        self.vectors = np.ascontiguousarray(np.asarray(vectors, dtype=np.float32)[order])
+        self.meta = meta
+        self.as_of = datetime.fromisoformat(meta["as_of"])
+        # 距離の計算で使い回す各行のノルムの2乗
+        self._sq_norms = np.einsum("ij,ij->i", self.vectors, self.vectors)
+
+    def __len__(self) -> int:
+        return len(self.channel_ids)
+
+    def row(self, channel_id: int) -> int:
+        """チャンネルのDB IDに対応する行（索引にないチャンネルは -1）"""
+        pos = int(np.searchsorted(self.channel_ids, channel_id))
+        if pos < len(self.channel_ids) and self.channel_ids[pos] == channel_id:
+            return pos
+        return -1
+
+    def search(self, vector: np.ndarray, k: int, exclude: Optional[int] = None,
+               block_rows: int = SEARCH_BLOCK_ROWS) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        ベクトルに近い k 行
+
+        Args:
+            exclude: 結果から除く行（検索したチャンネル自身）
+
+        Returns:
+            (行, ユークリッド距離)。距離の近い順
+        """
+        query = np.asarray(vector, dtype=np.float32)
+        query_sq = float(query @ query)
+        candidates, distances = [], []
+        for start in range(0, len(self), block_rows):
+            block = slice(start, start + block_rows)
+            dist = self._sq_norms[block] - 2.0 * (self.vectors[block] @ query) + query_sq
+            if exclude is not None and start <= exclude < start + block_rows:
+                dist[exclude - start] = np.inf
+            if len(dist) > k:
+                top = np.argpartition(dist, k)[:k]
+            else:
+                top = np.arange(len(dist))
+            candidates.append(top + start)
+            distances.append(dist[top])
+        if not candidates:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        rows, dist = np.concatenate(candidates), np.concatenate(distances)
+        order = np.argsort(dist, kind="stable")[:k]
+        rows, dist = rows[order], dist[order]
+        finite = np.isfinite(dist)
+        return rows[finite], np.sqrt(np.maximum(dist[finite], 0.0))
+
+    def similar(self, channel_id: int, k: int = 10) -> List[Tuple[int, float]]:
+        """
+        チャンネルと推移が似ているチャンネル
+
+        Returns:
+            [(チャンネルのDB ID, 距離)]（距離の近い順。索引にないチャンネルは空）
+        """
+        row = self.row(channel_id)
+        if row < 0:
+            return []
+        rows, dist = self.search(self.vectors[row], k, exclude=row)
+        return [(int(self.channel_ids[r]), float(d)) for r, d in zip(rows, dist)]
+
+    def growth_rate(self, channel_id: int) -> Optional[float]:
+        """期間の最初の値から最後の区間の平均までの成長率（索引にないチャンネルは None）"""
+        row = self.row(channel_id)
+        return float(np.expm1(self.vectors[row, -1])) if row >= 0 else None
+
+
+def build_index(parts: Iterable[Tuple[np.ndarray, np.ndarray]], as_of: datetime,
+                days: int = TRAJECTORY_DAYS, points: int = TRAJECTORY_POINTS) -> SimilarityIndex:
+    """trajectory_vectors の結果（チャンネルをいくつかに分けて作ったもの）から索引を作る"""
+    parts = list(parts)
+    channel_ids = np.concatenate([ids for ids, _ in parts]) if parts else np.empty(0, dtype=np.int64)
+    vectors = np.concatenate([vectors for _, vectors in parts]) if parts else np.empty((0, points), np.float32)
+    meta = {
+        "as_of": as_of.isoformat(),
+        "created_at": datetime.utcnow().isoformat(),
+        "days": days,
+        "points": points,
+        "rows": int(len(channel_ids)),
+    }
+    return SimilarityIndex(channel_ids, vectors, meta)
+
+
+def save_index(index: SimilarityIndex, path: str):
+    """索引を1ファイルに保存（一時ファイルから置き換えるため、読み込み側が書きかけを見ることはない）"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp.npz"
+    np.savez(tmp_path, channel_ids=index.channel_ids, vectors=index.vectors,
+             meta=np.array(json.dumps(index.meta, ensure_ascii=False)))
+    os.replace(tmp_path, path)
+
+
+def load_index(path: str) -> Optional[SimilarityIndex]:
+    """保存した索引を読み込む（なければ None）"""
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as data:
+        return SimilarityIndex(data["channel_ids"], data["vectors"], json.loads(str(data["meta"])))
@@ -0,0 +1,161 @@
+"""
+学習データ（複数時点のスナップショット）の作成
+
+基準時刻 as_of ごとに「as_of 時点までのデータだけで計算した特徴量」と
+「as_of から horizon_days 日後までの実際の登録者成長率（%）」を1行にする。
+基準時刻は horizon_days 日前から step_days 日ずつ過去にさかのぼって複数取るため、
+同じチャンネルが時点を変えて何度も学習データに現れる。
+
+複数の予測期間（30日・90日・180日など）のモデルは同じ特徴量の行列から学習する
+（build_multi_horizon_dataset。期間ごとの正解ラベルを別の列にする）。
+
+特徴量・統計の取得元（FeatureExtractor / AnalyticsEngine）は引数で渡す。
+"""
+import hashlib
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+
+import pandas as pd
+
+# 予測対象の期間（日）
+HORIZON_DAYS = 180
+# スナップショットの間隔（日）と最大数
+SNAPSHOT_STEP_DAYS = 30
+MAX_SNAPSHOTS = 12
+# 継続学習の基準時刻の間隔（日）。元のモデルより新しい時点が2つ以上ないと最新の時点を検証に分けられないため短くする
+INCREMENTAL_STEP_DAYS = 7
+# 特徴量の計算方法のバージョン（計算方法を変えたら上げる）。モデルの meta.json・channel_features の行・
+# 特徴量スナップショットに記録し、今のバージョンと違うものは予測・学習に使わない
+# 1: 成長率・投稿頻度を観測値から直接計算 / 2: 日次グリッド（ml/resampling.py）から計算
+FEATURE_SCHEMA_VERSION = 2
+# バージョンを記録していない（導入前の）モデル・行のバージョン
+LEGACY_FEATURE_SCHEMA_VERSION = 1
+
+
+def snapshot_anchors(
+    now: Optional[datetime] = None,
+    horizon_days: int = HORIZON_DAYS,
+    step_days: int = SNAPSHOT_STEP_DAYS,
+    max_snapshots: int = MAX_SNAPSHOTS,
+) -> List[datetime]:
+    """
+    正解ラベルが確定している基準時刻（古い順）
+
+    最新の基準時刻は now の horizon_days 日前。
+    """
+    latest = (now or datetime.utcnow()) - timedelta(days=horizon_days)
+    return [latest - timedelta(days=step_days * i) for i in reversed(range(max_snapshots))]
+
+
+def build_snapshot_dataset(
+    features_at: Callable[[List[datetime]], pd.DataFrame],
+    stats_at: Callable[[datetime], pd.DataFrame],
+    anchors: List[datetime],
+    horizon_days: int = HORIZON_DAYS,
+) -> pd.DataFrame:
+    """
+    スナップショット学習データを作成
+
+    Args:
+        features_at: 基準時刻のリストから (as_of, channel_id) インデックスの特徴量を返す関数
+                     （FeatureExtractor.extract_features_snapshots など）
+        stats_at: 時刻から channel_id インデックスの統計を返す関数（FeatureExtractor.stats_at_frame など）
+        anchors: 基準時刻
+        horizon_days: 成長率を測る期間（日）
+
+    Returns:
+        as_of, channel_id, 特徴量, actual_growth_rate の列を持つ DataFrame（as_of・channel_id 順）
+    """
+    features = features_at(anchors)
+    if features.empty:
+        return features.reset_index().assign(actual_growth_rate=pd.Series(dtype=float))
+
+    labels = growth_labels(features, stats_at, horizon_days).rename("actual_growth_rate")
+    df = features.join(labels, how="inner")
+    return df.sort_index().reset_index()
+
+
+def growth_labels(
+    features: pd.DataFrame,
+    stats_at: Callable[[datetime], pd.DataFrame],
+    horizon_days: int,
+    now: Optional[datetime] = None,
+) -> pd.Series:
+    """
+    (as_of, channel_id) インデックスの特徴量に対する horizon_days 日後までの登録者成長率（%）
+
+    now を指定すると、as_of + horizon_days が now より後の時点（まだ確定していない）は含めない。
+    """
+    labels = []
+    for anchor, snapshot in features.groupby(level="as_of"):
+        if now is not None and anchor + timedelta(days=horizon_days) > now:
+            continue
+        base = snapshot.droplevel("as_of")["subscriber_count"]
+        future = stats_at(anchor + timedelta(days=horizon_days))["subscriber_count"]
+        base = base[base > 0]
+        growth = ((future.reindex(base.index) - base) / base * 100).dropna()
+        labels.append(pd.DataFrame({
+            "as_of": anchor,
+            "channel_id": growth.index.astype(int),
+            "growth": growth.to_numpy(),
+        }))
+
+    if not labels:
+        index = pd.MultiIndex.from_arrays([[], []], names=["as_of", "channel_id"])
+        return pd.Series(index=index, dtype=float)
+    return pd.concat(labels, ignore_index=True).set_index(["as_of", "channel_id"])["growth"]
+
+
+def label_column(horizon_days: int) -> str:
+    """build_multi_horizon_dataset の正解ラベルの列名"""
+    return f"actual_growth_rate_{horizon_days}d"
+
+
+def multi_horizon_anchors(
+    now: Optional[datetime] = None,
+    horizons: Optional[List[int]] = None,
+    step_days: int = SNAPSHOT_STEP_DAYS,
+    max_snapshots: int = MAX_SNAPSHOTS,
+) -> List[datetime]:
+    """
+    全予測期間で共有する基準時刻（古い順）
+
+    最新は最も短い期間の正解が確定する時点。最も長い期間でも max_snapshots 個の時点が使えるだけさかのぼる。
+    """
+    horizons = sorted(horizons or [HORIZON_DAYS])
+    extra = -(-(horizons[-1] - horizons[0]) // step_days)
+    return snapshot_anchors(now, horizons[0], step_days, max_snapshots + extra)
+
+
+def build_multi_horizon_dataset(
+    features_at: Callable[[List[datetime]], pd.DataFrame],
+    stats_at: Callable[[datetime], pd.DataFrame],
+    anchors: List[datetime],
+    horizons: List[int],
+    now: Optional[datetime] = None,
+) -> pd.DataFrame:
+    """
+    複数の予測期間の学習データを1つの特徴量の行列から作成
+
+    Returns:
+        as_of, channel_id, 特徴量, 期間ごとの label_column(期間) の列を持つ DataFrame。
+        その期間の正解がまだ確定していない行は NaN（学習時に期間ごとに除く）
+    """
+    now = now or datetime.utcnow()
+    features = features_at(anchors)
+    labels: Dict[str, pd.Series] = {
+        label_column(h): growth_labels(features, stats_at, h, now) for h in horizons
+    }
+    if features.empty:
+        return features.reset_index().assign(**{col: pd.Series(dtype=float) for col in labels})
+
+    df = features.join(pd.DataFrame(labels), how="left")
+    df = df[df[list(labels)].notna().any(axis=1)]
+    return df.sort_index().reset_index()
+
+
+def data_fingerprint(df: pd.DataFrame, columns: List[str]) -> str:
+    """学習データの内容（列名・行の順序を含む）のハッシュ"""
+    digest = hashlib.sha256("\x1f".join(columns).encode("utf-8"))
+    digest.update(pd.util.hash_pandas_object(df[columns], index=False).to_numpy().tobytes())
+    return digest.hexdigest()
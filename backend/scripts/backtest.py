@@ -0,0 +1,146 @@
+"""
+バックテストスクリプト（過去の基準時刻で予測を再現して実際の成長率と比べる）
+
+使い方:
+    cd backend
+    python scripts/backtest.py                               # 直近1年分の基準時刻（毎日）、180日予測
+    python scripts/backtest.py --horizon 30 --days 90        # 30日予測を90日分
+    python scripts/backtest.py --models champion,rule,VERSION --step-days 7
+    python scripts/backtest.py --output backtest.csv         # 基準時刻ごとの指標をCSVに保存
+
+--models には champion（チャンピオン）、challengers（全チャレンジャー）、rule（ルールベース）、
+登録済みのバージョンをカンマ区切りで指定します。
+
+※ 特徴量は基準時刻までに観測されたデータだけで計算します。
+   基準時刻は正解（予測期間後の登録者数）が確定しているものだけを使います。
+"""
+import sys
+import time
+from pathlib import Path
+
+# パスを追加
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from datetime import datetime
+from app.database import SessionLocal, init_db
+from ml.backtest import PointInTimeSource, backtest_anchors, backtest_metrics, replay, summarize
+from ml.predictor import GrowthPredictor
+from ml.training_data import HORIZON_DAYS
+
+# 画面に表示する基準時刻ごとの行数の上限（全行は --output に保存）
+MAX_PRINT_DATES = 30
+
+
+def resolve_models(predictor: GrowthPredictor, names: list) -> dict:
+    """--models の指定を {表示名: モデルのバージョン（ルールベースは None）} にする"""
+    state = predictor.registry.state()
+    models = {}
+    for name in names:
+        if name == "rule":
+            models["rule"] = None
+        elif name == "champion":
+            if state.champion is None:
+                print("チャンピオンが登録されていないため、champion はスキップします")
+                continue
+            models[f"champion:{state.champion.version}"] = state.champion
+        elif name == "challengers":
+            for challenger in state.challengers:
+                models[f"challenger:{challenger.version}"] = challenger
+        else:
+            models[name] = predictor.registry.load(name)
+    return models
+
+
+def print_metrics(metrics, summary):
+    """基準時刻ごとの指標（間引いて表示）とモデルごとの平均を表示"""
+    header = f"  {'基準時刻':<17} {'件数':>6} {'MAE':>9} {'RMSE':>9} {'バイアス':>9} {'順位相関':>8} {'上位一致':>8}"
+    for model, rows in metrics.groupby("model", sort=False):
+        step = max(1, -(-len(rows) // MAX_PRINT_DATES))
+        print(f"\n{model}（{len(rows)}時点" + (f"、{step}時点ごとに表示" if step > 1 else "") + "）")
+        print(header)
+        for row in rows.iloc[::step].itertuples(index=False):
+            corr = f"{row.rank_corr:.3f}" if row.rank_corr == row.rank_corr else "-"
+            top = f"{row.top_precision:.3f}" if row.top_precision == row.top_precision else "-"
+            print(f"  {row.as_of.strftime('%Y-%m-%d %H:%M'):<17} {row.channels:>6} {row.mae:>9.2f} "
+                  f"{row.rmse:>9.2f} {row.bias:>+9.2f} {corr:>8} {top:>8}")
+
+    print(f"\n{'='*50}")
+    print("モデルごとの平均（基準時刻ごとの指標の平均）")
+    print(f"{'='*50}")
+    for row in summary.itertuples(index=False):
+        print(f"{row.model}")
+        print(f"  時点: {row.dates}  平均件数: {row.channels:.0f}")
+        print(f"  MAE: {row.mae:.2f}  RMSE: {row.rmse:.2f}  バイアス: {row.bias:+.2f}")
+        print(f"  順位相関: {row.rank_corr:.3f}  上位一致率: {row.top_precision:.3f}")
+
+
+def run_backtest(horizon_days: int = HORIZON_DAYS, days: int = 365, step_days: int = 1,
+                 model_names: list = None, output: str = None):
+    """
+    バックテストを実行
+
+    Args:
+        horizon_days: 予測期間（日）。その期間のモデルで予測する
+        days: 基準時刻をさかのぼる日数（正解が確定している最新の基準時刻から）
+        step_days: 基準時刻の間隔（日）
+        model_names: 比較するモデル（champion / challengers / rule / バージョン）
+        output: 基準時刻ごとの指標を保存するCSVのパス
+    """
+    print(f"\n{'='*50}")
+    print(f"バックテスト開始: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print(f"{'='*50}\n")
+
+    predictor = GrowthPredictor(horizon_days=horizon_days)
+    models = resolve_models(predictor, model_names or ["champion", "rule"])
+    if not models:
+        print("比較するモデルがありません")
+        return
+
+    anchors = backtest_anchors(horizon_days=horizon_days, days=days, step_days=step_days)
+    print(f"予測期間: {horizon_days}日")
+    print(f"基準時刻: {anchors[0].strftime('%Y-%m-%d')} 〜 {anchors[-1].strftime('%Y-%m-%d')} "
+          f"({len(anchors)}時点, {step_days}日ごと)")
+    print(f"モデル: {', '.join(models)}")
+
+    init_db()
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        source = PointInTimeSource(db)
+        print(f"\nデータ読み込み時間: {time.perf_counter() - started:.2f}秒 "
+              f"({len(source.channels)}チャンネル, 統計 {len(source.raw)}行)")
+    finally:
+        db.close()
+
+    started = time.perf_counter()
+    replayed = replay(source, predictor, models, anchors)
+    print(f"特徴量計算・予測時間: {time.perf_counter() - started:.2f}秒 ({len(replayed)}件)")
+
+    if replayed.empty:
+        print("\n正解が確定している基準時刻のデータがありません")
+        return
+
+    metrics = backtest_metrics(replayed)
+    summary = summarize(metrics)
+    print_metrics(metrics, summary)
+
+    if output:
+        metrics.to_csv(output, index=False)
+        print(f"\n基準時刻ごとの指標を保存しました: {output}")
+
+    print(f"\nバックテスト完了: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--horizon", type=int, default=HORIZON_DAYS, help="予測期間（日）")
+    parser.add_argument("--days", type=int, default=365, help="基準時刻をさかのぼる日数")
+    parser.add_argument("--step-days", type=int, default=1, help="基準時刻の間隔（日）")
+    parser.add_argument("--models", type=lambda v: v.split(","), default=None,
+                        help="比較するモデル（champion, challengers, rule, バージョンをカンマ区切り。既定は champion,rule）")
+    parser.add_argument("--output", default=None, help="基準時刻ごとの指標を保存するCSVのパス")
+    args = parser.parse_args()
+
+    run_backtest(args.horizon, args.days, args.step_days, args.models, args.output)
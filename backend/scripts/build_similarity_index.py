@@ -0,0 +1,79 @@
+"""
+登録者数の推移が似ているチャンネルの索引を作るスクリプト
+
+使い方:
+    cd backend
+    python scripts/build_similarity_index.py                      # 索引を作り直す（データ収集の後にも自動で作られます）
+    python scripts/build_similarity_index.py --channel UCxxxx     # 保存済みの索引でチャンネルの似ているチャンネルを表示
+
+索引は SIMILARITY_INDEX_PATH に保存され、API（GET /api/channels/{id}/similar）は更新を検知して読み込み直します。
+"""
+import sys
+import time
+from pathlib import Path
+
+# パスを追加
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.database import SessionLocal, init_db
+from app.models import Channel
+from app.services.similarity_service import current_index, publish_similarity_index
+
+
+def build():
+    """索引を作り直して保存"""
+    init_db()
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        index = publish_similarity_index(db)
+        total = db.query(Channel).count()
+        print(f"索引を作りました: {len(index)}/{total} チャンネル（{index.meta['days']}日, "
+              f"{index.meta['points']}次元, {time.perf_counter() - started:.2f}秒）")
+    finally:
+        db.close()
+
+
+def show(channel_id: str, limit: int):
+    """チャンネルと推移が似ているチャンネルを表示"""
+    index = current_index()
+    if index is None:
+        print("索引がありません（データ収集または引数なしで実行して作成）")
+        return
+
+    db = SessionLocal()
+    try:
+        channel = db.query(Channel).filter(Channel.channel_id == channel_id).first()
+        if channel is None:
+            print(f"チャンネルが見つかりません: {channel_id}")
+            return
+        if index.row(channel.id) < 0:
+            print(f"{channel.name} は履歴が足りないため索引にありません")
+            return
+
+        started = time.perf_counter()
+        neighbours = index.similar(channel.id, limit)
+        elapsed = time.perf_counter() - started
+        names = {c.id: c.name for c in db.query(Channel).filter(Channel.id.in_([i for i, _ in neighbours])).all()}
+
+        print(f"{channel.name}（直近{index.meta['days']}日の成長率 {index.growth_rate(channel.id):+.1%}）"
+              f"  索引: {index.as_of:%Y-%m-%d %H:%M}, {len(index)}チャンネル\n")
+        for i, distance in neighbours:
+            print(f"  {names.get(i, i)!s:<40} 距離 {distance:.4f}  成長率 {index.growth_rate(i):+.1%}")
+        print(f"\n検索時間: {elapsed * 1000:.2f}ms")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--channel", default=None, help="似ているチャンネルを表示するチャンネル（YouTubeのチャンネルID）")
+    parser.add_argument("--limit", type=int, default=10, help="表示する件数")
+    args = parser.parse_args()
+
+    if args.channel:
+        show(args.channel, args.limit)
+    else:
+        build()
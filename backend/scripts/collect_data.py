@@ -13,10 +13,13 @@ from datetime import datetime
 
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from app.database import SessionLocal
-from app.models import Channel, ChannelStats, News
+from app.database import SessionLocal, init_db
+from app.models import Channel, News
 from app.services.youtube_service import YouTubeService
 from app.services.news_service import NewsService
+from app.services.stats_service import record_stats
+from app.services.feature_store import mark_features_changed, publish_features, refresh_stale_features
+from app.services.similarity_service import publish_similarity_index
 
 
 async def collect_youtube_stats(db, youtube: YouTubeService, channel) -> bool:
@@ -29,13 +32,13 @@ async def collect_youtube_stats(db, youtube: YouTubeService, channel) -> bool:
             channel.thumbnail_url = info.get("thumbnail_url")
             channel.updated_at = datetime.utcnow()
 
-            stats = ChannelStats(
-                channel_id=channel.id,
+            record_stats(
+                db,
+                channel.id,
                 subscriber_count=info["subscriber_count"],
                 view_count=info.get("view_count", 0),
                 video_count=info.get("video_count", 0),
             )
-            db.add(stats)
             return True
     except Exception as e:
         print(f"  YouTube error: {e}")
@@ -64,6 +67,8 @@ async def collect_news(db, news_service: NewsService, channel) -> int:
                 )
                 db.add(news)
                 added += 1
+        if added:
+            mark_features_changed(db, channel.id)
     except Exception as e:
         print(f"  News error: {e}")
     return added
@@ -75,6 +80,7 @@ async def main():
     print(f"時刻: {datetime.now().isoformat()}")
     print("=" * 50)
 
+    init_db()
     db = SessionLocal()
     youtube = YouTubeService()
     news_service = NewsService()
@@ -108,12 +114,20 @@ async def main():
             if i % 10 == 0:
                 await asyncio.sleep(1)
 
+        # 入力が変わったチャンネルの特徴量を計算して保存
+        features_refreshed = refresh_stale_features(db)
         db.commit()
+        snapshot_version = publish_features(db)
+        db.commit()
+        similarity_index = publish_similarity_index(db)
 
         print("\n" + "=" * 50)
         print("収集完了")
         print(f"  YouTube統計: {youtube_success}/{len(channels)} チャンネル")
         print(f"  ニュース追加: {news_added} 件")
+        print(f"  特徴量更新: {features_refreshed} チャンネル")
+        print(f"  特徴量スナップショット: {snapshot_version}")
+        print(f"  類似チャンネルの索引: {len(similarity_index)} チャンネル")
         print("=" * 50)
 
     except Exception as e:
@@ -0,0 +1,40 @@
+"""
+統計データ集約スクリプト
+
+使い方:
+    cd backend
+    python scripts/compact_stats.py
+
+保持期間を過ぎた channel_stats を日次・週次・月次テーブルに集約し、
+集約済みの生データを削除します。保持期間は .env の STATS_*_RETENTION_DAYS で設定します。
+"""
+import sys
+from pathlib import Path
+
+# パスを追加
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from datetime import datetime
+from app.database import SessionLocal, init_db
+from app.services.compaction_service import compact_stats
+
+
+def compact():
+    """統計データを集約"""
+    init_db()
+    db = SessionLocal()
+
+    try:
+        print(f"集約開始: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        result = compact_stats(db)
+        print(f"  生データ → 日次: {result['raw']} 行")
+        print(f"  日次 → 週次: {result['daily']} 行")
+        print(f"  週次 → 月次: {result['weekly']} 行")
+        print(f"集約完了: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    compact()
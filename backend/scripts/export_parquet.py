@@ -0,0 +1,39 @@
+"""
+分析用 Parquet エクスポートスクリプト
+
+使い方:
+    cd backend
+    python scripts/export_parquet.py
+
+channel_stats / predictions / news / trend_data を日付パーティションの Parquet に書き出します。
+前回書き出した日の翌日から前日までの分を追記し、前回の後に変わった行・遅れて追加された行の日は書き直します。
+集約テーブルはスナップショットとして書き出します。出力先は .env の EXPORT_DIR です。
+"""
+import sys
+from pathlib import Path
+
+# パスを追加
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from datetime import datetime
+from app.config import settings
+from app.database import engine, init_db
+from app.services.export_service import export_all
+
+
+def export():
+    """Parquetに書き出し"""
+    init_db()
+
+    print(f"エクスポート開始: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print(f"出力先: {settings.EXPORT_DIR}")
+
+    result = export_all(engine)
+    for table, count in result.items():
+        print(f"  {table}: {count} パーティション書き出し")
+
+    print(f"エクスポート完了: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+
+
+if __name__ == "__main__":
+    export()
@@ -0,0 +1,79 @@
+"""
+特徴量スナップショットの公開・確認スクリプト
+
+使い方:
+    cd backend
+    python scripts/feature_snapshot.py               # 最新のスナップショットの列ごとの統計を表示
+    python scripts/feature_snapshot.py --publish     # 現在の特徴量を公開（データ収集の後にも自動で公開されます）
+    python scripts/feature_snapshot.py --list        # 公開済みのバージョン一覧
+    python scripts/feature_snapshot.py --version VERSION
+
+スナップショットは FEATURE_SNAPSHOT_DIR に保存され、FEATURE_SNAPSHOT_KEEP 個より古いものは削除されます。
+"""
+import sys
+import time
+from pathlib import Path
+
+# パスを追加
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.database import SessionLocal, init_db
+from app.services.feature_store import publish_features
+from ml.feature_snapshot import list_snapshots, load_snapshot
+
+
+def publish():
+    """現在の特徴量をスナップショットとして公開"""
+    init_db()
+    db = SessionLocal()
+    try:
+        started = time.perf_counter()
+        version = publish_features(db)
+        db.commit()
+        print(f"公開しました: {version} ({time.perf_counter() - started:.2f}秒)")
+    finally:
+        db.close()
+
+
+def show(version: str = None):
+    """スナップショットの列ごとの統計を表示"""
+    started = time.perf_counter()
+    snapshot = load_snapshot(version)
+    if snapshot is None:
+        print("スナップショットがありません")
+        return
+    opened = time.perf_counter() - started
+
+    print(f"バージョン: {snapshot.version}")
+    print(f"基準時刻: {snapshot.as_of:%Y-%m-%d %H:%M:%S}")
+    print(f"チャンネル数: {len(snapshot)}  特徴量: {len(snapshot.columns)}  読み込み: {opened * 1000:.1f}ms\n")
+
+    started = time.perf_counter()
+    stats = snapshot.column_stats()
+    print(f"  {'特徴量':<28} {'欠損率':>7} {'平均':>14} {'標準偏差':>14} {'最小':>14} {'最大':>14}")
+    for feature, row in stats.iterrows():
+        print(f"  {feature:<28} {row['missing_ratio']:>7.1%} {row['mean']:>14.4g} {row['std']:>14.4g} "
+              f"{row['min']:>14.4g} {row['max']:>14.4g}")
+    print(f"\n集計時間: {(time.perf_counter() - started) * 1000:.1f}ms")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--publish", action="store_true", help="現在の特徴量を公開")
+    parser.add_argument("--list", action="store_true", help="公開済みのバージョン一覧")
+    parser.add_argument("--version", default=None, help="表示するバージョン（省略時は最新）")
+    args = parser.parse_args()
+
+    if args.publish:
+        publish()
+    elif args.list:
+        versions = list_snapshots()
+        latest = load_snapshot()
+        for name in versions:
+            print(f"{name}{'  (最新)' if latest and name == latest.version else ''}")
+        if not versions:
+            print("スナップショットがありません")
+    else:
+        show(args.version)
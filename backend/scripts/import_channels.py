@@ -18,8 +18,9 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from datetime import datetime
-from app.database import SessionLocal
-from app.models import Channel, ChannelStats
+from app.database import SessionLocal, init_db
+from app.models import Channel
+from app.services.stats_service import record_stats
 from app.services.youtube_service import YouTubeService
 
 
@@ -37,6 +38,7 @@ async def resolve_handle_to_id(youtube: YouTubeService, handle: str) -> str:
 
 async def import_channels(csv_path: str = "data/channel_ids.csv", limit: int = None):
     """CSVからチャンネルを登録"""
+    init_db()
     db = SessionLocal()
     youtube = YouTubeService()
 
@@ -111,13 +113,13 @@ async def import_channels(csv_path: str = "data/channel_ids.csv", limit: int = N
                 db.refresh(channel)
 
                 # 初期統計を保存
-                stats = ChannelStats(
-                    channel_id=channel.id,
+                record_stats(
+                    db,
+                    channel.id,
                     subscriber_count=info["subscriber_count"],
                     view_count=info.get("view_count", 0),
                     video_count=info.get("video_count", 0),
                 )
-                db.add(stats)
                 db.commit()
 
                 print(f"登録完了 ({info['name'][:20]}...)")
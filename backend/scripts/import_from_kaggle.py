@@ -18,8 +18,9 @@ sys.path.insert(0, str(Path(__file__).parent.parent))
 import pandas as pd
 import kagglehub
 
-from app.database import SessionLocal
-from app.models import Channel, ChannelStats
+from app.database import SessionLocal, init_db
+from app.models import Channel
+from app.services.stats_service import record_stats
 from app.services.youtube_service import YouTubeService
 
 DATASET_PATH = "maliqr/vtuber-like-views-and-subscriber-data"
@@ -152,6 +153,7 @@ async def import_to_db(channels: dict, limit: int = None):
         channels: {channel_id: name} の辞書
         limit: 登録上限
     """
+    init_db()
     db = SessionLocal()
     youtube = YouTubeService()
 
@@ -206,13 +208,13 @@ async def import_to_db(channels: dict, limit: int = None):
                 db.refresh(channel)
 
                 # 初期統計を保存
-                stats = ChannelStats(
-                    channel_id=channel.id,
+                record_stats(
+                    db,
+                    channel.id,
                     subscriber_count=info["subscriber_count"],
                     view_count=info.get("view_count", 0),
                     video_count=info.get("video_count", 0),
                 )
-                db.add(stats)
                 db.commit()
 
                 print(f"OK ({info['subscriber_count']:,}人)")
@@ -0,0 +1,75 @@
+"""
+モデルのバージョン管理スクリプト
+
+使い方:
+    cd backend
+    python scripts/manage_models.py                      # 登録済みバージョンの一覧
+    python scripts/manage_models.py --promote VERSION    # チャンピオン（本番の予測）にする
+    python scripts/manage_models.py --challenger VERSION # チャレンジャー（影で予測）に加える
+    python scripts/manage_models.py --retire VERSION     # チャレンジャーから外す
+    python scripts/manage_models.py --horizon 30 ...     # 30日予測のモデルを対象にする（既定は180日）
+
+APIサーバー・スケジューラは registry.json の更新を検知して、次の予測から新しい組み合わせを使います。
+一覧の「特徴量」に * が付いたバージョンは特徴量の計算方法が今と違うため、予測にも昇格にも使えません。
+"""
+import sys
+from pathlib import Path
+
+# パスを追加
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from ml.model_registry import get_registry, horizon_registry_dir
+from ml.training_data import FEATURE_SCHEMA_VERSION, HORIZON_DAYS, LEGACY_FEATURE_SCHEMA_VERSION
+
+
+def list_models(horizon_days: int = HORIZON_DAYS):
+    """登録済みバージョンの一覧を表示"""
+    registry = get_registry(horizon_registry_dir(horizon_days))
+    print(f"予測期間: {horizon_days}日")
+    manifest = registry.read_manifest()
+    versions = registry.list_versions()
+
+    if not versions:
+        print(f"登録済みのモデルがありません: {registry.root}")
+        return
+
+    print(f"{'バージョン':<30} {'役割':<12} {'RMSE':>10} {'R2':>8} {'学習件数':>8} {'特徴量':>6}  データ")
+    for version in versions:
+        meta = registry.read_meta(version)
+        metrics = meta.get("metrics") or {}
+        if version == manifest.get("champion"):
+            role = "champion"
+        elif version in manifest.get("challengers", []):
+            role = "challenger"
+        else:
+            role = "-"
+        rmse = f"{metrics['rmse']:.4f}" if metrics.get("rmse") is not None else "-"
+        r2 = f"{metrics['r2']:.4f}" if metrics.get("r2") is not None else "-"
+        rows = metrics.get("train_rows", "-")
+        fingerprint = (meta.get("data_fingerprint") or "-")[:12]
+        # 特徴量の計算方法のバージョン（今と違うものは予測に使われない）
+        feature_version = meta.get("feature_version", LEGACY_FEATURE_SCHEMA_VERSION)
+        mark = "" if feature_version == FEATURE_SCHEMA_VERSION else "*"
+        print(f"{version:<30} {role:<12} {rmse:>10} {r2:>8} {rows:>8} {f'v{feature_version}{mark}':>6}  {fingerprint}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--promote", metavar="VERSION", help="チャンピオンにする")
+    group.add_argument("--challenger", metavar="VERSION", help="チャレンジャーに加える")
+    group.add_argument("--retire", metavar="VERSION", help="チャレンジャーから外す")
+    parser.add_argument("--horizon", type=int, default=HORIZON_DAYS, help="予測期間（日）")
+    args = parser.parse_args()
+
+    registry = get_registry(horizon_registry_dir(args.horizon))
+    if args.promote:
+        registry.promote(args.promote)
+    elif args.challenger:
+        registry.add_challenger(args.challenger)
+    elif args.retire:
+        registry.retire(args.retire)
+
+    list_models(args.horizon)
@@ -4,24 +4,43 @@
 使い方:
     cd backend
     python scripts/run_prediction.py
+    python scripts/run_prediction.py --engine duckdb  # 特徴量を DuckDB で計算
+    python scripts/run_prediction.py --engine snapshot  # 公開済みの特徴量スナップショットで予測
+    python scripts/run_prediction.py --full           # 変更のなかったチャンネルも予測
 
-DBに保存されたデータを使って、全チャンネルの成長予測を実行します。
+DBに保存されたデータを使って、前回の予測から入力が変わったチャンネル
+（モデルが入れ替わった場合は全チャンネル）の成長予測を実行します。
 """
 import sys
+import time
 from pathlib import Path
 
 # パスを追加
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
 from datetime import datetime
-from app.database import SessionLocal
-from app.models import Channel, Prediction
+from app.database import SessionLocal, init_db
+from app.models import Channel
 from ml.predictor import GrowthPredictor
-from ml.feature_extractor import FeatureExtractor
+from app.services.analytics_service import AnalyticsEngine
+from app.services.prediction_service import predict_channels
+from ml.feature_snapshot import load_snapshot
+from ml.training_data import FEATURE_SCHEMA_VERSION
 
 
-def run_predictions():
-    """全チャンネルの予測を実行"""
+def run_predictions(engine: str = "sql", full: bool = False):
+    """
+    予測を実行
+
+    前回の予測から入力（統計・ニュース・トレンド）が変わったチャンネルだけを予測する。
+    モデルが入れ替わった場合は全チャンネルを予測する。
+
+    Args:
+        engine: 特徴量の抽出方法（"sql" はサービング用DBで一括抽出、"duckdb" は DuckDB で一括抽出、
+                "snapshot" は最新の特徴量スナップショットを読む）
+        full: 変更の有無にかかわらず全チャンネルを予測する
+    """
+    init_db()
     db = SessionLocal()
 
     try:
@@ -37,50 +56,56 @@ def run_predictions():
         print(f"{'='*50}\n")
 
         predictor = GrowthPredictor()
-        extractor = FeatureExtractor(db)
 
+        # 特徴量の一括抽出・予測・保存
+        started = time.perf_counter()
+        features = None
+        if engine == "duckdb":
+            with AnalyticsEngine("sqlite") as analytics:
+                features = analytics.extract_features()
+        elif engine == "snapshot":
+            snapshot = load_snapshot()
+            if snapshot is None:
+                print("特徴量スナップショットがありません（データ収集または scripts/feature_snapshot.py --publish で作成）")
+                return
+            if snapshot.feature_version != FEATURE_SCHEMA_VERSION:
+                print(f"特徴量スナップショット {snapshot.version} は特徴量のバージョンが異なります"
+                      f"（{snapshot.feature_version} != {FEATURE_SCHEMA_VERSION}）。"
+                      "scripts/feature_snapshot.py --publish で作り直してください")
+                return
+            print(f"特徴量スナップショット: {snapshot.version}（基準時刻 {snapshot.as_of:%Y-%m-%d %H:%M}, {len(snapshot)}チャンネル）")
+            features = snapshot.frame()
+        by_horizon = predict_channels(db, predictor, features, only_dirty=not full)
+        elapsed = time.perf_counter() - started
+
+        # 既定の期間（180日）で並べ、他の期間も1行に表示
+        main_horizon = predictor.horizon_days if predictor.horizon_days in by_horizon else max(by_horizon)
+        predictions = by_horizon[main_horizon]
+        print(f"予測対象: {len(predictions)}/{len(channels)} チャンネル（{'全件' if full else '変更のあったチャンネル'}）")
+        print(f"予測期間: {', '.join(f'{h}日' for h in by_horizon)}\n")
+
+        names = {channel.id: channel.name for channel in channels}
         results = []
 
-        for i, channel in enumerate(channels, 1):
-            print(f"[{i}/{len(channels)}] {channel.name}")
-
-            # 特徴量を抽出
-            features = extractor.extract_features(channel.id)
-
-            # 予測実行
-            result = predictor.predict(features)
-
-            # 予測結果を保存
-            prediction = Prediction(
-                channel_id=channel.id,
-                predicted_growth_rate=result["predicted_growth_rate"],
-                confidence_score=result["confidence_score"],
-                feature_subscriber_growth_rate=features.get("subscriber_growth_rate_30d"),
-                feature_view_growth_rate=features.get("view_growth_rate_30d"),
-                feature_upload_frequency=features.get("upload_frequency"),
-                feature_engagement_rate=features.get("engagement_rate"),
-                feature_trend_score=features.get("trend_score"),
-                feature_news_count=features.get("news_count"),
-                feature_news_sentiment=features.get("news_positive_ratio"),
+        for i, (channel_id, row) in enumerate(predictions.iterrows(), 1):
+            name = names.get(channel_id, str(channel_id))
+            growth = row["predicted_growth_rate"]
+            confidence = row["confidence_score"]
+            outlook = "  ".join(
+                f"{h}日 {result.at[channel_id, 'predicted_growth_rate']:+.1f}%" for h, result in by_horizon.items()
             )
-            db.add(prediction)
-
-            growth = result["predicted_growth_rate"]
-            confidence = result["confidence_score"]
-            sign = "+" if growth >= 0 else ""
-            print(f"    予測成長率: {sign}{growth:.1f}% (信頼度: {confidence*100:.0f}%)")
+            print(f"[{i}/{len(predictions)}] {name}")
+            print(f"    予測成長率: {outlook} (信頼度: {confidence*100:.0f}%)")
 
             results.append({
-                "name": channel.name,
+                "name": name,
                 "growth": growth,
                 "confidence": confidence
             })
 
-        db.commit()
-
         # ランキング表示
         print(f"\n{'='*50}")
-        print("成長予測ランキング")
+        print(f"成長予測ランキング（{main_horizon}日）")
         print(f"{'='*50}")
 
         results.sort(key=lambda x: x["growth"], reverse=True)
@@ -88,11 +113,22 @@ def run_predictions():
             sign = "+" if r["growth"] >= 0 else ""
             print(f"{i:2}. {r['name'][:20]:<20} {sign}{r['growth']:>6.1f}%")
 
-        print(f"\n予測完了: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        print(f"\n特徴量抽出・予測・保存時間: {elapsed:.2f}秒 (engine={engine})")
+        print(f"予測完了: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
 
     finally:
         db.close()
 
 
 if __name__ == "__main__":
-    run_predictions()
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--engine", choices=["sql", "duckdb", "snapshot"], default="sql",
+                        help="特徴量の抽出方法（duckdb はサービング用DBを DuckDB から読み取り専用で参照、"
+                             "snapshot は最新の特徴量スナップショット）")
+    parser.add_argument("--full", action="store_true",
+                        help="変更のなかったチャンネルも含めて全チャンネルを予測")
+    args = parser.parse_args()
+
+    run_predictions(args.engine, args.full)
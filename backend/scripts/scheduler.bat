@@ -0,0 +1,8 @@
+@echo off
+chcp 65001 > nul
+REM Resident scheduler (collect / predict / train)
+
+cd /d %~dp0..
+call .venv\Scripts\activate.bat
+if not exist logs mkdir logs
+python scripts/scheduler.py >> logs/scheduler.log 2>&1
@@ -0,0 +1,79 @@
+"""
+常駐スケジューラ
+
+使い方:
+    cd backend
+    python scripts/scheduler.py              # 常駐して JOBS の予定どおりに実行
+    python scripts/scheduler.py --list       # ジョブ表と次回実行時刻を表示
+    python scripts/scheduler.py --run predict  # 指定ジョブを今すぐ1回実行
+
+収集・予測・学習を同じプロセス内で実行するため、
+インタプリタやライブラリの起動コストは最初の1回だけで済みます。
+daily_collect.bat とタスクスケジューラの組み合わせを置き換えるものです。
+"""
+import sys
+import asyncio
+import argparse
+from pathlib import Path
+from datetime import datetime
+
+sys.path.insert(0, str(Path(__file__).parent.parent))
+
+from app.config import settings
+from app.services.scheduler_service import Scheduler, ScheduledJob, InstanceLock
+from collect_data import main as collect_data
+from run_prediction import run_predictions
+from train_model import train, train_incremental
+from compact_stats import compact
+from export_parquet import export
+
+
+# ジョブ表（分 時 日 月 曜日）
+# 起動時の実行漏れはこの順に1つずつ実行するため、依存の順（収集 → 集約・エクスポート → 予測 → 学習）に並べる
+JOBS = [
+    ScheduledJob("collect", "0 3 * * *", collect_data, jitter_seconds=30 * 60),
+    ScheduledJob("compact", "30 4 * * 0", compact, jitter_seconds=30 * 60),
+    ScheduledJob("export", "0 5 * * *", export, jitter_seconds=10 * 60),
+    ScheduledJob("predict", "0 6 * * *", run_predictions, jitter_seconds=10 * 60),
+    ScheduledJob("train", "0 4 1 * *", train, jitter_seconds=30 * 60),
+    ScheduledJob("refresh", "0 4 2-31 * *", train_incremental, jitter_seconds=30 * 60),
+]
+
+
+def list_jobs(scheduler: Scheduler):
+    now = datetime.now()
+    print(f"{'ジョブ':<10} {'cron':<15} {'ジッター':>8}  {'前回実行':<19}  次回実行")
+    for job in scheduler.jobs:
+        last = scheduler.last_run(job)
+        last_str = last.strftime("%Y-%m-%d %H:%M:%S") if last else "-"
+        next_str = job.cron.next_after(now).strftime("%Y-%m-%d %H:%M")
+        print(f"{job.name:<10} {job.cron.expression:<15} {job.jitter_seconds:>7}s  {last_str:<19}  {next_str}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--list", action="store_true", help="ジョブ表を表示して終了")
+    parser.add_argument("--run", metavar="JOB", help="指定ジョブを今すぐ1回実行して終了")
+    args = parser.parse_args()
+
+    scheduler = Scheduler(JOBS, settings.SCHEDULER_STATE_PATH)
+
+    if args.list:
+        list_jobs(scheduler)
+        return
+
+    with InstanceLock(settings.SCHEDULER_LOCK_PATH):
+        if args.run:
+            asyncio.run(scheduler.run_job(scheduler.find_job(args.run)))
+            return
+
+        print(f"スケジューラ起動: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+        list_jobs(scheduler)
+        try:
+            asyncio.run(scheduler.run_forever())
+        except KeyboardInterrupt:
+            print("スケジューラ停止")
+
+
+if __name__ == "__main__":
+    main()
@@ -4,101 +4,161 @@
 使い方:
     cd backend
     python scripts/train_model.py
+    python scripts/train_model.py --source parquet  # Parquet エクスポートを DuckDB で集計
+    python scripts/train_model.py --engine duckdb   # サービング用DBを DuckDB で集計
+    python scripts/train_model.py --champion        # 学習したモデルをすぐに本番で使う
+    python scripts/train_model.py --cv              # 時系列CVでパラメータを探索（全コアを使用）
+    python scripts/train_model.py --cv --jobs 4 --folds 3 --max-configs 12
+    python scripts/train_model.py --incremental     # チャンピオンの系統の最新版から継続学習（新しい時点の行だけ）
+    python scripts/train_model.py --horizons 30,90  # 指定した予測期間のモデルだけを学習
+
+予測期間（既定は settings.PREDICTION_HORIZONS）ごとに別のモデルを学習します。
+特徴量は全期間で共有し、1回だけ計算します。
+
+学習したモデルは既定ではチャレンジャーとして登録され、予測のたびにチャンピオンと並べて
+shadow_predictions に予測を残します。入れ替えは scripts/manage_models.py で行います。
 
 ※ 十分なデータ（最低6ヶ月分の履歴）が溜まってから実行してください。
 """
 import sys
+import time
 from pathlib import Path
 
 # パスを追加
 sys.path.insert(0, str(Path(__file__).parent.parent))
 
-from datetime import datetime, timedelta
-import pandas as pd
-from app.database import SessionLocal
-from app.models import Channel, ChannelStats
+from datetime import datetime
+from app.config import settings
+from app.database import SessionLocal, init_db
+from app.services.analytics_service import AnalyticsEngine
 from ml.predictor import GrowthPredictor
+from app.services.feature_store import feature_snapshots
 from ml.feature_extractor import FeatureExtractor
+from ml.model_selection import N_FOLDS, PARAM_GRID
+from ml.training_data import INCREMENTAL_STEP_DAYS, build_multi_horizon_dataset, label_column, multi_horizon_anchors
 
 
-def prepare_training_data():
+def prepare_training_data(source: str = "db", engine: str = "sql", now: datetime = None,
+                          since: datetime = None, horizons: list = None):
     """
     学習データを準備
 
-    6ヶ月前のデータから特徴量を抽出し、
-    現在のデータと比較して実際の成長率を計算
-    """
-    db = SessionLocal()
-
-    try:
-        channels = db.query(Channel).all()
+    過去の複数の基準時刻について、その時点までのデータで特徴量を計算し、
+    その後の予測期間ごとの実際の成長率を正解ラベル（label_column(期間) の列）にする。
 
-        if not channels:
-            print("チャンネルがありません")
+    Args:
+        source: データの読み込み元（"db" または Parquetエクスポートを読む "parquet"）
+        engine: source="db" のときの集計方法（"sql" はサービング用DB、"duckdb" は DuckDB から読み取り専用で参照）
+        now: 現在時刻（省略時は現在時刻）
+        since: 指定するとこの時刻より新しい基準時刻だけを INCREMENTAL_STEP_DAYS 日おきに使う（継続学習用）
+        horizons: 予測期間（日、省略時は settings.PREDICTION_HORIZONS）
+    """
+    now = now or datetime.utcnow()
+    horizons = sorted(horizons or settings.PREDICTION_HORIZONS)
+    if since is None:
+        anchors = multi_horizon_anchors(now, horizons)
+    else:
+        anchors = multi_horizon_anchors(now, horizons, step_days=INCREMENTAL_STEP_DAYS)
+        anchors = [anchor for anchor in anchors if anchor > since]
+        if not anchors:
+            print(f"{since} より新しい基準時刻がありません")
             return None
 
-        training_data = []
-        six_months_ago = datetime.utcnow() - timedelta(days=180)
-
-        for channel in channels:
-            # 6ヶ月前のデータを取得
-            old_stats = db.query(ChannelStats).filter(
-                ChannelStats.channel_id == channel.id,
-                ChannelStats.recorded_at <= six_months_ago
-            ).order_by(ChannelStats.recorded_at.desc()).first()
-
-            # 現在のデータを取得
-            current_stats = db.query(ChannelStats).filter(
-                ChannelStats.channel_id == channel.id
-            ).order_by(ChannelStats.recorded_at.desc()).first()
-
-            if not old_stats or not current_stats:
-                continue
-
-            # 実際の成長率を計算
-            if old_stats.subscriber_count > 0:
-                actual_growth = (
-                    (current_stats.subscriber_count - old_stats.subscriber_count)
-                    / old_stats.subscriber_count
-                ) * 100
-            else:
-                continue
-
-            # 6ヶ月前時点での特徴量を抽出（ここは簡略化）
-            # 本来は6ヶ月前の時点でのFeatureExtractorを使うべきだが、
-            # 履歴データの構造上、現在の特徴量を使う
+    if source == "parquet" or engine == "duckdb":
+        with AnalyticsEngine("parquet" if source == "parquet" else "sqlite") as analytics:
+            df = build_multi_horizon_dataset(analytics.extract_features_snapshots, analytics.stats_at_frame,
+                                             anchors, horizons, now)
+    else:
+        init_db()
+        db = SessionLocal()
+        try:
+            # 特徴量は channel_features の保存済みの行を使い、ない分だけ計算して保存する
             extractor = FeatureExtractor(db)
-            features = extractor.extract_features(channel.id)
-            features["actual_growth_rate"] = actual_growth
-            features["channel_name"] = channel.name
+            df = build_multi_horizon_dataset(lambda at: feature_snapshots(db, at), extractor.stats_at_frame,
+                                             anchors, horizons, now)
+            db.commit()
+        finally:
+            db.close()
 
-            training_data.append(features)
+    if df.empty:
+        print("十分な履歴データがありません")
+        print(f"最低{horizons[0] // 30}ヶ月間データを収集してから再実行してください")
+        return None
 
-        if not training_data:
-            print("十分な履歴データがありません")
-            print("最低6ヶ月間データを収集してから再実行してください")
-            return None
+    print(f"スナップショット: {df['as_of'].nunique()}時点 / {df['channel_id'].nunique()}チャンネル")
+    for h in horizons:
+        labeled = df[df[label_column(h)].notna()]
+        print(f"  {h}日: {len(labeled)}件 ({labeled['as_of'].nunique()}時点)")
+    return df
+
+
+def print_cv_report(metrics: dict):
+    """時系列CVの結果を表示"""
+    print("\nフォールドごとの結果（最良の設定）:")
+    print(f"  {'検証時点':<20} {'学習件数':>8} {'検証件数':>8} {'RMSE':>10} {'R2':>8} {'ラウンド':>8}")
+    for fold in metrics["cv_folds"]:
+        r2 = f"{fold['r2']:.4f}" if fold["r2"] is not None else "-"
+        print(f"  {fold['as_of'][:19]:<20} {fold['train_rows']:>8} {fold['val_rows']:>8} "
+              f"{fold['rmse']:>10.4f} {r2:>8} {fold['best_iteration']:>8}")
 
-        return pd.DataFrame(training_data)
+    print("\n上位の設定:")
+    for config in metrics["configs"][:5]:
+        searched = {k: config["params"][k] for k in PARAM_GRID}
+        print(f"  RMSE {config['rmse']:.4f}  ラウンド {config['best_iteration']:>4}  {searched}")
 
-    finally:
-        db.close()
 
+def print_drift(metrics: dict):
+    """比較元モデルとの検証指標の差を表示"""
+    if metrics.get("baseline_version") is None:
+        return
+    sign = "+" if metrics["rmse_drift"] >= 0 else ""
+    print(f"比較元: {metrics['baseline_version']} "
+          f"(同じ検証データでのRMSE {metrics['baseline_rmse']:.4f} → 差 {sign}{metrics['rmse_drift']:.4f})")
+    if metrics.get("baseline_recorded_rmse") is not None:
+        print(f"比較元の登録時のRMSE: {metrics['baseline_recorded_rmse']:.4f}")
+
+
+def train(source: str = "db", engine: str = "sql", role: str = "challenger",
+          cv: bool = False, n_jobs: int = None, n_folds: int = N_FOLDS,
+          gap_days: int = None, max_configs: int = None, horizons: list = None):
+    """
+    予測期間ごとにモデルを学習して登録
 
-def train():
-    """モデルを学習"""
+    Args:
+        role: 学習したモデルの扱い（"challenger" は影で予測して比較、"champion" はすぐに本番で使う）
+        cv: 時系列CVでパラメータを探索する（False の場合は固定パラメータ・最新の基準時刻で検証）
+        n_jobs: cv=True のときに並列に評価するプロセス数（省略時はCPUコア数）
+        n_folds: cv=True のときのフォールド数
+        gap_days: cv=True のときの学習時点と検証時点の最小間隔（日、省略時は予測期間）
+        max_configs: cv=True のときに評価するパラメータの組み合わせの上限
+        horizons: 予測期間（日、省略時は settings.PREDICTION_HORIZONS）
+    """
+    horizons = sorted(horizons or settings.PREDICTION_HORIZONS)
     print(f"\n{'='*50}")
     print(f"モデル学習開始: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    print(f"予測期間: {', '.join(f'{h}日' for h in horizons)}")
     print(f"{'='*50}\n")
 
-    # 学習データを準備
+    # 学習データを準備（特徴量は全期間で共有）
     print("学習データを準備中...")
-    df = prepare_training_data()
+    started = time.perf_counter()
+    df = prepare_training_data(source, engine, horizons=horizons)
+    print(f"学習データ準備時間: {time.perf_counter() - started:.2f}秒 (engine={engine})")
+
+    for h in horizons:
+        labeled = df[df[label_column(h)].notna()] if df is not None else None
+        train_horizon(labeled, h, role, cv, n_jobs, n_folds, gap_days, max_configs)
 
+
+def train_horizon(df, horizon_days: int, role: str = "challenger", cv: bool = False,
+                  n_jobs: int = None, n_folds: int = N_FOLDS, gap_days: int = None,
+                  max_configs: int = None):
+    """1つの予測期間のモデルを学習して登録（df はその期間の正解がある行）"""
+    print(f"\n--- 予測期間 {horizon_days}日 ---")
     if df is None or len(df) < 10:
         print(f"\nエラー: 学習に必要なデータが不足しています")
         print(f"現在のデータ数: {len(df) if df is not None else 0}")
-        print(f"必要なデータ数: 最低10チャンネル分の6ヶ月履歴")
+        print(f"必要なデータ数: 最低10件（チャンネル×時点）")
         return
 
     print(f"学習データ数: {len(df)}")
@@ -106,25 +166,149 @@ def train():
 
     # モデルを学習
     print("\nモデルを学習中...")
-    predictor = GrowthPredictor()
-    metrics = predictor.train(df)
+    predictor = GrowthPredictor(horizon_days=horizon_days)
+    target = label_column(horizon_days)
+    if cv:
+        started = time.perf_counter()
+        try:
+            metrics = predictor.train_cv(df, target_column=target, role=role, n_folds=n_folds,
+                                         gap_days=gap_days, n_jobs=n_jobs, max_configs=max_configs)
+        except ValueError as e:
+            print(f"\nエラー: {e}")
+            print("--gap-days を小さくするか、履歴が溜まってから再実行してください")
+            return
+        print(f"探索時間: {time.perf_counter() - started:.2f}秒")
+        print_cv_report(metrics)
+    else:
+        try:
+            metrics = predictor.train(df, target_column=target, role=role)
+        except ValueError as e:
+            print(f"\nエラー: {e}")
+            print("履歴が溜まってから再実行してください")
+            return
 
     print(f"\n{'='*50}")
-    print("学習完了!")
-    print(f"RMSE: {metrics['rmse']:.4f}")
-    print(f"R2 Score: {metrics['r2']:.4f}")
+    print(f"学習完了!（予測期間 {horizon_days}日）")
+    print(f"バージョン: {metrics['version']} ({metrics['role']})")
+    label = "（時系列CVの平均）" if cv else ""
+    print(f"RMSE{label}: {metrics['rmse']:.4f}")
+    if metrics["r2"] is not None:
+        print(f"R2 Score{label}: {metrics['r2']:.4f}")
+    print_drift(metrics)
     print(f"{'='*50}")
 
     # 特徴量の重要度を表示
     print("\n特徴量の重要度:")
-    importance = predictor.get_feature_importance()
+    importance = predictor.get_feature_importance(metrics["version"])
     sorted_importance = sorted(importance.items(), key=lambda x: x[1], reverse=True)
     for name, score in sorted_importance:
         bar = "=" * int(score / max(importance.values()) * 30)
         print(f"  {name:<30} {bar} ({score:.0f})")
 
-    print(f"\nモデルを保存しました: ml/model.pkl")
+    print(f"\nモデルを保存しました: {predictor.registry.root}/{metrics['version']}")
+
+
+def train_incremental(source: str = "db", engine: str = "sql", role: str = "auto",
+                      horizons: list = None):
+    """
+    予測期間ごとにチャンピオンの系統の最新版から継続学習して登録
+
+    元のモデルはチャンピオンから継続学習でたどれる最新のバージョン（昇格しなかったものを含む）で、
+    その学習データより新しい基準時刻の行だけで木を追加する。
+    role="auto"（既定）は同じ検証データでチャンピオンよりRMSEが悪くなければチャンピオンにし、悪ければ保存だけする。
+    元のモデルが継続学習に使えない期間（未登録・期間の記録なし・継続学習を重ねすぎ）は全データで学習する
+    （role="auto" の場合はチャレンジャーとして登録）。
+    学習データは継続学習する全期間でまとめて1回だけ準備する。
+    """
+    horizons = sorted(horizons or settings.PREDICTION_HORIZONS)
+    bases = {}
+    full = []
+    for h in horizons:
+        predictor = GrowthPredictor(horizon_days=h)
+        champion = predictor.registry.champion()
+        base = predictor.registry.load(predictor.registry.latest_descendant(champion.version)) if champion else None
+        base_metrics = (base.meta.get("metrics") or {}) if base else {}
+        since = base_metrics.get("data_as_of_max")
+        depth = base_metrics.get("incremental_depth", 0)
+        if since is None or depth >= GrowthPredictor.MAX_INCREMENTAL_DEPTH:
+            reason = "継続学習を重ねた回数が上限に達した" if since is not None else "継続学習の元になるモデルがない"
+            print(f"{h}日: {reason}ため、全データで学習します")
+            full.append(h)
+        else:
+            bases[h] = (predictor, base, since, depth)
+
+    if full:
+        train(source, engine, "challenger" if role == "auto" else role, horizons=full)
+    if not bases:
+        return
+
+    print(f"\n{'='*50}")
+    print(f"継続学習開始: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
+    for h, (_, base, since, depth) in bases.items():
+        print(f"{h}日: 元のモデル {base.version}（継続学習済み {depth} 回, 学習データ〜{since[:19]}）")
+    print(f"{'='*50}\n")
+
+    started = time.perf_counter()
+    oldest = min(datetime.fromisoformat(since) for _, _, since, _ in bases.values())
+    df = prepare_training_data(source, engine, since=oldest, horizons=list(bases))
+    if df is None:
+        return
+    print(f"学習データ準備時間: {time.perf_counter() - started:.2f}秒 (engine={engine})")
+
+    for h, (predictor, base, _, _) in bases.items():
+        print(f"\n--- 予測期間 {h}日 ---")
+        target = label_column(h)
+        try:
+            started = time.perf_counter()
+            metrics = predictor.train_incremental(df[df[target].notna()], target_column=target,
+                                                  role=role, base_version=base.version)
+        except ValueError as e:
+            print(f"\nエラー: {e}")
+            continue
+        print(f"学習時間: {time.perf_counter() - started:.2f}秒")
+
+        print(f"\n{'='*50}")
+        print(f"継続学習完了!（予測期間 {h}日）")
+        print(f"バージョン: {metrics['version']} ({metrics['role']})")
+        if role == "auto" and metrics["role"] == "none":
+            print("チャンピオンよりRMSEが悪いため昇格せず、次の継続学習の元としてだけ保存しました")
+        print(f"学習データ数: {metrics['train_rows']}（追加した木: {metrics['added_iterations']}）")
+        print(f"RMSE: {metrics['rmse']:.4f}")
+        print(f"R2 Score: {metrics['r2']:.4f}")
+        print_drift(metrics)
+        print(f"{'='*50}")
 
 
 if __name__ == "__main__":
-    train()
+    import argparse
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--source", choices=["db", "parquet"], default="db",
+                        help="データの読み込み元（parquet は scripts/export_parquet.py の出力を読む）")
+    parser.add_argument("--engine", choices=["sql", "duckdb"], default="sql",
+                        help="学習データの作成方法（duckdb はサービング用DBを DuckDB から読み取り専用で参照）")
+    parser.add_argument("--champion", action="store_true",
+                        help="学習したモデルをチャレンジャーではなくチャンピオンとして登録")
+    parser.add_argument("--cv", action="store_true",
+                        help="時系列CVでパラメータを探索して学習")
+    parser.add_argument("--jobs", type=int, default=None,
+                        help="--cv のときの並列プロセス数（既定はCPUコア数）")
+    parser.add_argument("--folds", type=int, default=N_FOLDS,
+                        help="--cv のときのフォールド数")
+    parser.add_argument("--gap-days", type=int, default=None,
+                        help="--cv のときの学習時点と検証時点の最小間隔（日、既定は予測期間）")
+    parser.add_argument("--max-configs", type=int, default=None,
+                        help="--cv のときに評価するパラメータの組み合わせの上限")
+    parser.add_argument("--incremental", action="store_true",
+                        help="チャンピオンの系統の最新版から継続学習（新しい基準時刻の行だけを使う。"
+                             "RMSEが悪くならなければチャンピオンにする）")
+    parser.add_argument("--horizons", type=lambda v: [int(h) for h in v.split(",")], default=None,
+                        help="学習する予測期間（日、カンマ区切り。既定は PREDICTION_HORIZONS）")
+    args = parser.parse_args()
+
+    role = "champion" if args.champion else "challenger"
+    if args.incremental:
+        train_incremental(args.source, args.engine, "champion" if args.champion else "auto", args.horizons)
+    else:
+        train(args.source, args.engine, role, args.cv, args.jobs, args.folds, args.gap_days, args.max_configs,
+              args.horizons)
@@ -7,6 +7,9 @@ cd /d %~dp0..
 REM バックエンド起動
 start "Backend API" cmd /k "cd backend && .venv\Scripts\activate.bat && uvicorn app.main:app --host 0.0.0.0 --port 8000"
 
+REM スケジューラ起動（データ収集・予測・学習）
+start "Scheduler" cmd /k "cd backend && scripts\scheduler.bat"
+
 REM 少し待機
 timeout /t 5 /nobreak
 
@@ -7,6 +7,9 @@ cd /d %~dp0..
 REM Start Backend
 start "Backend API" cmd /k "cd backend && .venv\Scripts\activate.bat && uvicorn app.main:app --host 0.0.0.0 --port 8000"
 
+REM Start Scheduler (collect / predict / train)
+start "Scheduler" cmd /k "cd backend && scripts\scheduler.bat"
+
 REM Wait 5 seconds
 timeout /t 5 /nobreak
 
@@ -21,3 +24,4 @@ echo All services started:
 echo   Backend:  http://localhost:8000
 echo   Public:   http://localhost:3000
 echo   Admin:    http://localhost:3001
+echo   Scheduler: backend/logs/scheduler.log